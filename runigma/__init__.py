@@ -10,4 +10,13 @@ For a list of the rotors and reflectors we simulate, see the module rotors.data.
 """
 __version__ = '2019.03'
 
-from .machine import RuNigmaMachine, RuNigmaError
+__all__ = ['RuNigmaMachine', 'RuNigmaError']
+
+
+def __getattr__(name):
+    # the machine is imported on first use, so that importing the package for
+    # its version or for a single submodule stays cheap
+    if name in __all__:
+        from . import machine
+        return getattr(machine, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,108 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains the Alphabet class, the characters of the keyboard,
+the lamps, the plugs and the rotor rings of a machine.
+
+Inside the machine a character is a wire number, its index in the alphabet.
+An Alphabet precomputes the conversions between the two, so that every
+component converts with a dictionary lookup or str.translate instead of
+searching the characters.
+
+RUNIGMA is the 70 letter alphabet of the RuNigma Machine and the default of
+every component; CLASSIC is the 26 letter alphabet of the Enigma Machine.
+
+"""
+
+import re
+
+
+class AlphabetError(Exception):
+    pass
+
+
+# wire numbers are handled as bytes by the engines, so an alphabet has at
+# most 256 characters
+MAX_SIZE = 256
+
+
+class Alphabet:
+    """An ordered set of characters.
+
+    chars - the characters as a string, in wire number order
+
+    size - the number of characters
+
+    index - a dictionary of the wire number of each character
+
+    to_wire, from_wire - str.translate tables from the characters to the
+    characters with code points 0 to size - 1, which encode to the wire
+    numbers as latin-1 bytes, and back
+
+    invalid - a compiled regular expression matching a character not in the
+    alphabet
+
+    """
+
+    __slots__ = ('chars', 'size', 'index', 'to_wire', 'from_wire', 'invalid')
+
+    def __init__(self, chars):
+        if not isinstance(chars, str) or not 2 <= len(chars) <= MAX_SIZE:
+            raise AlphabetError("an alphabet must have 2 to %d characters" % MAX_SIZE)
+        if len(set(chars)) != len(chars):
+            raise AlphabetError("duplicate characters in alphabet: %s" % chars)
+
+        self.chars = chars
+        self.size = len(chars)
+        self.index = {c: n for n, c in enumerate(chars)}
+        self.to_wire = {ord(c): n for n, c in enumerate(chars)}
+        self.from_wire = dict(enumerate(chars))
+        self.invalid = re.compile('[^%s]' % re.escape(chars))
+
+    def __reduce__(self):
+        return (Alphabet, (self.chars,))
+
+    def __repr__(self):
+        return 'Alphabet(%r)' % self.chars
+
+    def __eq__(self, other):
+        return isinstance(other, Alphabet) and self.chars == other.chars
+
+    def __hash__(self):
+        return hash(self.chars)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.chars)
+
+    def __contains__(self, c):
+        return c in self.index
+
+    def __getitem__(self, n):
+        return self.chars[n]
+
+    def encode(self, text):
+        """Return the wire numbers of the characters in text as bytes.
+
+        Raises AlphabetError if text has a character not in the alphabet.
+
+        """
+        match = self.invalid.search(text)
+        if match:
+            raise AlphabetError("character not in alphabet: %s" % match.group())
+        return text.translate(self.to_wire).encode('latin-1')
+
+    def decode(self, wires):
+        """Return the characters for a bytes-like object of wire numbers as a
+        string.
+
+        """
+        return bytes(wires).decode('latin-1').translate(self.from_wire)
+
+
+RUNIGMA = Alphabet('abcdefghijklmnopqrstuvwxyzАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ0123456789_')
+
+CLASSIC = Alphabet('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
@@ -0,0 +1,8 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""The analysis package contains tools to study RuNigma Machine
+configurations.
+
+"""
@@ -0,0 +1,481 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains a bombe: it recovers the rotor positions and part of
+the plugboard of a message from a crib, a piece of known plaintext at the
+start of the message.
+
+Each crib letter p[i] and its ciphertext letter c[i] form a link of the
+menu: with the plugboard P and the permutation S[i] of the rotors and the
+reflector at key press i, P(c[i]) = S[i](P(p[i])). Starting from a guess of
+P for the most connected letter of the menu, the links give the plugboard
+connection of every other letter of the menu; a guess that leads to a letter
+connected to two different letters is rejected. A rotor position is a stop
+if any guess survives all links. The RuNigma reflector adds plaintext pins:
+when P(p[i]) enters a plaintext pin, c[i] equals p[i], so such a link is
+only possible if the crib and ciphertext letters are the same.
+
+Encryption only depends on the internal rotor positions (display minus ring
+setting), so the bombe sweeps those and the ring settings stay unknown. As on
+the historical bombe, the three left rotors are assumed not to move during
+the crib. The fourth rotor is pushed along by the notches of the right-most
+rotor, which RuNigma rotors have several of, so that it usually steps during
+a crib of twenty letters or more. Where that happens depends on the unknown
+ring setting of the right-most rotor, so the bombe tries every pattern of
+steps its notches allow, see step_patterns; with turnover=False it assumes
+the fourth rotor does not step, which is much faster. Short cribs with many
+loops give the fewest false stops.
+
+For one rotor order and reflector, the left three positions are swept one
+at a time. For each, the permutation of the four left rotors and the
+reflector is tabulated for all 70 positions of the fourth rotor, and all
+guesses for the positions of the two right rotors are tested together as
+rows of arrays; rejected rows are dropped after every link. search runs the
+sweep over many rotor orders and reflectors in worker processes and stops
+early once enough stops are found.
+
+NumPy is required.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import collections
+import itertools
+import os
+
+try:
+    import numpy
+except ImportError:     # pragma: no cover
+    numpy = None
+
+from ..machine import RuNigmaError, KEYBOARD_CHARS, KEYBOARD_CHARS_LEN, KEYBOARD_INDEX
+from ..plugboard import Plugboard, MAX_PAIRS
+from ..rotors.data import ROTORS, REFLECTORS
+from ..rotors.factory import create_rotor, create_reflector
+from ..stepping import drive_times
+
+# the number of left rotor positions given to a worker at a time
+CHUNK_SIZE = 10
+
+
+class Menu:
+    """The links between the letters of a crib and its ciphertext.
+
+    links - the (plaintext wire, ciphertext wire, crib index) triples of the
+    links connected to the centre, in the order they are tested: the first
+    letter of every link is the centre or a letter reached by an earlier
+    link
+
+    centre - the wire of the letter the bombe guesses the plugboard for
+
+    length - the length of the crib
+
+    all_links - the links of every crib letter, in crib order
+
+    letters - the set of wires reached from the centre
+
+    loops - the number of links that close a loop; each one rejects most
+    wrong guesses
+
+    """
+
+    def __init__(self, crib, ciphertext):
+        """crib - the known plaintext at the start of the message
+
+        ciphertext - the ciphertext, at least as long as the crib
+
+        """
+        if not crib or len(ciphertext) < len(crib):
+            raise RuNigmaError("the ciphertext must be at least as long as the crib")
+
+        keys = [KEYBOARD_INDEX.get(c) for c in crib + ciphertext[:len(crib)]]
+        if None in keys:
+            raise RuNigmaError("crib or ciphertext contains characters not on the keyboard")
+
+        self.length = len(crib)
+        self.all_links = links = list(zip(keys[:len(crib)], keys[len(crib):],
+                                          range(len(crib))))
+        degree = collections.Counter(k for a, b, _ in links for k in (a, b))
+        self.centre = degree.most_common(1)[0][0]
+
+        # order the links so that each one starts from a known letter, and
+        # test loops as soon as they close
+        self.letters = {self.centre}
+        self.links = []
+        self.loops = 0
+        pending = links
+        while True:
+            usable = [link for link in pending
+                      if link[0] in self.letters or link[1] in self.letters]
+            if not usable:
+                break
+            closed = [link for link in usable
+                      if link[0] in self.letters and link[1] in self.letters]
+            a, b, i = closed[0] if closed else usable[0]
+            if a not in self.letters:
+                a, b = b, a
+            if b in self.letters:
+                self.loops += 1
+            self.letters.add(b)
+            self.links.append((a, b, i))
+            pending = [link for link in pending if link[2] != i]
+
+    def __str__(self):
+        return ' '.join('%s%s%d' % (KEYBOARD_CHARS[a], KEYBOARD_CHARS[b], i)
+                        for a, b, i in self.links)
+
+
+class Stop:
+    """A rotor setting consistent with the crib.
+
+    rotors - the rotor names from left to right
+
+    reflector - the reflector name
+
+    positions - the internal rotor positions, from left to right, before the
+    first key press of the message
+
+    turnover - None, or a tuple of the crib indices of the key presses at
+    which the fourth rotor steps
+
+    steckers - a dictionary mapping the wire of each letter whose plugboard
+    connection follows from the menu to the wire it is connected to
+
+    """
+
+    def __init__(self, rotors, reflector, positions, turnover, steckers):
+        self.rotors = rotors
+        self.reflector = reflector
+        self.positions = positions
+        self.turnover = turnover
+        self.steckers = steckers
+
+    def plugboard(self):
+        """Return the plugboard connections found as a Plugboard."""
+        return Plugboard(sorted({tuple(sorted(pair)) for pair in self.steckers.items()
+                                 if pair[0] != pair[1]}))
+
+    def display(self):
+        """Return the display that gives the positions with all ring settings
+        at a; the ring settings themselves are not found by the bombe.
+
+        """
+        return ''.join(KEYBOARD_CHARS[p] for p in self.positions)
+
+    def __str__(self):
+        return '%s  %s  %s  %s%s' % (
+            ' '.join(self.rotors), self.reflector, self.display(),
+            self.plugboard().army_str(),
+            '' if self.turnover is None else
+            '  turnover at %s' % ' '.join(map(str, self.turnover)))
+
+
+def rotor_tables(name):
+    """Return the forward and backward tables of a rotor as (70, 70) arrays
+    indexed by internal position and wire.
+
+    """
+    rotor = create_rotor(name)
+    shape = (KEYBOARD_CHARS_LEN, KEYBOARD_CHARS_LEN)
+    return (numpy.array(rotor.forward_table, dtype=numpy.intp).reshape(shape),
+            numpy.array(rotor.backward_table, dtype=numpy.intp).reshape(shape))
+
+
+def reflector_table(name):
+    """Return the contacts of a reflector as an array, with -1 for the
+    plaintext pins.
+
+    """
+    reflector = create_reflector(name)
+    return numpy.array([-1 if plaintext else contact for contact, plaintext in
+                        (reflector.signal_in_reflector(k) for k in range(KEYBOARD_CHARS_LEN))],
+                       dtype=numpy.intp)
+
+
+def step_patterns(name, length):
+    """Return the sorted list of the tuples of key presses in range(length)
+    at which the right-most rotor name pushes the rotor to its left along,
+    for every display it can start at; the empty tuple comes first.
+
+    """
+    # with the ring setting at a, the notch table is indexed by display
+    notches = create_rotor(name).notch_table
+    return sorted({tuple(drive_times(d, notches, length)) for d in range(len(notches))})
+
+
+class Bombe:
+    """Tests rotor settings against a menu."""
+
+    def __init__(self, crib, ciphertext, turnover=True):
+        """crib, ciphertext - as for Menu
+
+        turnover - try every way the fourth rotor can step during the crib;
+        if False it is assumed not to step
+
+        """
+        if numpy is None:
+            raise RuNigmaError("NumPy is not installed")
+
+        self.menu = Menu(crib, ciphertext)
+        self.turnover = turnover
+        self._tables = {}
+        self._patterns = {}
+
+    def _rotor(self, name):
+        if name not in self._tables:
+            self._tables[name] = rotor_tables(name)
+        return self._tables[name]
+
+    def _steps(self, name):
+        if not self.turnover:
+            return [()]
+        if name not in self._patterns:
+            self._patterns[name] = step_patterns(name, self.menu.length)
+        return self._patterns[name]
+
+    def run(self, rotors, reflector, left=None):
+        """Sweep one rotor order and reflector and return the list of stops.
+
+        rotors - the five rotor names from left to right
+
+        reflector - the reflector name
+
+        left - an iterable of (p0, p1, p2) internal positions of the three left
+        rotors to try; by default all of them
+
+        """
+        if len(rotors) != 5:
+            raise RuNigmaError("Must supply 5 rotors")
+
+        tables = [self._rotor(name) for name in rotors]
+        contacts = reflector_table(reflector)
+        patterns = self._steps(rotors[4])
+        if left is None:
+            left = itertools.product(range(KEYBOARD_CHARS_LEN), repeat=3)
+
+        stops = []
+        for p0, p1, p2 in left:
+            for p3, p4, turnover, steckers in self._test(tables, contacts, (p0, p1, p2),
+                                                         patterns):
+                stops.append(Stop(list(rotors), reflector, (p0, p1, p2, p3, p4),
+                                  turnover, steckers))
+        return stops
+
+    def _test(self, tables, contacts, left, patterns):
+        """Test every position of the two right rotors and every guess for
+        the centre, for the given positions of the three left rotors and
+        each of the patterns of crib indices at which the fourth rotor
+        steps.
+
+        Yields (p3, p4, turnover, steckers) for the surviving rows.
+
+        """
+        n = KEYBOARD_CHARS_LEN
+        length = self.menu.length
+        wires = numpy.arange(n)
+
+        # the permutation from the right side of the third rotor to the
+        # reflector and back, -1 for a plaintext pin
+        w = wires
+        for (forward, _), p in zip(tables[2::-1], left[::-1]):
+            w = forward[p][w]
+        w = contacts[w]
+        pins = w < 0
+        for (_, backward), p in zip(tables[:3], left):
+            w = backward[p][numpy.where(pins, 0, w)]
+        inner = numpy.where(pins, -1, w)
+
+        # the same from the right side of the fourth rotor, for each of its
+        # positions: row p3 of a (70, 70) table, flattened
+        forward3, backward3 = tables[3]
+        w = inner[forward3]
+        pins = w < 0
+        w = numpy.take_along_axis(backward3, numpy.where(pins, 0, w), axis=1)
+        stack = numpy.where(pins, -1, w).ravel()
+
+        forward4, backward4 = (t.ravel() for t in tables[4])
+
+        def scramble(u, p3, p4, i):
+            # the return wire for entry wire u at crib index i, and whether
+            # u is a plaintext pin
+            q = (p4 + i + 1) % n * n
+            r = stack[(p3 + steps[i]) % n * n + forward4[q + u]]
+            pin = r < 0
+            return pin, backward4[q + numpy.where(pin, 0, r)]
+
+        # the rows of one pattern are tested together, which bounds the size
+        # of the arrays; steps[i] is the number of times the fourth rotor has
+        # stepped by crib index i
+        for turnover in patterns:
+            steps = numpy.zeros(length, dtype=numpy.intp)
+            for t in turnover:
+                steps[t:] += 1
+            p3, p4, plug = self._survivors(scramble)
+            for k in range(len(p3)):
+                steckers = {int(letter): int(plug[k, letter])
+                            for letter in numpy.nonzero(plug[k] >= 0)[0]}
+                yield (int(p3[k]), int(p4[k]),
+                       turnover or None, steckers)
+
+    def _survivors(self, scramble):
+        """Return the positions of the two right rotors and the plugboard
+        knowledge, -1 for unknown, of the rows that survive the crib.
+
+        """
+        n = KEYBOARD_CHARS_LEN
+        wires = numpy.arange(n)
+
+        # one row per (p3, p4, guess)
+        p3, p4, guess = (a.ravel() for a in numpy.meshgrid(wires, wires, wires,
+                                                           indexing='ij'))
+        rows = len(p3)
+
+        plug = numpy.full((rows, n), -1, dtype=numpy.int8)
+        centre = self.menu.centre
+        plug[:, centre] = guess
+        index = numpy.arange(rows)
+        plug[index, guess] = centre
+
+        for a, b, i in self.menu.links:
+            u = plug[:, a].astype(numpy.intp)
+            pin, v = scramble(u, p3, p4, i)
+
+            if a == b:
+                ok = pin | (v == u)
+            else:
+                current = plug[:, b]
+                back = plug[index, v]
+                ok = ~pin & ((current < 0) | (current == v)) & ((back < 0) | (back == b))
+
+            if not ok.all():
+                p3, p4, plug, v = p3[ok], p4[ok], plug[ok], v[ok]
+                rows = len(p3)
+                index = numpy.arange(rows)
+                if not rows:
+                    return p3, p4, plug
+
+            if a != b:
+                plug[:, b] = v
+                plug[index, v] = b
+
+        # the surviving rows know more connections than the menu letters;
+        # test every link of the crib, in both directions, with them until
+        # nothing new is learnt
+        changed = True
+        while changed and rows:
+            changed = False
+            for a, b, i in self.menu.all_links:
+                for f, g in ((a, b), (b, a)):
+                    known = plug[:, f] >= 0
+                    u = numpy.where(known, plug[:, f], 0).astype(numpy.intp)
+                    pin, v = scramble(u, p3, p4, i)
+                    current = plug[:, g]
+                    back = plug[index, v]
+                    bad = known & numpy.where(
+                        pin, f != g,
+                        ((current >= 0) & (current != v)) | ((back >= 0) & (back != g)))
+
+                    if bad.any():
+                        ok = ~bad
+                        p3, p4, plug = p3[ok], p4[ok], plug[ok]
+                        known, pin, v, current = known[ok], pin[ok], v[ok], current[ok]
+                        rows = len(p3)
+                        index = numpy.arange(rows)
+
+                    new = numpy.nonzero(known & ~pin & (current < 0))[0]
+                    if len(new):
+                        plug[new, g] = v[new]
+                        plug[new, v[new]] = g
+                        changed = True
+
+        # a plugboard has at most MAX_PAIRS cables
+        wired = ((plug >= 0) & (plug != numpy.arange(n, dtype=numpy.int8))).sum(axis=1)
+        ok = wired <= 2 * MAX_PAIRS
+        return p3[ok], p4[ok], plug[ok]
+
+
+# the bombe of a worker process, see _init_worker
+_worker_bombe = None
+
+
+def _init_worker(crib, ciphertext, turnover):
+    """Build the bombe of a worker process."""
+    global _worker_bombe
+    _worker_bombe = Bombe(crib, ciphertext, turnover)
+
+
+def _run(job):
+    """Run the worker bombe on one rotor order, reflector and a list of left
+    positions.
+
+    """
+    rotors, reflector, left = job
+    return _worker_bombe.run(rotors, reflector, left)
+
+
+def search(crib, ciphertext, orders=None, reflectors=None, left=None, turnover=True,
+           jobs=None, max_stops=None):
+    """Sweep rotor orders and reflectors and return the list of stops.
+
+    crib, ciphertext, turnover - as for Bombe
+
+    orders - an iterable of rotor orders, each a list of five rotor names; by
+    default every order of five rotors from rotors.data
+
+    reflectors - an iterable of reflector names; by default all of them
+
+    left - a list of (p0, p1, p2) positions of the three left rotors to try;
+    by default all of them
+
+    jobs - the number of worker processes; None means one per CPU
+
+    max_stops - stop the search once this many stops are found and return
+    the first max_stops
+
+    """
+    if orders is None:
+        orders = itertools.permutations(sorted(ROTORS), 5)
+    reflectors = sorted(REFLECTORS) if reflectors is None else list(reflectors)
+    if left is None:
+        left = list(itertools.product(range(KEYBOARD_CHARS_LEN), repeat=3))
+    else:
+        left = list(left)
+
+    work = ((list(rotors), reflector, left[start:start + CHUNK_SIZE])
+            for rotors in orders for reflector in reflectors
+            for start in range(0, len(left), CHUNK_SIZE))
+
+    stops = []
+
+    if jobs == 1:
+        bombe = Bombe(crib, ciphertext, turnover)
+        for rotors, reflector, chunk in work:
+            stops += bombe.run(rotors, reflector, chunk)
+            if max_stops is not None and len(stops) >= max_stops:
+                break
+        return stops[:max_stops]
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(crib, ciphertext, turnover)) as pool:
+        # keep a bounded number of chunks in flight, so that the search can
+        # stop early without queueing all of the work
+        limit = 2 * (jobs or os.cpu_count() or 1)
+        pending = set()
+        for job in itertools.chain(work, [None]):
+            if job is not None:
+                pending.add(pool.submit(_run, job))
+                if len(pending) < limit:
+                    continue
+
+            while pending and (job is None or len(pending) >= limit):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stops += future.result()
+
+            if max_stops is not None and len(stops) >= max_stops:
+                for future in pending:
+                    future.cancel()
+                break
+
+    return stops[:max_stops]
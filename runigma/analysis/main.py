@@ -0,0 +1,261 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Provide a command-line app to analyze RuNigma Machine configurations."""
+
+import argparse
+import sys
+import time
+
+from ..keyfile import KeyFileError, KeySheet
+from ..machine import RuNigmaMachine, RuNigmaError
+from ..rotors import RotorError
+from . import bombe, plugboard
+from .ngrams import NgramTables
+from .period import analyze_machine, is_weak
+
+PROG_DESC = 'Analyze RuNigma machine configurations'
+
+HELP_EPILOG = """\
+Commands:
+
+    period  report the stepping period and rotor step rates of one
+            configuration, given by a key file or by command-line arguments
+    sheet   report the configurations of a key file with a short period or a
+            rotor that hardly ever steps
+    plugboard
+            recover the plugboard of a message, given the rest of the key, by
+            hill-climbing; needs NumPy
+    bombe   find the rotor positions and part of the plugboard of a message
+            from a crib at its start, for the given or every rotor order and
+            reflector; needs NumPy
+    train   train n-gram tables for plugboard --ngrams from corpus files;
+            needs NumPy
+
+Examples:
+
+    $ %(prog)s period --key-file=enigma.keys -d 12 -s ФСИАР
+    $ %(prog)s period -r A Б В Г Д -i 1 2 3 4 5 -s АУГСД
+    $ %(prog)s sheet --key-file=enigma.keys
+    $ %(prog)s bombe -r A Б В Г Д -u Ш --crib=ПРИВЕТ_ШТАБУ_ДИВИЗИИ_ -f message.txt
+    $ %(prog)s train -o russian.ngr war_and_peace.txt
+    $ %(prog)s plugboard -r A Б В Г Д -i 1 2 3 4 5 -u Ш -s АУГСД -f message.txt \\
+          --ngrams=russian.ngr
+
+"""
+
+# the defaults for a weak configuration; a typical configuration repeats
+# after some 10 ** 8 key presses and its left-most rotor steps once every few
+# hundred thousand
+MIN_PERIOD = 70 ** 4
+MIN_RATE = 1e-7
+
+
+def create_machine(parser, args):
+    """Create an RuNigmaMachine from a key file or command-line specs."""
+
+    if args.key_file:
+        with open(args.key_file, 'r') as f:
+            return RuNigmaMachine.from_key_file(f, args.day)
+
+    if args.rotors is None or len(args.rotors) != 5:
+        parser.error("Please specify 5 rotors or a key file")
+
+    ring_settings = ' '.join(args.ring_settings) if args.ring_settings else None
+    return RuNigmaMachine.from_key_sheet(rotors=args.rotors,
+                                         ring_settings=ring_settings,
+                                         reflector=args.reflector or 'А')
+
+
+def period_command(parser, args):
+    machine = create_machine(parser, args)
+    machine.set_display(args.start)
+
+    analysis = analyze_machine(machine)
+    print(analysis)
+    if is_weak(analysis, args.min_period, args.min_rate):
+        print('weak configuration')
+
+
+def sheet_command(parser, args):
+    if not args.key_file:
+        parser.error("Please specify a key file")
+
+    weak = 0
+    with open(args.key_file, 'r') as f:
+        sheet = KeySheet.from_file(f)
+
+    for day in sheet.days():
+        machine = sheet.machine(day)
+        machine.set_display(args.start)
+        analysis = analyze_machine(machine)
+
+        if args.verbose or is_weak(analysis, args.min_period, args.min_rate):
+            print('%3d  period %d  step rates %s' % (
+                day, analysis.period, ' '.join('%.3g' % r for r in analysis.step_rates)))
+        if is_weak(analysis, args.min_period, args.min_rate):
+            weak += 1
+
+    print('%d of %d days weak' % (weak, len(sheet)))
+
+
+def read_text(parser, args):
+    """Return the ciphertext given by --text, --file or on standard input."""
+
+    if args.text and args.file:
+        parser.error("Please specify --text or --file, but not both")
+
+    if args.text:
+        text = args.text
+    elif args.file:
+        with open(args.file, 'r') as f:
+            text = f.read()
+    else:
+        text = input('--> ')
+    return text.strip()
+
+
+def plugboard_command(parser, args):
+    text = read_text(parser, args)
+
+    if args.restarts < 1 or args.jobs < 0:
+        parser.error("Please specify a positive number of restarts and a non-negative "
+                     "number of jobs")
+
+    machine = create_machine(parser, args)
+    machine.set_display(args.start)
+
+    ngrams = None
+    if args.ngrams:
+        ngrams = NgramTables.load(args.ngrams).table(args.order)
+
+    start = time.perf_counter()
+    result = plugboard.solve(machine, text, ngrams=ngrams, restarts=args.restarts,
+                             jobs=args.jobs or None, seed=args.seed)
+    elapsed = time.perf_counter() - start
+
+    print('Plugboard:', result.plugboard.army_str())
+    print('Score:', result.score)
+    if args.verbose:
+        print('Candidates scored: %d in %.2f s, %.0f/s' % (
+            result.evaluations, elapsed, result.evaluations / elapsed))
+    print('Plaintext:')
+    print(result.plaintext)
+
+
+def bombe_command(parser, args):
+    if not args.crib:
+        parser.error("Please specify a crib")
+    if args.key_file or args.ring_settings:
+        parser.error("The bombe does not use a key file or ring settings")
+    if args.rotors is not None and len(args.rotors) != 5:
+        parser.error("Please specify 5 rotors")
+    if args.jobs < 0:
+        parser.error("Please specify a non-negative number of jobs")
+
+    text = read_text(parser, args)
+
+    start = time.perf_counter()
+    stops = bombe.search(args.crib, text,
+                         orders=[args.rotors] if args.rotors else None,
+                         reflectors=[args.reflector] if args.reflector else None,
+                         turnover=args.turnover, jobs=args.jobs or None,
+                         max_stops=args.max_stops)
+    elapsed = time.perf_counter() - start
+
+    for stop in stops:
+        print(stop)
+    if args.verbose:
+        print('%d stops in %.2f s' % (len(stops), elapsed))
+
+
+def train_command(parser, args):
+    if not args.corpus or not args.output:
+        parser.error("Please specify corpus files and an output file")
+
+    def texts():
+        for name in args.corpus:
+            with open(name, 'r', encoding='utf-8') as f:
+                yield f.read()
+
+    NgramTables.train(texts()).save(args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='runigma-analyze', description=PROG_DESC,
+                                     epilog=HELP_EPILOG,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['period', 'sheet', 'plugboard', 'bombe', 'train'],
+                        help='analysis to run')
+    parser.add_argument('corpus', nargs='*', help='corpus files for train')
+    parser.add_argument('-k', '--key-file',
+                        help='path to key file for daily settings')
+    parser.add_argument('-d', '--day', type=int, default=None,
+                        help='use the settings for day DAY when reading key file')
+    parser.add_argument('-r', '--rotors', nargs='+', metavar='ROTOR',
+                        help='rotor list ordered from left to right; e.g А Б В Г Д')
+    parser.add_argument('-i', '--ring-settings', nargs='+',
+                        metavar='RING_SETTING',
+                        help='ring setting list from left to right; e.g. А А Г Д У')
+    parser.add_argument('-u', '--reflector', help='reflector name')
+    parser.add_argument('-s', '--start', default='aaaaa',
+                        help='starting position [default: %(default)s]')
+    parser.add_argument('--min-period', type=int, default=MIN_PERIOD,
+                        help=('report configurations repeating after fewer key presses'
+                              ' [default: %(default)s]'))
+    parser.add_argument('--min-rate', type=float, default=MIN_RATE,
+                        help=('report configurations with a rotor stepping less often per'
+                              ' key press [default: %(default)s]'))
+    parser.add_argument('-t', '--text', help='ciphertext for plugboard and bombe')
+    parser.add_argument('-f', '--file', help='ciphertext file for plugboard and bombe')
+    parser.add_argument('--restarts', type=int, default=1,
+                        help='number of hill-climbs for plugboard [default: %(default)s]')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('number of worker processes for plugboard and bombe; 0 means one'
+                              ' per CPU [default: %(default)s]'))
+    parser.add_argument('--seed', help='seed for reproducible plugboard restarts')
+    parser.add_argument('--ngrams', help='n-gram tables file for plugboard scoring')
+    parser.add_argument('--order', type=int, default=3,
+                        help='n-gram order for plugboard scoring [default: %(default)s]')
+    parser.add_argument('--crib', help='known plaintext at the start of the message for bombe')
+    parser.add_argument('--no-turnover', dest='turnover', action='store_false', default=True,
+                        help=('assume the fourth rotor does not step during the crib for'
+                              ' bombe; much faster'))
+    parser.add_argument('--max-stops', type=int, default=None,
+                        help='stop the bombe after this many stops')
+    parser.add_argument('-o', '--output', help='output file for train')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False,
+                        help=('report every day of a key file, or the plugboard or bombe'
+                              ' search rate'))
+
+    args = parser.parse_intermixed_args()
+
+    if args.corpus and args.command != 'train':
+        parser.error("Corpus files are only read by the train command")
+
+    if args.key_file and (args.rotors or args.ring_settings or args.reflector):
+        parser.error("Please specify either a key file or command-line key "
+                     "settings, but not both")
+
+    if args.command == 'period':
+        period_command(parser, args)
+    elif args.command == 'sheet':
+        sheet_command(parser, args)
+    elif args.command == 'plugboard':
+        plugboard_command(parser, args)
+    elif args.command == 'bombe':
+        bombe_command(parser, args)
+    else:
+        train_command(parser, args)
+
+
+def console_main():
+    try:
+        main()
+    except (IOError, RuNigmaError, RotorError, KeyFileError) as ex:
+        sys.stderr.write("%s\n" % ex)
+
+
+if __name__ == '__main__':
+    console_main()
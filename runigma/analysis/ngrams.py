@@ -0,0 +1,223 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains language scoring tables for texts over the RuNigma
+keyboard.
+
+An NgramTables holds unigram, bigram and trigram log probabilities as flat
+float32 arrays of 70, 70 ** 2 and 70 ** 3 entries. The n-gram of the wire
+numbers k1 ... kn is found at index k1 * 70 ** (n - 1) + ... + kn, which is
+the layout analysis.plugboard.PlugboardSolver expects.
+
+The tables are trained from a corpus and saved in a binary file: an 8 byte
+header followed by the three arrays in little endian order. load maps the
+file into memory instead of reading it, so loading takes no time to speak of
+and the pages are shared between processes.
+
+Texts are scored as arrays of wire numbers (see encode). NumPy is required.
+
+"""
+
+import mmap
+import re
+
+try:
+    import numpy
+except ImportError:     # pragma: no cover
+    numpy = None
+
+from ..machine import RuNigmaError, KEYBOARD_CHARS, KEYBOARD_CHARS_LEN
+
+MAGIC = b'RUNGRAM1'
+MAX_ORDER = 3
+
+# the default count added to every n-gram when training, so that unseen
+# n-grams get a small probability instead of none
+ALPHA = 0.01
+
+# the number of characters counted at a time when training
+BLOCK_SIZE = 1 << 20
+
+# characters are folded to the case found on the keyboard: Latin letters are
+# lower case, Cyrillic ones upper case
+FOLD_CASE = str.maketrans(
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZабвгдеёжзийклмнопрстуфхцчшщъыьэюя',
+    'abcdefghijklmnopqrstuvwxyzАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ')
+
+NOT_ON_KEYBOARD = re.compile('[^%s]+' % re.escape(KEYBOARD_CHARS))
+
+# maps a code point to its wire number, or -1 if not on the keyboard
+if numpy is not None:
+    _LOOKUP = numpy.full(max(map(ord, KEYBOARD_CHARS)) + 1, -1, dtype=numpy.intp)
+    _LOOKUP[[ord(c) for c in KEYBOARD_CHARS]] = numpy.arange(KEYBOARD_CHARS_LEN)
+
+
+def normalize(text):
+    """Return text folded to the keyboard: letters in the keyboard's case and
+    every run of other characters, such as spaces and punctuation, replaced
+    with a single _.
+
+    """
+    return NOT_ON_KEYBOARD.sub('_', text.translate(FOLD_CASE))
+
+
+def encode(text):
+    """Return the wire numbers of a normalized text as an array."""
+
+    if numpy is None:
+        raise RuNigmaError("NumPy is not installed")
+
+    points = numpy.frombuffer(text.encode('utf-32-le'), dtype=numpy.uint32)
+    if len(points) and points.max() >= len(_LOOKUP):
+        raise RuNigmaError("text contains characters not on the keyboard")
+    keys = _LOOKUP[points]
+    if (keys < 0).any():
+        raise RuNigmaError("text contains characters not on the keyboard")
+    return keys
+
+
+def window_index(keys, order):
+    """Return the table index of each n-gram of order consecutive keys; keys
+    is an array of wire numbers, or a 2-d array of one text per row.
+
+    """
+    keys = numpy.asarray(keys)
+    length = keys.shape[-1] - order + 1
+    index = keys[..., :length].astype(numpy.intp)
+    for j in range(1, order):
+        index *= KEYBOARD_CHARS_LEN
+        index += keys[..., j:j + length]
+    return index
+
+
+class NgramTables:
+    """Unigram, bigram and trigram log probabilities."""
+
+    def __init__(self, tables, source=None):
+        """tables - the three flat arrays, for orders 1 to 3
+
+        source - the mmap the arrays are views of, if any
+
+        """
+        if numpy is None:
+            raise RuNigmaError("NumPy is not installed")
+
+        if [len(t) for t in tables] != [KEYBOARD_CHARS_LEN ** k for k in range(1, MAX_ORDER + 1)]:
+            raise RuNigmaError("invalid n-gram tables")
+
+        self.tables = tables
+        self._source = source
+
+    @classmethod
+    def train(cls, texts, alpha=ALPHA):
+        """Count the n-grams of an iterable of texts and return their log
+        probabilities. Each text is normalized first; n-grams do not span
+        two texts.
+
+        alpha - the count added to every n-gram
+
+        """
+        counts = [numpy.zeros(KEYBOARD_CHARS_LEN ** k, dtype=numpy.int64)
+                  for k in range(1, MAX_ORDER + 1)]
+
+        for text in texts:
+            text = normalize(text)
+            # overlap the blocks so that n-grams across a boundary count once
+            for start in range(0, len(text), BLOCK_SIZE):
+                keys = encode(text[max(0, start - MAX_ORDER + 1):start + BLOCK_SIZE])
+                skip = min(start, MAX_ORDER - 1)
+                for k, count in enumerate(counts, 1):
+                    index = window_index(keys, k)[max(0, skip - k + 1):]
+                    count += numpy.bincount(index, minlength=len(count))
+
+        tables = []
+        for count in counts:
+            total = count.sum() + alpha * len(count)
+            tables.append(numpy.log((count + alpha) / total).astype(numpy.float32))
+        return cls(tables)
+
+    @classmethod
+    def load(cls, path):
+        """Map a file written by save into memory and return its tables."""
+
+        with open(path, 'rb') as f:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if source[:len(MAGIC)] != MAGIC:
+            source.close()
+            raise RuNigmaError("%s is not an n-gram table file" % path)
+
+        tables = []
+        offset = len(MAGIC)
+        for k in range(1, MAX_ORDER + 1):
+            count = KEYBOARD_CHARS_LEN ** k
+            try:
+                tables.append(numpy.frombuffer(source, dtype='<f4', count=count, offset=offset))
+            except ValueError:
+                source.close()
+                raise RuNigmaError("%s is truncated" % path)
+            offset += 4 * count
+
+        return cls(tables, source)
+
+    def save(self, path):
+        """Write the tables to a file."""
+
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            for table in self.tables:
+                f.write(numpy.asarray(table, dtype='<f4').tobytes())
+
+    def table(self, order=MAX_ORDER):
+        """Return the flat table of the given order."""
+        if not 1 <= order <= MAX_ORDER:
+            raise RuNigmaError("invalid n-gram order %d" % order)
+        return self.tables[order - 1]
+
+    def score(self, keys, order=MAX_ORDER):
+        """Return the log probability of an array of wire numbers, or of
+        each row of a 2-d array.
+
+        """
+        return self.table(order)[window_index(keys, order)].sum(axis=-1, dtype=numpy.float64)
+
+    def update(self, keys, score, positions, values, order=MAX_ORDER):
+        """Change keys in place, setting keys[positions] to values, and
+        return the new score, given score, the score of keys before the
+        change. Only the n-grams covering the changed positions are scored.
+
+        """
+        table = self.table(order)
+        positions = numpy.asarray(positions, dtype=numpy.intp)
+
+        # the start of each n-gram that covers a changed position
+        starts = (positions[:, None] - numpy.arange(order)).ravel()
+        starts = numpy.unique(starts[(starts >= 0) & (starts <= len(keys) - order)])
+        windows = starts[:, None] + numpy.arange(order)
+
+        score -= table[window_index(keys[windows], order)].sum(dtype=numpy.float64)
+        keys[positions] = values
+        score += table[window_index(keys[windows], order)].sum(dtype=numpy.float64)
+        return score
+
+    def close(self):
+        """Release the file mapping of tables returned by load. The tables
+        must not be used afterwards.
+
+        """
+        if self._source is not None:
+            self.tables = None
+            try:
+                self._source.close()
+            except BufferError:
+                # views of the tables are still in use; the mapping is
+                # closed when they are freed
+                pass
+            self._source = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,93 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module computes the stepping properties of a machine configuration
+exactly, without pressing every key.
+
+The rotor stack is eventually periodic: after a transient of some key
+presses, the rotor positions repeat every period key presses. Both are found
+with stepping.Schedule, from the notch positions of the rotors and the
+stepping rules of RuNigmaMachine._step_rotors.
+
+"""
+
+from ..stepping import Schedule
+
+
+class StackAnalysis:
+    """The stepping properties of a rotor stack from a given start state.
+
+    All lists are ordered from the left-most to the right-most rotor.
+
+    transient - the number of key presses before the stack is periodic; this
+    is an upper bound, found one period of the right-hand rotors at a time
+
+    period - the number of key presses after which the rotor positions repeat
+
+    cycle_steps - how many times each rotor steps during one period
+
+    step_rates - the average number of steps per key press of each rotor
+
+    next_step - the number of key presses until each rotor next steps, or
+    None if it never does
+
+    """
+
+    def __init__(self, positions, notches):
+        schedule = Schedule(positions, notches)
+
+        self.transient = schedule.start
+        self.period = schedule.period
+
+        start = schedule.after(self.transient)[1]
+        end = schedule.after(self.transient + self.period)[1]
+        self.cycle_steps = [b - a for a, b in zip(start, end)]
+        self.step_rates = [s / self.period for s in self.cycle_steps]
+
+        self.next_step = [self._next_step(schedule, i) for i in range(len(positions))]
+
+    def _next_step(self, schedule, i):
+        """Return the number of key presses until rotor i steps, or None."""
+
+        # every rotor that moves at all moves within transient + period
+        # presses; find the first press with a binary search
+        hi = self.transient + self.period
+        if schedule.after(hi)[1][i] == 0:
+            return None
+
+        lo = 0
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if schedule.after(mid)[1][i]:
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+    def __str__(self):
+        return '\n'.join([
+            'period:      %d' % self.period,
+            'transient:   %d' % self.transient,
+            'cycle steps: %s' % ' '.join(str(s) for s in self.cycle_steps),
+            'step rates:  %s' % ' '.join('%.3g' % r for r in self.step_rates),
+            'next step:   %s' % ' '.join('-' if s is None else str(s) for s in self.next_step),
+        ])
+
+
+def analyze_machine(machine):
+    """Return the StackAnalysis of a machine from its current rotor
+    positions.
+
+    """
+    return StackAnalysis([r.pos for r in machine.rotors],
+                         [r.notch_table for r in machine.rotors])
+
+
+def is_weak(analysis, min_period, min_rate):
+    """Return True if an analysis shows a weak configuration: a period below
+    min_period or a rotor that steps less than min_rate times per key press.
+
+    """
+    return (analysis.period < min_period or
+            min(analysis.step_rates) < min_rate)
@@ -0,0 +1,342 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module recovers the plugboard settings of a message by hill-climbing,
+given the ciphertext and the rest of the key: rotor order, ring settings,
+reflector and start position.
+
+With the rotors fixed, key press i applies a fixed permutation S[i] between
+two passes through the plugboard P, so the plaintext is P(S[i](P(c[i]))), or
+c[i] itself when the signal hits a plaintext pin of the reflector. The
+permutations S are computed once for the whole message (see
+vectorized.VectorEngine.scrambler). The climb then tries every cable change
+of Plugboard.connect at once: each candidate plugboard is a row of an array
+and all rows are scored with array lookups, without rebuilding a machine or
+copying a plugboard per candidate. The best change is applied to a Plugboard
+with its own connect and disconnect methods.
+
+Scoring starts with the index of coincidence of the plaintext, which finds
+most cables from a random start, and continues with n-gram log
+probabilities, if a table is given. The index of coincidence only depends on
+the letter counts of the plaintext; since P is an involution, the count of
+letter l is the number of key presses i with S[i](P(c[i])) = P(l), which is
+read from a table counting the (c[i], x, S[i](x)) triples of the message. A
+cable change alters P for at most four letters, so a candidate is scored by
+updating those counts, independent of the length of the message. The n-gram
+score decrypts the whole message for every candidate.
+
+Random restarts can run in several processes.
+
+NumPy is required.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import random
+
+try:
+    import numpy
+except ImportError:     # pragma: no cover
+    numpy = None
+
+from ..machine import (RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS, KEYBOARD_CHARS_LEN,
+                       KEYBOARD_INDEX)
+from ..plugboard import Plugboard, MAX_PAIRS
+
+# the number of candidate plaintext characters scored at a time; bounds the
+# size of the temporary arrays
+BLOCK_SIZE = 1 << 20
+
+# the solver of a worker process, see _init_worker
+_worker_solver = None
+
+
+class SolverResult:
+    """The outcome of a hill-climb.
+
+    score - the final score; the n-gram score if a table was given and the
+    index of coincidence otherwise
+
+    plugboard - the plugboard found, as a Plugboard
+
+    plaintext - the message decrypted with it
+
+    evaluations - the number of candidate plugboards scored
+
+    """
+
+    def __init__(self, score, plugboard, plaintext, evaluations):
+        self.score = score
+        self.plugboard = plugboard
+        self.plaintext = plaintext
+        self.evaluations = evaluations
+
+    def __str__(self):
+        return '%.6g  %s' % (self.score, self.plugboard.army_str())
+
+
+class PlugboardSolver:
+    """Hill-climbs the plugboard of a machine for one ciphertext."""
+
+    def __init__(self, machine, ciphertext, ngrams=None):
+        """machine - the machine with the known rotors, ring settings,
+        reflector and start display; its plugboard is ignored
+
+        ciphertext - the message, as a string of keyboard characters
+
+        ngrams - None or a flat array of 70 ** k log probabilities of k
+        consecutive characters, indexed by their wire numbers as base 70
+        digits, the first one most significant
+
+        """
+        if numpy is None:
+            raise RuNigmaError("NumPy is not installed")
+
+        from ..vectorized import VectorEngine
+
+        n = KEYBOARD_CHARS_LEN
+        keys = [KEYBOARD_INDEX.get(c) for c in ciphertext]
+        if None in keys:
+            raise RuNigmaError("ciphertext contains characters not on the keyboard")
+        if len(keys) < 2:
+            raise RuNigmaError("ciphertext too short")
+
+        self.keys = numpy.array(keys, dtype=numpy.intp)
+        length = len(keys)
+
+        machine = RuNigmaMachine(machine.rotors, machine.reflector, Plugboard())
+        scrambler = VectorEngine(machine).scrambler(length)
+        self._scrambler = scrambler.ravel()
+        self._offsets = numpy.arange(length, dtype=numpy.intp) * n
+
+        # the number of key presses with key c, entry wire x and return wire
+        # y, at [c * 70 + x, y], and with key c hitting a plaintext pin from
+        # entry wire x, at [c, x]
+        key_entry = (self.keys * n)[:, None] + numpy.arange(n)
+        pins = scrambler < 0
+        self._triples = numpy.bincount((key_entry * n + scrambler)[~pins],
+                                       minlength=n ** 3).reshape(n * n, n)
+        self._pins = numpy.bincount(key_entry[pins], minlength=n * n).reshape(n, n)
+
+        # every unordered pair of plugs, the candidate cables
+        self._a, self._b = (x.astype(numpy.intp) for x in numpy.triu_indices(n, 1))
+        self._plugs = numpy.arange(n, dtype=numpy.intp)
+
+        self.ngrams = None
+        if ngrams is not None:
+            self.ngrams = numpy.asarray(ngrams, dtype=numpy.float32)
+            self.order = int(round(numpy.log(len(self.ngrams)) / numpy.log(n)))
+            if n ** self.order != len(self.ngrams) or self.order > length:
+                raise RuNigmaError("invalid n-gram table")
+
+        self.evaluations = 0
+
+    def decrypt(self, wirings):
+        """Return the plaintexts of the message for a (k, 70) array of
+        plugboard wirings as a (k, length) array of wire numbers.
+
+        """
+        wirings = numpy.asarray(wirings, dtype=numpy.uint8)
+        y = self._scrambler[self._offsets + wirings[:, self.keys]]
+        rows = (numpy.arange(len(wirings), dtype=numpy.intp) * KEYBOARD_CHARS_LEN)[:, None]
+        plaintexts = wirings.ravel()[rows + y]
+        return numpy.where(y < 0, self.keys.astype(numpy.uint8), plaintexts)
+
+    def _counts(self, wirings, returns):
+        """Return the plaintext letter counts for wirings, given the counts
+        of the return wires for each.
+
+        """
+        counts = numpy.take_along_axis(returns, wirings, axis=1)
+        return counts + self._pins[self._plugs, wirings]
+
+    def ioc_score(self, wiring):
+        """Return the unnormalised index of coincidence, the sum of f(f-1)
+        over the plaintext letter counts f, for a single wiring.
+
+        """
+        wiring = numpy.array([wiring], dtype=numpy.intp)
+        returns = self._triples[self._plugs * KEYBOARD_CHARS_LEN + wiring].sum(axis=1)
+        counts = self._counts(wiring, returns)
+        self.evaluations += 1
+        return int((counts * (counts - 1)).sum())
+
+    def ioc_scores(self, wiring, a, b, wirings):
+        """Return the index of coincidence for each candidate from
+        candidates(), computed from the change to wiring.
+
+        """
+        n = KEYBOARD_CHARS_LEN
+        wiring = numpy.asarray(wiring, dtype=numpy.intp)
+        returns = self._triples[self._plugs * n + wiring].sum(axis=0)
+
+        # the plugs whose connection may change, without duplicates
+        wa, wb = wiring[a], wiring[b]
+        plugs = numpy.stack([a, b, wa, wb], axis=1)
+        changed = numpy.ones(plugs.shape, dtype=bool)
+        changed[:, 2] = (wa != a) & (wa != b)
+        changed[:, 3] = (wb != a) & (wb != b) & (wb != wa)
+
+        rows = numpy.arange(len(wirings))[:, None]
+        delta = (self._triples[plugs * n + wirings[rows, plugs]] -
+                 self._triples[plugs * n + wiring[plugs]])
+        delta *= changed[:, :, None]
+
+        counts = self._counts(wirings, returns + delta.sum(axis=1))
+        self.evaluations += len(wirings)
+        return (counts * (counts - 1)).sum(axis=1)
+
+    def ngram_scores(self, wirings):
+        """Return the n-gram log probability of the plaintext for each row of
+        a (k, 70) array of wirings.
+
+        """
+        n = KEYBOARD_CHARS_LEN
+        step = max(1, BLOCK_SIZE // len(self.keys))
+        length = len(self.keys) - self.order + 1
+
+        scores = []
+        for start in range(0, len(wirings), step):
+            plaintexts = self.decrypt(wirings[start:start + step])
+            index = plaintexts[:, :length].astype(numpy.int32)
+            for j in range(1, self.order):
+                index *= n
+                index += plaintexts[:, j:j + length]
+            scores.append(self.ngrams[index].sum(axis=1))
+
+        self.evaluations += len(wirings)
+        return numpy.concatenate(scores)
+
+    def candidates(self, plugboard):
+        """Return the candidate cable changes of plugboard as arrays a, b and
+        wirings: row i of wirings is the wiring after plugboard.connect(a[i],
+        b[i]), or after plugboard.disconnect(a[i]) if a[i] and b[i] are
+        already connected. Changes that need more than MAX_PAIRS cables are
+        left out.
+
+        """
+        wiring = numpy.array(plugboard.wiring_map, dtype=numpy.intp)
+        a, b = self._a, self._b
+        wa, wb = wiring[a], wiring[b]
+
+        if len(plugboard.get_pairs()) >= MAX_PAIRS:
+            keep = (wa != a) | (wb != b)
+            a, b, wa, wb = a[keep], b[keep], wa[keep], wb[keep]
+
+        rows = numpy.arange(len(a))
+        wirings = numpy.tile(wiring, (len(a), 1))
+        wirings[rows, wa] = wa
+        wirings[rows, wb] = wb
+        connect = wa != b
+        rows = rows[connect]
+        wirings[rows, a[connect]] = b[connect]
+        wirings[rows, b[connect]] = a[connect]
+        return a, b, wirings
+
+    def climb(self, plugboard, ngram=False):
+        """Hill-climb from plugboard, changing it in place, until no single
+        cable change improves the score. Returns the final score.
+
+        ngram - score with the n-gram table instead of the index of
+        coincidence
+
+        """
+        if ngram:
+            score = self.ngram_scores(numpy.array([plugboard.wiring_map]))[0]
+        else:
+            score = self.ioc_score(plugboard.wiring_map)
+
+        while True:
+            a, b, wirings = self.candidates(plugboard)
+            if ngram:
+                scores = self.ngram_scores(wirings)
+            else:
+                scores = self.ioc_scores(plugboard.wiring_map, a, b, wirings)
+
+            best = int(numpy.argmax(scores))
+            if scores[best] <= score:
+                return float(score)
+
+            score = scores[best]
+            x, y = int(a[best]), int(b[best])
+            if plugboard.is_connected(x, y):
+                plugboard.disconnect(x)
+            else:
+                plugboard.connect(x, y)
+
+    def solve(self, plugboard=None):
+        """Hill-climb from plugboard, or from an empty plugboard, first on
+        the index of coincidence and then on the n-gram score. Returns a
+        SolverResult.
+
+        """
+        plugboard = plugboard.copy() if plugboard is not None else Plugboard()
+        evaluations = self.evaluations
+
+        score = self.climb(plugboard)
+        if self.ngrams is not None:
+            score = self.climb(plugboard, ngram=True)
+
+        plaintext = self.decrypt([plugboard.wiring_map])[0]
+        return SolverResult(score, plugboard, ''.join(KEYBOARD_CHARS[k] for k in plaintext),
+                            self.evaluations - evaluations)
+
+
+def random_plugboard(rng):
+    """Return a Plugboard with a random number of random cables."""
+
+    plugboard = Plugboard()
+    plugs = rng.sample(range(KEYBOARD_CHARS_LEN), 2 * rng.randint(0, MAX_PAIRS))
+    for x, y in zip(plugs[::2], plugs[1::2]):
+        plugboard.connect(x, y)
+    return plugboard
+
+
+def _init_worker(settings, start, ciphertext, ngrams):
+    """Build the solver of a worker process."""
+    global _worker_solver
+    machine = RuNigmaMachine.from_key_sheet(**settings)
+    machine.set_display(start)
+    _worker_solver = PlugboardSolver(machine, ciphertext, ngrams)
+
+
+def _restart(seed):
+    """Hill-climb from a random plugboard drawn with seed."""
+    return _worker_solver.solve(random_plugboard(random.Random(seed)))
+
+
+def solve(machine, ciphertext, ngrams=None, restarts=1, jobs=1, seed=None):
+    """Recover the plugboard of a message by hill-climbing with random
+    restarts, and return the SolverResult with the best score. Its
+    evaluations count the candidates scored over all restarts.
+
+    machine, ciphertext, ngrams - as for PlugboardSolver; the machine must be
+    built from the rotors in rotors.data when jobs is not 1
+
+    restarts - the number of climbs; the first one starts from an empty
+    plugboard and the others from random ones
+
+    jobs - the number of worker processes; None means one per CPU
+
+    seed - a seed for reproducible restarts
+
+    """
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(64) for _ in range(restarts - 1)]
+
+    solver = PlugboardSolver(machine, ciphertext, ngrams)
+    results = [solver.solve()]
+
+    if jobs == 1 or not seeds:
+        results += [solver.solve(random_plugboard(random.Random(s))) for s in seeds]
+    else:
+        settings = machine.get_settings()
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(settings, machine.get_display(),
+                                           ciphertext, ngrams)) as pool:
+            results += pool.map(_restart, seeds)
+
+    best = max(results, key=lambda r: r.score)
+    best.evaluations = sum(r.evaluations for r in results)
+    return best
@@ -0,0 +1,118 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains a function to process many short messages that share
+the same key settings, each with its own start display.
+
+The machine is compiled once and the engine is reset to the start position of
+each message, so the wiring and stepping tables are built only once for the
+whole batch.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import MachineCache
+from .machine import RuNigmaMachine, RuNigmaError
+
+# the default number of messages handed to an executor at a time
+BATCH_SIZE = 256
+
+# the number of key settings whose engines a worker process keeps
+WORKER_CACHE_SIZE = 64
+
+# the engines of a worker process, keyed by settings_key; see
+# process_settings_batch
+_worker_engines = MachineCache(WORKER_CACHE_SIZE)
+
+
+def settings_key(settings):
+    """Return a hashable key for a dictionary of from_key_sheet arguments;
+    raises TypeError if a value cannot be part of one.
+
+    """
+    key = tuple(sorted((name, ' '.join(value) if isinstance(value, list) else value)
+                       for name, value in settings.items()))
+    hash(key)
+    return key
+
+
+def display_positions(rotors):
+    """Return a function that converts a display string to the list of
+    internal rotor positions.
+
+    """
+    display_maps = [r.display_map for r in rotors]
+
+    def positions(display):
+        if len(display) != len(display_maps):
+            raise RuNigmaError("Incorrect length for display value")
+        try:
+            return [m[c] for m, c in zip(display_maps, display)]
+        except KeyError:
+            raise RuNigmaError("bad display value %s" % display)
+
+    return positions
+
+
+def process_batch(engine, positions, messages, replace_char):
+    """Process a list of (start, text) pairs with engine."""
+    result = []
+    for start, text in messages:
+        engine.set_positions(positions(start))
+        result.append(engine.process_text(text, replace_char))
+    return result
+
+
+def process_settings_batch(settings, messages, replace_char):
+    """Process a list of (start, text) pairs in a worker process."""
+    engine = _worker_engines.get(settings_key(settings),
+                                 lambda: RuNigmaMachine.from_key_sheet(**settings).compile())
+    return process_batch(engine, display_positions(engine.machine.rotors), messages,
+                         replace_char)
+
+
+def process_many(machine, messages, replace_char='_', executor=None,
+                 batch_size=BATCH_SIZE):
+    """Process a sequence of messages with the key settings of machine.
+
+    messages - an iterable of (start, text) pairs, where start is the display
+    value the message starts at (see RuNigmaMachine.set_display)
+
+    replace_char - as for RuNigmaMachine.process_text
+
+    executor - an optional concurrent.futures executor to spread the messages
+    over. Thread pools share the compiled tables; process pools are only sent
+    the key settings of the machine (see RuNigmaMachine.get_settings) and
+    compile a machine once per worker.
+
+    batch_size - the number of messages handed to the executor at a time
+
+    Returns the list of processed texts in the order of messages. The rotors
+    of machine are not moved.
+
+    """
+    messages = list(messages)
+
+    if executor is None:
+        return process_batch(machine.compile(), display_positions(machine.rotors),
+                              messages, replace_char)
+
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+
+    if isinstance(executor, ProcessPoolExecutor):
+        settings = machine.get_settings()
+        futures = [executor.submit(process_settings_batch, settings, batch, replace_char)
+                   for batch in batches]
+    else:
+        engine = machine.compile()
+        positions = display_positions(machine.rotors)
+        futures = [executor.submit(process_batch, engine.copy(), positions, batch,
+                                   replace_char)
+                   for batch in batches]
+
+    result = []
+    for future in futures:
+        result.extend(future.result())
+    return result
@@ -0,0 +1,328 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Provide the RuNigma benchmark suite.
+
+Each benchmark times one hot path of the package and reports its throughput
+in units per second (characters, machines, rotors, lookups or days) and the
+peak memory allocated by a single run, in total and per unit. The
+machines[N] benchmark keeps N machines alive at once, so its memory per unit
+is the size of a live machine. Results are saved as JSON so that a
+later run can be compared against them as a baseline.
+
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+import runigma
+from runigma import sheet
+from runigma import engine
+from runigma.cache import MACHINE_CACHE
+from runigma.keyfile import get_daily_settings
+from runigma.machine import RuNigmaMachine, KEYBOARD_CHARS
+from runigma.plugboard import Plugboard
+from runigma.rotors.data import ROTORS
+from runigma.rotors import rotor
+from runigma.rotors.rotor import Rotor
+
+SETTINGS = dict(rotors='Ь Ч Ю Г Ъ',
+                reflector='Ш',
+                ring_settings='r _ s Ч n',
+                plugboard_settings='zy Ю0 ЪЭ 6Ф ЯЫ ЙА wt lk ДР 3К q1 gm 9Ж uЧ ТЛ _2 ЩЕ ИМ hx fi')
+START = 'vhЯkК'
+
+# the message sizes for key_press and process_text
+SIZES = (100, 10000, 1000000)
+
+# the message lengths of the short_messages benchmarks
+SHORT_SIZES = (4, 11, 70)
+
+# the minimum time of one timed repeat
+MIN_TIME = 0.2
+
+# a result is flagged by compare_results if its throughput dropped by more
+# than this fraction
+THRESHOLD = 0.1
+
+PROG_DESC = 'Run the RuNigma benchmark suite.'
+
+HELP_EPILOG = """\
+Save a baseline, then compare a later run against it:
+
+    $ %(prog)s --output=baseline.json
+    $ %(prog)s --compare=baseline.json --threshold=0.05
+
+The exit status is 1 if any benchmark is slower than the baseline by more
+than the threshold.
+
+"""
+
+
+def random_text(size):
+    rnd = random.Random(size)
+    return ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(size))
+
+
+def bench_key_press(size):
+    machine = RuNigmaMachine.from_key_sheet(**SETTINGS)
+    machine.set_display(START)
+    text = random_text(size)
+    key_press = machine.key_press
+
+    def run():
+        for c in text:
+            key_press(c)
+    return run, size, 'chars'
+
+
+def bench_process_text(size):
+    machine = RuNigmaMachine.from_key_sheet(**SETTINGS)
+    machine.set_display(START)
+    text = random_text(size)
+    return lambda: machine.process_text(text), size, 'chars'
+
+
+def bench_short_messages(size):
+    # one message after another, each from the start position, as the server
+    # does; the engine is set up for every message
+    machine = RuNigmaMachine.from_key_sheet(**SETTINGS)
+    text = random_text(size)
+
+    def run():
+        machine.set_display(START)
+        machine.process_text(text)
+    return run, size, 'chars'
+
+
+def clear_caches():
+    """Drop every machine, engine and rotor table shared between machines,
+    for the benchmarks of building them cold. The hit and miss counters of
+    the caches are left alone.
+
+    """
+    MACHINE_CACHE.clear()
+    engine.clear_tables()
+    rotor.clear_tables()
+
+
+def bench_from_key_sheet(cached):
+    def run():
+        if not cached:
+            clear_caches()
+        RuNigmaMachine.from_key_sheet(**SETTINGS)
+    return run, 1, 'machines'
+
+
+def bench_machines(count):
+    RuNigmaMachine.from_key_sheet(**SETTINGS)
+
+    def run():
+        machines = [RuNigmaMachine.from_key_sheet(**SETTINGS) for _ in range(count)]
+        for machine in machines:
+            machine.set_display(START)
+        return machines
+    return run, count, 'machines'
+
+
+def bench_rotor_init():
+    data = [(name, d['wiring'], d['stepping']) for name, d in sorted(ROTORS.items())]
+
+    def run():
+        clear_caches()
+        for name, wiring, stepping in data:
+            Rotor(name, wiring, 0, stepping)
+    return run, len(data), 'rotors'
+
+
+def bench_plugboard():
+    settings = SETTINGS['plugboard_settings']
+    return lambda: Plugboard.from_key_sheet(settings), 1, 'plugboards'
+
+
+def bench_plugboard_trials():
+    # try every cable change of a plugboard with 10 cables, as a hill-climb
+    # does, and take it back
+    plugboard = Plugboard.from_key_sheet(SETTINGS['plugboard_settings'])
+    trials = [(x, y) for x in range(len(KEYBOARD_CHARS)) for y in range(x + 1, len(KEYBOARD_CHARS))]
+
+    def run():
+        for x, y in trials:
+            with plugboard:
+                plugboard.connect(x, y)
+    return run, len(trials), 'trials'
+
+
+def bench_daily_settings():
+    f = io.StringIO()
+    sheet.write_sheets([f], days=366, seed='bench')
+    text = f.getvalue()
+
+    # the last day is the worst case; the whole file is read
+    return lambda: get_daily_settings(io.StringIO(text), 366), 1, 'lookups'
+
+
+def bench_sheet(days):
+    def run():
+        sheet.write_sheets([io.StringIO()], days=days, seed='bench')
+    return run, days, 'days'
+
+
+def benchmarks(sizes=SIZES):
+    """Return a list of (name, setup) pairs. setup() returns a tuple
+    (run, units, unit): run is the callable timed, units the number of units
+    of work it does per call and unit their name.
+
+    """
+    result = []
+    for size in sizes:
+        result.append(('key_press[%d]' % size, lambda size=size: bench_key_press(size)))
+    for size in sizes:
+        result.append(('process_text[%d]' % size, lambda size=size: bench_process_text(size)))
+    for size in SHORT_SIZES:
+        result.append(('short_messages[%d]' % size, lambda size=size: bench_short_messages(size)))
+    result += [
+        ('from_key_sheet', lambda: bench_from_key_sheet(False)),
+        ('from_key_sheet[cached]', lambda: bench_from_key_sheet(True)),
+        ('machines[10000]', lambda: bench_machines(10000)),
+        ('Rotor.__init__', bench_rotor_init),
+        ('Plugboard.from_key_sheet', bench_plugboard),
+        ('plugboard_trials', bench_plugboard_trials),
+        ('get_daily_settings', bench_daily_settings),
+        ('sheet[366]', lambda: bench_sheet(366)),
+    ]
+    return result
+
+
+def measure(run, units, repeat=3, min_time=MIN_TIME):
+    """Time run and return a dictionary with the best time per call, the
+    throughput in units per second and the peak memory of a single call in
+    bytes, in total and per unit.
+
+    """
+    timer = timeit.Timer(run)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 10
+
+    seconds = min(timer.repeat(repeat, number)) / number
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return dict(seconds=seconds, throughput=units / seconds, peak_memory=peak,
+                memory_per_unit=peak / units)
+
+
+def run_benchmarks(names=None, sizes=SIZES, repeat=3, min_time=MIN_TIME, log=None):
+    """Run the benchmarks and return the results as a dictionary, ready to
+    be saved as JSON.
+
+    names - run only the benchmarks whose name contains one of these strings
+
+    log - a file-like object to report progress to, or None
+
+    """
+    results = {}
+    for name, setup in benchmarks(sizes):
+        if names and not any(n in name for n in names):
+            continue
+
+        run, units, unit = setup()
+        result = measure(run, units, repeat, min_time)
+        result['unit'] = unit
+        results[name] = result
+
+        if log is not None:
+            log.write(format_result(name, result) + '\n')
+            log.flush()
+
+    return dict(version=runigma.__version__,
+                python=platform.python_version(),
+                platform=platform.platform(),
+                time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                results=results)
+
+
+def format_result(name, result):
+    return '%-28s %14.1f %-10s/s %12.1f us %10d bytes %10.1f bytes/%s' % (
+        name, result['throughput'], result['unit'], result['seconds'] * 1e6,
+        result['peak_memory'], result['memory_per_unit'], result['unit'].rstrip('s'))
+
+
+def compare_results(baseline, current, threshold=THRESHOLD):
+    """Compare two result dictionaries from run_benchmarks.
+
+    Returns a list of (name, ratio, regressed) tuples for the benchmarks
+    found in both; ratio is the current throughput over the baseline one and
+    regressed is True if it is below 1 - threshold.
+
+    """
+    comparison = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        ratio = result['throughput'] / baseline['results'][name]['throughput']
+        comparison.append((name, ratio, ratio < 1 - threshold))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='runigma-bench', description=PROG_DESC, epilog=HELP_EPILOG,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help='run only the benchmarks whose name contains NAME')
+    parser.add_argument('-o', '--output',
+                        help='save the results as JSON to this file')
+    parser.add_argument('-c', '--compare', metavar='BASELINE',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD,
+                        help=('flag a throughput drop larger than this fraction'
+                              ' [default: %(default)s]'))
+    parser.add_argument('-s', '--sizes', nargs='+', type=int, default=list(SIZES),
+                        metavar='SIZE',
+                        help='message sizes [default: %(default)s]')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of timed repeats [default: %(default)s]')
+
+    args = parser.parse_args()
+
+    if args.repeat < 1 or any(size < 1 for size in args.sizes):
+        parser.error("Please specify positive sizes and repeats")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args.names, args.sizes, args.repeat, log=sys.stdout)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = 0
+        print()
+        for name, ratio, regressed in compare_results(baseline, results, args.threshold):
+            print('%-28s %6.2fx%s' % (name, ratio, '  REGRESSION' if regressed else ''))
+            regressions += regressed
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
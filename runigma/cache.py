@@ -0,0 +1,101 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains the MachineCache class, a bounded LRU cache of
+RuNigma Machines used by RuNigmaMachine.from_key_sheet.
+
+Building a machine validates the rotor wirings and builds the wiring tables
+of every rotor, which is much more expensive than running a short message
+through it. The cache keeps one prototype machine per key setting and hands
+out copies of it: each copy has its own rotor positions and plugboard, but
+shares the immutable rotor tables with the prototype.
+
+"""
+
+import collections
+import threading
+
+# the default number of key settings kept by MACHINE_CACHE
+CACHE_SIZE = 128
+
+
+class MachineCache:
+    """A bounded least recently used cache of prototype machines.
+
+    hits, misses and evictions count the lookups that found a prototype, the
+    lookups that had to build one and the prototypes dropped to stay within
+    maxsize.
+
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        """maxsize is the number of prototypes kept; 0 disables caching."""
+        self._lock = threading.Lock()
+        self._machines = collections.OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._machines)
+
+    def get(self, key, factory):
+        """Return a fresh copy of the machine cached under key. If there is
+        none, build it by calling factory() and cache it.
+
+        key must be a hashable canonical description of the key settings.
+
+        """
+        with self._lock:
+            machine = self._machines.get(key)
+            if machine is not None:
+                self._machines.move_to_end(key)
+                self.hits += 1
+                return machine.copy()
+            self.misses += 1
+
+        # build outside the lock; a concurrent miss on the same key just
+        # builds the machine twice
+        machine = factory()
+
+        with self._lock:
+            if self.maxsize > 0:
+                self._machines[key] = machine
+                self._machines.move_to_end(key)
+                self._evict()
+
+        return machine.copy()
+
+    def resize(self, maxsize):
+        """Change the number of prototypes kept, evicting the least recently
+        used ones if needed.
+
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Drop all prototypes. The counters keep counting."""
+        with self._lock:
+            self._machines.clear()
+
+    def info(self):
+        """Return the counters, the current size and maxsize as a
+        dictionary.
+
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        size=len(self._machines), maxsize=self.maxsize)
+
+    def _evict(self):
+        while len(self._machines) > max(self.maxsize, 0):
+            self._machines.popitem(last=False)
+            self.evictions += 1
+
+
+# the cache used by RuNigmaMachine.from_key_sheet
+MACHINE_CACHE = MachineCache()
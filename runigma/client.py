@@ -0,0 +1,225 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains an asyncio client for the server module and a load
+generator built on it.
+
+A Client sends requests over one connection without waiting for the earlier
+ones to be answered, and matches the responses to the requests by id.
+
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+
+from .keyfile import random_settings
+from .machine import RuNigmaError, KEYBOARD_CHARS
+from .server import HOST, PORT, MAX_LINE
+
+
+class Client:
+    """A connection to an RuNigmaServer."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count()
+        self._pending = {}
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host=HOST, port=PORT, path=None):
+        """Connect to a server on host and port, or on the Unix socket path
+        if given.
+
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=MAX_LINE)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+        return cls(reader, writer)
+
+    async def process_text(self, text, start, settings=None, day=None, replace_char='_'):
+        """Return the text run through the machine given by settings, a
+        dictionary of from_key_sheet arguments, or by day of the server's key
+        file, starting at the display start.
+
+        Raises RuNigmaError with the message of the server if the request
+        fails.
+
+        """
+        if self._receiver.done():
+            raise RuNigmaError("connection closed")
+
+        request = {'id': next(self._ids), 'start': start, 'text': text,
+                   'replace_char': replace_char}
+        if day is not None:
+            request['day'] = day
+        else:
+            request['settings'] = settings
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request['id']] = future
+        self._writer.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        await self._writer.drain()
+
+        response = await future
+        if 'error' in response:
+            raise RuNigmaError(response['error'])
+        return response['text']
+
+    async def _receive(self):
+        """Hand the responses to the waiting requests."""
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuNigmaError("connection closed"))
+            self._pending.clear()
+
+    async def close(self):
+        """Close the connection."""
+        self._writer.close()
+        try:
+            await self._receiver
+        except (ConnectionError, ValueError):
+            pass
+
+
+async def generate_load(clients, requests, concurrency, size, keys=1, days=None,
+                        large=0.0, large_size=1 << 16, seed=None):
+    """Send requests to the server over the list of clients and return a
+    dictionary with the seconds taken, the sorted latencies of the answered
+    requests and the number of characters and errors.
+
+    concurrency - the number of requests in flight at a time
+
+    size - the number of characters of a request
+
+    keys - the number of different random key settings used, so that the
+    server's cache sees keys distinct keys
+
+    days - if given, a list of days of the server's key file to use instead
+    of random key settings
+
+    large - the fraction of requests of large_size characters
+
+    """
+    rnd = random.Random(seed)
+    settings = [random_settings(rnd) for _ in range(keys)]
+    latencies = []
+    totals = {'characters': 0, 'errors': 0}
+    remaining = iter(range(requests))
+
+    async def worker(client):
+        for _ in remaining:
+            length = large_size if rnd.random() < large else size
+            text = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(length))
+            start = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5))
+
+            t0 = time.perf_counter()
+            try:
+                if days:
+                    result = await client.process_text(text, start, day=rnd.choice(days))
+                else:
+                    result = await client.process_text(text, start, settings=rnd.choice(settings))
+            except RuNigmaError:
+                totals['errors'] += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+            totals['characters'] += len(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(clients[k % len(clients)]) for k in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return dict(totals, seconds=seconds, latencies=latencies)
+
+
+def format_load(result):
+    """Return a report of a generate_load result."""
+
+    latencies = result['latencies']
+    seconds = result['seconds']
+    lines = ['Requests:   %d in %.2f s, %.0f/s, %d errors' % (
+                 len(latencies), seconds, len(latencies) / seconds, result['errors']),
+             'Throughput: %.0f chars/s' % (result['characters'] / seconds)]
+    if latencies:
+        lines.append('Latency:    ' + '  '.join(
+            'p%d %.2f ms' % (p, latencies[min(len(latencies) - 1, len(latencies) * p // 100)]
+                               * 1000)
+            for p in (50, 90, 99)))
+    return '\n'.join(lines)
+
+
+PROG_DESC = 'Generate load on an RuNigma server'
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='runigma-load', description=PROG_DESC)
+    parser.add_argument('--host', default=HOST,
+                        help='server address [default: %(default)s]')
+    parser.add_argument('--port', type=int, default=PORT,
+                        help='server TCP port [default: %(default)s]')
+    parser.add_argument('--unix', help='connect to this Unix socket instead of TCP')
+    parser.add_argument('-n', '--requests', type=int, default=10000,
+                        help='number of requests [default: %(default)s]')
+    parser.add_argument('-c', '--concurrency', type=int, default=64,
+                        help='number of requests in flight [default: %(default)s]')
+    parser.add_argument('--connections', type=int, default=4,
+                        help='number of connections [default: %(default)s]')
+    parser.add_argument('-s', '--size', type=int, default=100,
+                        help='characters per request [default: %(default)s]')
+    parser.add_argument('--keys', type=int, default=8,
+                        help='number of random key settings [default: %(default)s]')
+    parser.add_argument('-d', '--days', type=int, nargs='+', metavar='DAY',
+                        help="use these days of the server's key file instead")
+    parser.add_argument('--large', type=float, default=0.0,
+                        help='fraction of large requests [default: %(default)s]')
+    parser.add_argument('--large-size', type=int, default=1 << 16,
+                        help='characters per large request [default: %(default)s]')
+    parser.add_argument('--seed', help='seed for reproducible requests')
+
+    args = parser.parse_args()
+
+    if min(args.requests, args.concurrency, args.connections, args.size, args.keys) < 1:
+        parser.error("Please specify positive numbers")
+
+    async def run():
+        clients = [await Client.connect(args.host, args.port, args.unix)
+                   for _ in range(args.connections)]
+        try:
+            return await generate_load(clients, args.requests, args.concurrency, args.size,
+                                       args.keys, args.days, args.large, args.large_size,
+                                       args.seed)
+        finally:
+            for client in clients:
+                await client.close()
+
+    print(format_load(asyncio.run(run())))
+
+
+def console_main():
+    try:
+        main()
+    except (IOError, RuNigmaError) as ex:
+        sys.stderr.write("%s\n" % ex)
+
+
+if __name__ == '__main__':
+    console_main()
@@ -0,0 +1,205 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains a reversible encoding of arbitrary bytes as symbols of
+the 70 letter RuNigma keyboard.
+
+Every 3 bytes (24 bits) are packed into 4 base-70 digits (70 ** 4 is about
+2 ** 24.5). A final block of 1 or 2 bytes is packed into 2 or 3 digits. The
+encoded length therefore tells the decoded length, and the encoding expands
+the data by a factor of 4/3.
+
+Digits are handled as wire numbers (0-69) in bytes-like objects, which is the
+form engine.FastEngine.process_keys works on. The Encoder and Decoder classes
+work incrementally on a stream of data.
+
+"""
+
+import time
+
+from .rotors.rotor import ALPHA_LABELS_LEN
+
+
+class CodecError(Exception):
+    pass
+
+
+BASE = ALPHA_LABELS_LEN
+BASE2 = BASE * BASE
+
+# number of digits for a block of 0, 1, 2 or 3 bytes
+BLOCK_DIGITS = (0, 2, 3, 4)
+
+# number of bytes for a block of 0-4 digits; None marks an invalid length
+BLOCK_BYTES = (0, None, 1, 2, 3)
+
+# the two digits of each number below BASE2
+_PAIRS = [bytes(divmod(n, BASE)) for n in range(BASE2)]
+
+
+def encoded_length(n):
+    """Return the number of digits n bytes encode to."""
+    q, r = divmod(n, 3)
+    return 4 * q + BLOCK_DIGITS[r]
+
+
+def decoded_length(n):
+    """Return the number of bytes n digits decode to."""
+    q, r = divmod(n, 4)
+    if BLOCK_BYTES[r] is None:
+        raise CodecError("invalid encoded length %d" % n)
+    return 3 * q + BLOCK_BYTES[r]
+
+
+def encode(data):
+    """Encode a bytes-like object and return the digits as bytes."""
+
+    data = memoryview(data).cast('B')
+    n = len(data) - len(data) % 3
+    pairs = _PAIRS
+
+    # every 3 bytes: one divmod and two table lookups
+    it = iter(data[:n])
+    out = [pairs[hi] + pairs[lo] for hi, lo in
+           (divmod((a << 16) | (b << 8) | c, BASE2) for a, b, c in zip(it, it, it))]
+
+    tail = data[n:]
+    if tail:
+        value = int.from_bytes(tail, 'big')
+        digits = bytearray()
+        for _ in range(BLOCK_DIGITS[len(tail)]):
+            value, d = divmod(value, BASE)
+            digits.append(d)
+        digits.reverse()
+        out.append(bytes(digits))
+
+    return b''.join(out)
+
+
+def decode(digits):
+    """Decode a bytes-like object of digits and return the data as bytes."""
+
+    digits = memoryview(digits).cast('B')
+    decoded_length(len(digits))
+    if max(digits, default=0) >= BASE:
+        raise CodecError("invalid digit")
+
+    n = len(digits) - len(digits) % 4
+
+    try:
+        it = iter(digits[:n])
+        out = b''.join([(((a * BASE + b) * BASE + c) * BASE + d).to_bytes(3, 'big')
+                        for a, b, c, d in zip(it, it, it, it)])
+
+        tail = digits[n:]
+        if tail:
+            value = 0
+            for d in tail:
+                value = value * BASE + d
+            out += value.to_bytes(BLOCK_BYTES[len(tail)], 'big')
+    except OverflowError:
+        raise CodecError("invalid encoded data")
+
+    return out
+
+
+class CodecStats:
+    """Counts the data passed through an encoder or decoder.
+
+    raw - the number of bytes of data
+    encoded - the number of digits
+    seconds - the time spent
+
+    """
+
+    def __init__(self):
+        self.raw = 0
+        self.encoded = 0
+        self.seconds = 0.0
+
+    @property
+    def expansion(self):
+        """Digits per byte of data."""
+        return self.encoded / self.raw if self.raw else 0.0
+
+    @property
+    def throughput(self):
+        """Bytes of data per second."""
+        return self.raw / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return '%d bytes, %d symbols, expansion %.3f, %.0f bytes/s' % (
+            self.raw, self.encoded, self.expansion, self.throughput)
+
+
+class Encoder:
+    """Incrementally encodes a stream of data.
+
+    Call update with each piece of data and final at the end; both return
+    the digits that are ready.
+
+    """
+
+    def __init__(self):
+        self.stats = CodecStats()
+        self._pending = b''
+
+    def update(self, data):
+        start = time.perf_counter()
+
+        data = memoryview(data).cast('B')
+        if self._pending:
+            data = memoryview(self._pending + data)
+
+        n = len(data) - len(data) % 3
+        self._pending = bytes(data[n:])
+        digits = encode(data[:n])
+
+        self.stats.raw += n
+        self.stats.encoded += len(digits)
+        self.stats.seconds += time.perf_counter() - start
+        return digits
+
+    def final(self):
+        digits = encode(self._pending)
+        self.stats.raw += len(self._pending)
+        self.stats.encoded += len(digits)
+        self._pending = b''
+        return digits
+
+
+class Decoder:
+    """Incrementally decodes a stream of digits.
+
+    Call update with each piece of digits and final at the end; both return
+    the data that is ready.
+
+    """
+
+    def __init__(self):
+        self.stats = CodecStats()
+        self._pending = b''
+
+    def update(self, digits):
+        start = time.perf_counter()
+
+        digits = memoryview(digits).cast('B')
+        if self._pending:
+            digits = memoryview(self._pending + digits)
+
+        n = len(digits) - len(digits) % 4
+        self._pending = bytes(digits[n:])
+        data = decode(digits[:n])
+
+        self.stats.raw += len(data)
+        self.stats.encoded += n
+        self.stats.seconds += time.perf_counter() - start
+        return data
+
+    def final(self):
+        data = decode(self._pending)
+        self.stats.raw += len(data)
+        self.stats.encoded += len(self._pending)
+        self._pending = b''
+        return data
@@ -0,0 +1,437 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains the FastEngine class, a compiled form of an
+RuNigmaMachine for processing long messages.
+
+The engine is built from the wiring tables of the machine's rotors and keeps
+the rotor positions as plain integers. A whole message is processed in one
+loop, without the per key method calls of RuNigmaMachine.key_press.
+
+The rotors left of the right-most one only move on notch events, so the
+path through them, the reflector and back is composed into a single table,
+which is rebuilt only when one of them steps. Between those steps a key press
+takes the right-most rotor and one lookup in that table, and the keys are
+processed in runs.
+
+The engine works on machines with any alphabet and number of rotors.
+
+"""
+
+import functools
+from operator import getitem
+
+from .alphabet import RUNIGMA
+from .cache import MachineCache
+from .machine import RuNigmaError
+
+# the number of composite tables of the slow rotors kept by an engine
+COMPOSITE_CACHE_SIZE = 64
+
+# the number of compiled engines kept by compile_machine
+ENGINE_CACHE_SIZE = 64
+
+# the engines of compile_machine by the tables they are compiled from
+ENGINE_CACHE = MachineCache(ENGINE_CACHE_SIZE)
+
+# the tables of translate_tables by the rotor wiring tables they are made of
+_TRANSLATE_TABLES = {}
+
+
+def translate_tables(rotor):
+    """Return the forward and backward rows of a rotor for every position as
+    bytes, followed by the same rows as bytes.translate tables. The tables are
+    shared by all engines with rotors of the same wiring.
+
+    """
+    tables = _TRANSLATE_TABLES.get(rotor.wiring)
+    if tables is None:
+        n = rotor.alphabet.size
+        # the rest of a bytes.translate table after the wire numbers of a row
+        padding = bytes(range(n, 256))
+        forward = bytes(rotor.forward_table)
+        backward = bytes(rotor.backward_table)
+        forward = [forward[p * n:(p + 1) * n] for p in range(n)]
+        backward = [backward[p * n:(p + 1) * n] for p in range(n)]
+        tables = _TRANSLATE_TABLES[rotor.wiring] = (
+            forward, backward, [row + padding for row in forward],
+            [row + padding for row in backward])
+    return tables
+
+
+def clear_tables():
+    """Drop the cached engines and translate tables, so that the next
+    engines are compiled from scratch.
+
+    """
+    ENGINE_CACHE.clear()
+    _TRANSLATE_TABLES.clear()
+
+
+def compose(forward, backward, reflector, *positions):
+    """Return the translate table that takes a wire from the second rotor
+    from the right through the slow rotors left of it at the given positions,
+    from left to right, the reflector and back again. forward and backward
+    are the translate tables of the rotors from left to right, as made by
+    translate_tables; FastEngine wraps the result in the second rotor
+    whenever that one steps.
+
+    """
+    table = reflector
+    for f, b, p in zip(forward, backward, positions):
+        table = f[p].translate(table).translate(b[p])
+    return table
+
+
+def compile_machine(machine):
+    """Return a FastEngine for machine, starting from its current rotor
+    positions.
+
+    Engines are kept in ENGINE_CACHE by the rotor tables, the reflector and
+    the plugboard wiring they are compiled from, so compiling a machine that
+    was compiled before, or a copy of it, only copies the engine. Rewiring
+    the plugboard or changing the rotors gives a new key.
+
+    """
+    rotors = machine.rotors
+    reflector = machine.reflector
+    key = (tuple(r.wiring for r in rotors), tuple(r.ring for r in rotors),
+           reflector.wiring, reflector.pos, bytes(machine.plugboard.wiring_map))
+
+    engine = ENGINE_CACHE.get(key, lambda: FastEngine(machine))
+    engine.machine = machine
+    engine.positions = [r.pos for r in rotors]
+    engine.rotations = [r.rotations for r in rotors]
+    return engine
+
+
+def clean_text(text, replace_char='_', alphabet=RUNIGMA):
+    """Return text with the characters not found on the keyboard, the letters
+    of alphabet, replaced with replace_char, or dropped if replace_char is
+    None. This is what RuNigmaMachine.process_text does before pressing the
+    keys.
+
+    """
+    if replace_char and replace_char not in alphabet.index:
+        if alphabet.invalid.search(text):
+            raise RuNigmaError('illegal key press %s' % replace_char)
+
+    return alphabet.invalid.sub(replace_char or '', text)
+
+
+class FastEngine:
+    """A compiled RuNigma Machine.
+
+    The engine takes a copy of the rotor positions and rotation counts of the
+    machine it is compiled from; the machine itself is left untouched until
+    store() is called. Output is identical to running every character through
+    RuNigmaMachine.key_press.
+
+    """
+
+    def __init__(self, machine):
+        """Compile the machine. The rotors, reflector and plugboard of the
+        machine must not be rewired while the engine is in use.
+
+        """
+        self.machine = machine
+        self.alphabet = machine.alphabet
+        rotors = machine.rotors
+        n = self.alphabet.size
+        padding = self._padding = bytes(range(n, 256))
+
+        # the rows of each rotor, lists indexed by position; each row maps an
+        # input wire to an output wire
+        tables = [translate_tables(r) for r in rotors]
+        self._notches = [r.notch_table for r in rotors]
+        self._next_pos = rotors[-1].ring.next_pos
+
+        # fold the plugboard into the right-most rotor, in both directions.
+        # The list holds its rows twice over, so that the rows for a run of
+        # positions are a slice.
+        plug = bytes(machine.plugboard.wiring_map)
+        plug_table = plug + padding
+        _, backward, forward, _ = tables[-1]
+        self._forward = [plug.translate(row) for row in forward] * 2
+        self._backward = [row.translate(plug_table) for row in backward] * 2
+
+        # the left rotors are composed with bytes.translate
+        self._left_forward = [forward for _, _, forward, _ in tables[:-1]]
+        self._left_backward = [backward for _, _, _, backward in tables[:-1]]
+        self._second = tables[-2][0]
+
+        # the reflector doesn't move; a plaintext pin connects a contact to
+        # itself, so that the signal retraces its path back to the key
+        reflector = machine.reflector
+        self._reflector = bytes(k if plaintext else contact for k, (contact, plaintext) in
+                                enumerate(reflector.signal_in_reflector(k)
+                                          for k in range(n))) + padding
+
+        # the number of key presses, starting with the right-most rotor at
+        # each position, before its notch is over the pawl again; at most a
+        # full turn
+        notches = self._notches[-1]
+        free = [0] * n
+        for p in list(range(n - 1, -1, -1)) * 2:
+            free[p] = 0 if notches[p] else min(n, free[(p + 1) % n] + 1)
+        self._run = [min(n, free[(p + 1) % n] + 1) for p in range(n)]
+
+        # copies of the engine share the cache of composite tables. It holds
+        # the tables, not the engine, so that the engine is freed as soon as
+        # it is dropped
+        self._composite = functools.lru_cache(COMPOSITE_CACHE_SIZE)(
+            functools.partial(compose, self._left_forward, self._left_backward, self._reflector))
+
+        self.positions = [r.pos for r in rotors]
+        self.rotations = [r.rotations for r in rotors]
+
+    def copy(self):
+        """Return an engine with its own rotor positions that shares the
+        compiled tables of this one.
+
+        """
+        engine = FastEngine.__new__(FastEngine)
+        engine.__dict__.update(self.__dict__)
+        engine.positions = list(self.positions)
+        engine.rotations = list(self.rotations)
+        return engine
+
+    def set_positions(self, positions):
+        """Set the internal rotor positions from left to right and reset the
+        rotation counters.
+
+        """
+        if len(positions) != len(self.positions):
+            raise RuNigmaError("Incorrect number of positions")
+
+        self.positions = list(positions)
+        self.rotations = [0] * len(positions)
+
+    def store(self):
+        """Copy the rotor positions and rotation counts back to the machine."""
+
+        for rotor, pos, rotations in zip(self.machine.rotors, self.positions,
+                                         self.rotations):
+            rotor.set_position(pos, rotations)
+
+    def encode(self, text, replace_char='_'):
+        """Return the wire numbers of the characters in text as bytes,
+        replacing or dropping characters not on the keyboard as
+        RuNigmaMachine.process_text does.
+
+        """
+        alphabet = self.alphabet
+        return clean_text(text, replace_char, alphabet).translate(
+            alphabet.to_wire).encode('latin-1')
+
+    def decode(self, keys):
+        """Return the characters for a bytes-like object of wire numbers as a
+        string.
+
+        """
+        return self.alphabet.decode(keys)
+
+    def process_text(self, text, replace_char='_'):
+        """Run the text through the engine. The arguments and result are the
+        same as for RuNigmaMachine.process_text.
+
+        """
+        return self.decode(self.process_keys(self.encode(text, replace_char)))
+
+    def process_keys(self, keys):
+        """Run a bytes-like object of wire numbers (0-69 on the RuNigma
+        keyboard) through the engine and return a bytearray of lamp numbers.
+
+        """
+        F1 = self._forward
+        B1 = self._backward
+
+        buf = bytearray(len(keys))
+        runs = self._runs(len(keys))
+        try:
+            for i, end, p1, table, _, _ in runs:
+                last = p1 + 1 + end - i
+                buf[i:end] = [b1[table[f1[k]]] for k, f1, b1 in
+                              zip(keys[i:end], F1[p1 + 1:last], B1[p1 + 1:last])]
+        finally:
+            runs.close()
+
+        return buf
+
+    def permutations(self, count):
+        """Yield the substitution made by each of the next count key presses
+        as bytes: byte k is the lamp lit by key k, through the plugboard, the
+        rotors and the reflector, or k itself for a plaintext pin.
+
+        The engine is advanced by the key presses yielded so far if the
+        iteration is stopped early.
+
+        """
+        # the rows of the right-most rotor on the way back as translate tables
+        padding = self._padding
+        F1 = self._forward
+        B1 = [row + padding for row in self._backward]
+
+        done = 0
+        runs = self._runs(count)
+        try:
+            for i, end, p1, table, _, _ in runs:
+                last = p1 + 1 + end - i
+                table += padding
+                for f1, b1 in zip(F1[p1 + 1:last], B1[p1 + 1:last]):
+                    done += 1
+                    yield f1.translate(table).translate(b1)
+                done = 0
+        finally:
+            runs.close()
+            if done:
+                # stopped in the middle of a run, which the right-most rotor
+                # is the only one to move in
+                self.positions[-1] = (self.positions[-1] + done) % len(self._next_pos)
+                self.rotations[-1] += done
+
+    def fill_permutations(self, buffer, positions=None):
+        """Fill buffer with the substitutions of the next key presses, as
+        yielded by permutations, and return the number of key presses.
+
+        buffer - a writable buffer of unsigned bytes, such as an array('B'),
+        a bytearray or a C-contiguous NumPy uint8 array of shape (count, n)
+        for an alphabet of n letters. Each row of n bytes is filled with the
+        substitution of one key press.
+
+        positions - an optional buffer of the same kind for count rows of
+        one byte per rotor, such as a NumPy uint8 array of shape (count, 5),
+        which is filled with the internal rotor positions, from left to
+        right, at each key press
+
+        """
+        n = len(self._next_pos)
+        view = _byte_view(buffer)
+        if len(view) % n:
+            raise RuNigmaError("buffer size is not a multiple of %d" % n)
+        count = len(view) // n
+
+        m = len(self.positions)
+        if positions is not None:
+            positions = _byte_view(positions)
+            if len(positions) != count * m:
+                raise RuNigmaError("positions buffer size is not %d" % (count * m))
+
+        # the positions of the right-most rotor over two turns
+        turns = bytes(range(n)) * 2
+
+        # the rows of the right-most rotor on the way back as translate tables
+        padding = self._padding
+        F1 = self._forward
+        B1 = [row + padding for row in self._backward]
+
+        runs = self._runs(count)
+        try:
+            for i, end, p1, table, slow, p2 in runs:
+                last = p1 + 1 + end - i
+                table += padding
+                k = i * n
+                for f1, b1 in zip(F1[p1 + 1:last], B1[p1 + 1:last]):
+                    view[k:k + n] = f1.translate(table).translate(b1)
+                    k += n
+
+                # one strided column per rotor
+                if positions is not None:
+                    for j, p in enumerate(slow + [p2]):
+                        positions[i * m + j:end * m:m] = bytes((p,)) * (end - i)
+                    positions[i * m + m - 1:end * m:m] = turns[p1 + 1:last]
+        finally:
+            runs.close()
+
+        return count
+
+    def _runs(self, size):
+        """Step the engine through size key presses, a run at a time, and
+        yield a tuple (start, end, pos, table, slow, second) for every run of
+        key presses start to end - 1:
+
+        pos - the position of the right-most rotor before the run; it is at
+        position pos + 1 + t - start at key press t, for the rows of
+        _forward and _backward
+
+        table - the translate table from the right-most rotor through the
+        others and back again, for the whole run
+
+        slow, second - the positions of the rotors other than the right-most
+        one during the run, a list from left to right that must not be
+        changed, and of the second rotor from the right
+
+        The engine is advanced once the run is done with, when the next one
+        is asked for or the generator is closed.
+
+        """
+        inc = self._next_pos
+        n = len(inc)
+        composite = self._composite
+        run = self._run
+
+        # the right-most rotor, the second rotor from the right, and the slow
+        # rotors left of it, which are kept in lists from left to right
+        *slow_notches, N2, N1 = self._notches
+        *slow, p2, p1 = self.positions
+        *counts, c2, c1 = self.rotations
+        order = range(len(slow) - 1, -1, -1)
+
+        F2 = self._second
+        B2 = self._left_backward[-1]
+
+        # the path from the right-most rotor through the others and back,
+        # built around the path through the slow rotors
+        inner = composite(*slow)
+        table = F2[p2].translate(inner).translate(B2[p2])
+
+        # True if the second or any of the slow rotors has a notch over its
+        # pawl; only then can a rotor other than the two right-most ones move
+        notched = N2[p2] or any(map(getitem, slow_notches, slow))
+
+        i = 0
+        try:
+            while i < size:
+                # step the rotors; see RuNigmaMachine._step_rotors
+                n1 = N1[p1]
+                if n1 or notched:
+                    if notched:
+                        right = n2 = N2[p2]
+                        for k in order:
+                            p = slow[k]
+                            notch = slow_notches[k][p]
+                            if right or notch:
+                                slow[k] = inc[p]
+                                counts[k] += 1
+                            right = notch
+                        inner = composite(*slow)
+                        if n1 or n2:
+                            p2 = inc[p2]
+                            c2 += 1
+                        notched = N2[p2] or any(map(getitem, slow_notches, slow))
+                    else:
+                        # only the second rotor is pushed along
+                        p2 = inc[p2]
+                        c2 += 1
+                        notched = N2[p2]
+                    table = F2[p2].translate(inner).translate(B2[p2])
+
+                # the right-most rotor moves at every key press, and the others
+                # stay put until its notch comes round unless one of them has
+                # a notch over its pawl
+                end = min(size, i + 1 if notched else i + run[p1])
+                yield i, end, p1, table, slow, p2
+                p1 = (p1 + end - i) % n
+                i = end
+        finally:
+            self.positions = slow + [p2, p1]
+            self.rotations = counts + [c2, c1 + i]
+
+
+def _byte_view(buffer):
+    """Return a flat writable memoryview of a buffer of unsigned bytes."""
+    view = memoryview(buffer)
+    if view.readonly or view.format != 'B':
+        raise RuNigmaError("need a writable buffer of unsigned bytes")
+    return view.cast('B')
@@ -0,0 +1,210 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains the instrumented code path of RuNigmaMachine.
+
+RuNigmaMachine.instrument switches the class of the machine to
+InstrumentedMachine, whose key_press and process_text methods call the
+functions built here. A machine that is not instrumented therefore runs the
+normal methods and engines without any check for instrumentation; an
+instrumented one presses every key through the slower, counting path below.
+
+"""
+
+import time
+
+from .engine import clean_text
+from .machine import RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS_LEN
+
+# the stages of a key press, in order
+STAGES = ('stepping', 'plugboard', 'rotors', 'reflector', 'return')
+
+# by default the stages of one key press in SAMPLE_RATE are timed
+SAMPLE_RATE = 100
+
+
+class MachineStats:
+    """Counters collected by an instrumented machine.
+
+    key_presses - the number of keys pressed
+
+    seconds - the time spent processing them
+
+    steps - for each rotor from left to right, a list counting the steps
+    taken from each internal position
+
+    double_steps - for each rotor, the number of steps caused by its own
+    notch rather than by the notch of the rotor to its right
+
+    samples - the number of key presses whose stages were timed
+
+    stage_seconds - a dictionary of the time spent in each of STAGES over the
+    sampled key presses
+
+    """
+
+    def __init__(self, rotors=5, size=KEYBOARD_CHARS_LEN):
+        """Start the counters for a machine with the given number of rotors
+        and of letters in its alphabet.
+
+        """
+        self.key_presses = 0
+        self.seconds = 0.0
+        self.steps = [[0] * size for _ in range(rotors)]
+        self.double_steps = [0] * rotors
+        self.samples = 0
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+
+    @property
+    def throughput(self):
+        """Key presses per second."""
+        return self.key_presses / self.seconds if self.seconds else 0.0
+
+    def stage_breakdown(self):
+        """Return the share of each stage in the sampled time as a
+        dictionary.
+
+        """
+        total = sum(self.stage_seconds.values())
+        return {stage: (t / total if total else 0.0) for stage, t in self.stage_seconds.items()}
+
+    def __str__(self):
+        lines = ['Key presses:  %d' % self.key_presses,
+                 'Throughput:   %.0f chars/s' % self.throughput,
+                 'Rotor steps:  %s' % ' '.join(str(sum(s)) for s in self.steps),
+                 'Double steps: %s' % ' '.join(str(n) for n in self.double_steps)]
+        if self.samples:
+            lines.append('Stages (%d samples): %s' % (self.samples, '  '.join(
+                '%s %.1f%%' % (stage, share * 100)
+                for stage, share in self.stage_breakdown().items())))
+        return '\n'.join(lines)
+
+
+def instrument(machine, stats, sample_rate=SAMPLE_RATE, trace=None):
+    """Return instrumented key_press and process_text functions for machine.
+
+    stats - the MachineStats to update
+
+    sample_rate - time the stages of one key press in sample_rate; 0 turns
+    stage timing off
+
+    trace - None or a callable called after each key press with the key,
+    the rotor positions before stepping and the signal path: a list of the
+    wire numbers after the plugboard, after each rotor from right to left,
+    after the reflector and after each rotor from left to right, ending with
+    the lamp. The path stops at the reflector when a plaintext pin is hit.
+
+    """
+    rotors = machine.rotors
+    reversed_rotors = rotors[::-1]
+    last = len(rotors) - 1
+    chars = machine.alphabet.chars
+    index = machine.alphabet.index
+    reflector = machine.reflector
+    steps = stats.steps
+    double_steps = stats.double_steps
+    stage_seconds = stats.stage_seconds
+    clock = time.perf_counter
+    countdown = [sample_rate]
+
+    def step():
+        notched = [r.notch_over_pawl() for r in rotors]
+        for i, rotor in enumerate(rotors):
+            if i == last or notched[i + 1] or notched[i]:
+                steps[i][rotor.pos] += 1
+                if i < last and not notched[i + 1]:
+                    double_steps[i] += 1
+                rotor.rotate()
+
+    def press(signal_num):
+        if trace is not None:
+            positions = [r.pos for r in rotors]
+
+        countdown[0] -= 1
+        sampled = countdown[0] == 0
+        if sampled:
+            countdown[0] = sample_rate
+            stats.samples += 1
+            t0 = clock()
+
+        step()
+        if sampled:
+            t1 = clock()
+
+        # the plugboard may be swapped, as by restore_state, after instrument
+        plugboard = machine.plugboard
+        path = [plugboard.signal(signal_num)]
+        if sampled:
+            t2 = clock()
+
+        for rotor in reversed_rotors:
+            path.append(rotor.signal_in(path[-1]))
+        if sampled:
+            t3 = clock()
+
+        contact, plaintext = reflector.signal_in_reflector(path[-1])
+        path.append(contact)
+        if sampled:
+            t4 = clock()
+
+        if plaintext:
+            lamp = signal_num
+        else:
+            for rotor in rotors:
+                path.append(rotor.signal_out(path[-1]))
+            lamp = plugboard.signal(path[-1])
+            path.append(lamp)
+
+        if sampled:
+            t5 = clock()
+            stage_seconds['stepping'] += t1 - t0
+            stage_seconds['plugboard'] += t2 - t1
+            stage_seconds['rotors'] += t3 - t2
+            stage_seconds['reflector'] += t4 - t3
+            stage_seconds['return'] += t5 - t4
+
+        if trace is not None:
+            trace(chars[signal_num], positions, path)
+
+        return lamp
+
+    def key_press(key):
+        signal_num = index.get(key)
+        if signal_num is None:
+            raise RuNigmaError('illegal key press %s' % key)
+
+        start = clock()
+        lamp = press(signal_num)
+        stats.seconds += clock() - start
+        stats.key_presses += 1
+        return chars[lamp]
+
+    def process_text(text, replace_char='_'):
+        text = clean_text(text, replace_char, machine.alphabet)
+
+        start = clock()
+        result = ''.join([chars[press(index[c])] for c in text])
+        stats.seconds += clock() - start
+        stats.key_presses += len(text)
+        return result
+
+    if sample_rate <= 0:
+        countdown[0] = -1
+
+    return key_press, process_text
+
+
+class InstrumentedMachine(RuNigmaMachine):
+    """The class of an instrumented machine; see RuNigmaMachine.instrument.
+    The instrumented functions are kept in the _instrument slot.
+
+    """
+
+    __slots__ = ()
+
+    def key_press(self, key):
+        return self._instrument[0](key)
+
+    def process_text(self, text, replace_char='_'):
+        return self._instrument[1](text, replace_char)
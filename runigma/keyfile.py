@@ -25,7 +25,10 @@ reflector - the last column must be the reflector name.
 Comment lines have a # character in the first column. Blank lines are ignored.
 
 """
-import datetime
+import time
+
+from .rotors.data import ROTORS, REFLECTORS
+from .rotors.rotor import ALPHA_LABELS
 
 
 class KeyFileError(Exception):
@@ -44,7 +47,7 @@ def get_daily_settings(fp, day=None):
 
     """
     if day is None:
-        day = datetime.date.today().timetuple().tm_yday
+        day = time.localtime().tm_yday
 
     for n, line in enumerate(fp):
         line = line.strip()
@@ -74,3 +77,267 @@ def get_daily_settings(fp, day=None):
 
     else:
         raise KeyFileError('no entry for day %d found' % day)
+
+
+LABELS_SET = set(ALPHA_LABELS)
+
+# the number of columns of a key file line: day, 5 rotors, 5 rings, 0-20
+# plugboard pairs and the reflector
+MIN_COLUMNS = 12
+MAX_COLUMNS = 32
+
+
+def parse_line(line):
+    """Parse a key file line that is not blank or a comment.
+
+    Returns a tuple (day, settings), where settings is a dictionary of keyword
+    arguments for RuNigmaMachine.from_key_sheet. A KeyFileError is raised if
+    the line is malformed.
+
+    """
+    cols = line.split()
+    if not (MIN_COLUMNS <= len(cols) <= MAX_COLUMNS):
+        raise KeyFileError("invalid column count")
+
+    try:
+        day = int(cols[0])
+    except ValueError:
+        raise KeyFileError("invalid day")
+    if not (1 <= day <= 366):
+        raise KeyFileError("invalid day %d" % day)
+
+    for rotor in cols[1:6]:
+        if rotor not in ROTORS:
+            raise KeyFileError("unknown rotor %s" % rotor)
+    if len(set(cols[1:6])) != 5:
+        raise KeyFileError("duplicate rotor")
+
+    for ring in cols[6:11]:
+        if ring not in LABELS_SET:
+            raise KeyFileError("invalid ring setting %s" % ring)
+
+    plugs = ''.join(cols[11:-1])
+    for pair in cols[11:-1]:
+        if len(pair) != 2 or not set(pair) <= LABELS_SET:
+            raise KeyFileError("invalid plugboard pair %s" % pair)
+    if len(set(plugs)) != len(plugs):
+        raise KeyFileError("duplicate plugboard connection")
+
+    if cols[-1] not in REFLECTORS:
+        raise KeyFileError("unknown reflector %s" % cols[-1])
+
+    settings = dict()
+    settings['rotors'] = cols[1:6]
+    settings['ring_settings'] = ' '.join(cols[6:11])
+    settings['plugboard_settings'] = ' '.join(cols[11:-1])
+    settings['reflector'] = cols[-1]
+    return day, settings
+
+
+def random_settings(rnd):
+    """Return random settings in the form parse_line returns them, ready to
+    be passed to RuNigmaMachine.from_key_sheet.
+
+    rnd - a random.Random instance
+
+    """
+    chars = rnd.sample(ALPHA_LABELS, 40)
+    return dict(rotors=rnd.sample(sorted(ROTORS), 5),
+                reflector=rnd.choice(sorted(REFLECTORS)),
+                ring_settings=' '.join(rnd.choice(ALPHA_LABELS) for _ in range(5)),
+                plugboard_settings=' '.join(a + b for a, b in zip(chars[::2], chars[1::2])))
+
+
+class KeySheet:
+    """A key file parsed into a day-indexed structure.
+
+    Lookups by day are dictionary lookups, and the machine for a day is built
+    once and cached; machine() hands out independent copies of it.
+
+    A key sheet is either parsed and validated in full with from_file, or
+    opened with open_mmap, which only indexes the lines by day and parses a
+    line when its day is first looked up. The latter suits large archives of
+    sheets.
+
+    """
+
+    def __init__(self):
+        self._lines = {}        # day -> line, as str or (start, end) offsets
+        self._settings = {}     # day -> parsed settings
+        self._machines = {}     # day -> prototype machine
+        self._mmap = None
+
+    @classmethod
+    def from_file(cls, fp):
+        """Read, parse and validate every line of a key file.
+
+        fp - a file-like object
+
+        If any line is invalid, a KeyFileError listing every bad line is
+        raised; its errors attribute holds (line number, message) pairs.
+
+        """
+        sheet = cls()
+        errors = []
+        for n, line in enumerate(fp, 1):
+            line = line.strip()
+            if line == '' or line[0] == '#':
+                continue
+
+            try:
+                day, settings = parse_line(line)
+            except KeyFileError as ex:
+                errors.append((n, str(ex)))
+                continue
+
+            if day in sheet._settings:
+                errors.append((n, "duplicate day %d" % day))
+                continue
+
+            sheet._lines[day] = line
+            sheet._settings[day] = settings
+
+        if errors:
+            ex = KeyFileError('\n'.join('line %d: %s' % e for e in errors))
+            ex.errors = errors
+            raise ex
+
+        return sheet
+
+    @classmethod
+    def open_mmap(cls, path):
+        """Memory map the key file at path and index its lines by day.
+
+        Only the day column is read now; the rest of a line is parsed when
+        its day is first looked up. Call validate to check every line, and
+        close when done.
+
+        If any day column is invalid or repeated, a KeyFileError listing every
+        bad line is raised as by from_file.
+
+        """
+        import mmap
+
+        sheet = cls()
+        with open(path, 'rb') as f:
+            try:
+                sheet._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:      # empty file
+                return sheet
+
+        data = sheet._mmap
+        errors = []
+        start = 0
+        n = 0
+        while start < len(data):
+            n += 1
+            end = data.find(b'\n', start)
+            if end < 0:
+                end = len(data)
+
+            cols = data[start:end].split(None, 1)
+            if cols and not cols[0].startswith(b'#'):
+                try:
+                    day = int(cols[0])
+                except ValueError:
+                    errors.append((n, "invalid day"))
+                else:
+                    if day in sheet._lines:
+                        errors.append((n, "duplicate day %d" % day))
+                    else:
+                        sheet._lines[day] = (start, end)
+
+            start = end + 1
+
+        if errors:
+            sheet.close()
+            ex = KeyFileError('\n'.join('line %d: %s' % e for e in errors))
+            ex.errors = errors
+            raise ex
+
+        return sheet
+
+    def close(self):
+        """Release the memory map, if any."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __contains__(self, day):
+        return day in self._lines
+
+    def days(self):
+        """Return the sorted list of day numbers in the sheet."""
+        return sorted(self._lines)
+
+    def validate(self):
+        """Parse every line not parsed yet. A KeyFileError listing every bad
+        day is raised if any line is invalid.
+
+        """
+        errors = []
+        for day in self.days():
+            try:
+                self._parse(day)
+            except KeyFileError as ex:
+                errors.append((day, str(ex)))
+
+        if errors:
+            ex = KeyFileError('\n'.join('day %d: %s' % e for e in errors))
+            ex.errors = errors
+            raise ex
+
+    def _parse(self, day):
+        settings = self._settings.get(day)
+        if settings is None:
+            line = self._lines[day]
+            if not isinstance(line, str):
+                start, end = line
+                line = self._mmap[start:end].decode('utf-8')
+            settings = parse_line(line)[1]
+            self._settings[day] = settings
+        return settings
+
+    def settings(self, day=None):
+        """Return the settings for day as a dictionary of keyword arguments for
+        RuNigmaMachine.from_key_sheet. If day is None, the day number from
+        today is used.
+
+        """
+        if day is None:
+            day = time.localtime().tm_yday
+
+        if day not in self._lines:
+            raise KeyFileError('no entry for day %d found' % day)
+
+        settings = dict(self._parse(day))
+        settings['rotors'] = list(settings['rotors'])
+        return settings
+
+    def machine(self, day=None):
+        """Return an RuNigmaMachine for day; if day is None, the day number
+        from today is used.
+
+        The machine for a day is built on the first call and copies of it are
+        returned afterwards.
+
+        """
+        if day is None:
+            day = time.localtime().tm_yday
+
+        machine = self._machines.get(day)
+        if machine is None:
+            from .machine import RuNigmaMachine
+            machine = RuNigmaMachine.from_key_sheet(**self.settings(day))
+            self._machines[day] = machine
+
+        return machine.copy()
@@ -7,45 +7,84 @@
 simulation.
 
 """
-import string
+import collections
+import time
 
+from .alphabet import RUNIGMA
+from .cache import MACHINE_CACHE
 from .rotors.factory import create_rotor, create_reflector
 from .plugboard import Plugboard
 from .keyfile import get_daily_settings
+from .stepping import Schedule
 
 
 class RuNigmaError(Exception):
     pass
 
-# The RuNigma keyboard consists of the 70 letters of the alphabet, uppercase
-# only:
-KEYBOARD_CHARS = 'abcdefghijklmnopqrstuvwxyzАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ0123456789_'
-KEYBOARD_CHARS_LEN = len(KEYBOARD_CHARS)
+# The RuNigma keyboard consists of the 70 letters of the alphabet; machines
+# built from rotors with another alphabet have a keyboard of its letters
+KEYBOARD_CHARS = RUNIGMA.chars
+KEYBOARD_CHARS_LEN = RUNIGMA.size
 KEYBOARD_SET = set(KEYBOARD_CHARS)
+KEYBOARD_INDEX = RUNIGMA.index
+
+# the state of a machine returned by RuNigmaMachine.snapshot: tuples of the
+# internal rotor positions and rotation counts from left to right, and the
+# plugboard in use
+MachineState = collections.namedtuple('MachineState', 'positions rotations plugboard')
+
+# process_text hands texts at least this long to the NumPy backed engine, if
+# NumPy is installed
+VECTORIZE_THRESHOLD = 1 << 16
+
+# process_text presses the keys one at a time for texts shorter than this,
+# which is quicker than setting up a compiled engine
+KEY_PRESS_THRESHOLD = 6
 
 
 class RuNigmaMachine:
     """Top-level class for the RuNigma Machine."""
 
+    # a machine only holds references to its parts and a few positions, so
+    # that many live machines stay small
+    __slots__ = ('rotors', 'reflector', 'plugboard', 'alphabet', '_origin', '_schedule',
+                 '_instrument')
+
     def __init__(self, rotors, reflector, plugboard):
         """Configures the RuNigma Machine. Parameters are as follows:
 
-        rotors - a list containing 5 Rotor objects. The order of the list
-        is important. The first rotor is the left-most rotor, and the last
-        rotor is the right-most (from the operator's perspective sitting at
-        the machine).
+        rotors - a list containing at least 2 Rotor objects; the RuNigma
+        Machine has 5. The order of the list is important. The first rotor
+        is the left-most rotor, and the last rotor is the right-most (from
+        the operator's perspective sitting at the machine).
 
         reflector - a rotor object to represent the reflector
 
         plugboard - a plugboard object to represent the state of the plugboard
 
+        The rotors, the reflector and the plugboard must have the same
+        alphabet, which is the keyboard of the machine.
+
         """
-        if len(rotors) != 5:
-            raise RuNigmaError("Must supply 5 rotors")
+        if len(rotors) < 2:
+            raise RuNigmaError("Must supply at least 2 rotors")
+
+        alphabet = reflector.alphabet
+        if plugboard.alphabet != alphabet or any(r.alphabet != alphabet for r in rotors):
+            raise RuNigmaError("The rotors, reflector and plugboard must share an alphabet")
 
         self.rotors = rotors
         self.reflector = reflector
         self.plugboard = plugboard
+        self.alphabet = alphabet
+
+        # the rotor positions at the last set_display and their stepping
+        # schedule, for seek
+        self._origin = tuple(r.pos for r in rotors)
+        self._schedule = None
+
+        # see instrument
+        self._instrument = None
 
     @classmethod
     def from_key_sheet(cls, rotors='А Б В Г Д', ring_settings=None,
@@ -57,6 +96,7 @@ class RuNigmaMachine:
         rotors: either a list of strings naming the rotors from left to right
         or a single string:
             e.g. ["A", "Б", "В", "Г", "Д"] or "А Б В Г Д"
+        The RuNigma Machine has 5 rotors, but any number from 2 on works.
 
         ring_settings: either a list/tuple of integers, a string, or None to
         represent the ring settings to be applied to the rotors in the rotors
@@ -71,31 +111,92 @@ class RuNigmaMachine:
         on a key sheet; e.g. 'АБ ВГ ЕЖ ЗИ КЛ МН ОП РС ТУ ФХ'. A value of None means
         no plugboard connections are made.
 
+        Machines are built through cache.MACHINE_CACHE, so building a machine
+        for settings seen recently only copies the rotor positions and the
+        plugboard; the rotor tables are shared.
+
         """
         # validate inputs
         if isinstance(rotors, str):
             rotors = rotors.split()
 
-        if len(rotors) != 5:
+        if len(rotors) < 2:
             raise RuNigmaError("invalid rotors list size")
 
         if ring_settings is None:
-            ring_settings = [0] * 5
+            ring_settings = [0] * len(rotors)
         else:
             strings = ring_settings.split()
             ring_settings = []
             for s in strings:
-                ring_settings.append(KEYBOARD_CHARS.index(s))
+                if s not in KEYBOARD_INDEX:
+                    raise RuNigmaError("invalid ring setting %s" % s)
+                ring_settings.append(KEYBOARD_INDEX[s])
 
-        if len(ring_settings) != 5:
+        if len(ring_settings) != len(rotors):
             raise RuNigmaError("invalid ring list size")
 
         # assemble the machine
-        rotor_list = [create_rotor(r[0], r[1]) for r in zip(rotors, ring_settings)]
+        def build():
+            rotor_list = [create_rotor(r[0], r[1]) for r in zip(rotors, ring_settings)]
+
+            return cls(rotor_list,
+                       create_reflector(reflector),
+                       Plugboard.from_key_sheet(plugboard_settings))
+
+        # the order of the plugboard pairs and of the plugs within a pair
+        # doesn't matter
+        plugs = tuple(sorted(''.join(sorted(p)) for p in (plugboard_settings or '').split()))
+        key = (cls, tuple(rotors), tuple(ring_settings), reflector, plugs)
 
-        return cls(rotor_list, 
-                   create_reflector(reflector),
-                   Plugboard.from_key_sheet(plugboard_settings))
+        return MACHINE_CACHE.get(key, build)
+
+    def copy(self):
+        """Return a machine with the same settings and rotor positions as this
+        one. The rotor tables and the reflector, which never moves, are
+        shared; the rotor positions and the plugboard are independent.
+
+        """
+        machine = self._plain_class()([r.copy() for r in self.rotors],
+                                      self.reflector,
+                                      self.plugboard.copy())
+        machine._origin = self._origin
+        machine._schedule = self._schedule
+        return machine
+
+    def snapshot(self):
+        """Return the state of the machine as a MachineState.
+
+        The plugboard is not copied: the state refers to the plugboard object
+        of the machine, so changes made to it later are not undone by
+        restore. Use the plugboard as a context manager for that.
+
+        """
+        return MachineState(tuple(r.pos for r in self.rotors),
+                            tuple(r.rotations for r in self.rotors),
+                            self.plugboard)
+
+    def restore(self, state):
+        """Put the machine back in a state returned by snapshot, of this
+        machine or of one with the same rotors and reflector.
+
+        """
+        for rotor, pos, rotations in zip(self.rotors, state.positions, state.rotations):
+            rotor.set_position(pos, rotations)
+        self.plugboard = state.plugboard
+
+    def __reduce__(self):
+        # pickle the key settings and the state only; the rotor tables are
+        # rebuilt, or found in MACHINE_CACHE, when unpickling. Like
+        # get_settings, this only works for rotors from rotors.data
+        return (_unpickle_machine, (self._plain_class(), self.get_settings(),
+                                    tuple(r.pos for r in self.rotors),
+                                    tuple(r.rotations for r in self.rotors),
+                                    self._origin))
+
+    def _plain_class(self):
+        """Return the class of the machine when it is not instrumented."""
+        return self.__class__ if self._instrument is None else self._instrument[2]
 
     @classmethod
     def from_key_file(cls, fp, day=None):
@@ -106,12 +207,28 @@ class RuNigmaMachine:
         settings. If day is None, the day number will be determined from today's
         date. 
 
-        For more information on the file format, see keyfile.py.
+        For more information on the file format, see keyfile.py. To build
+        machines for many days from the same file, use keyfile.KeySheet, which
+        parses the file only once.
 
         """
         args = get_daily_settings(fp, day)
         return cls.from_key_sheet(**args)
 
+    def get_settings(self):
+        """Return the key settings of the machine as a dictionary of string
+        keyword arguments for from_key_sheet.
+
+        The rotors and reflector are identified by their model names, so this
+        only describes machines built from the rotors in rotors.data.
+
+        """
+        return dict(rotors=' '.join(r.name for r in self.rotors),
+                    ring_settings=' '.join(self.alphabet.chars[r.ring_setting]
+                                           for r in self.rotors),
+                    reflector=self.reflector.name,
+                    plugboard_settings=self.plugboard.army_str())
+
     def set_display(self, val):
         """Sets the rotor operator windows to 'val'.
 
@@ -119,17 +236,57 @@ class RuNigmaMachine:
         from left to right.
 
         """
-        if len(val) != 5:
+        if len(val) != len(self.rotors):
             raise RuNigmaError("Incorrect length for display value")
 
         for i, rotor in enumerate(reversed(self.rotors)):
             rotor.set_display(val[-1 - i])
 
+        origin = tuple(r.pos for r in self.rotors)
+        if origin != self._origin:
+            self._origin = origin
+            self._schedule = None
+
     def get_display(self):
         """Returns the operator display as a string."""
         
         return ''.join([r.get_display() for r in self.rotors])
 
+    def advance(self, n):
+        """Step the rotors as if n keys were pressed, without pressing them.
+
+        The stepping schedule is computed from the notch positions of the
+        rotors, so the cost does not depend on n. The rotor rotation counts are
+        updated as well.
+
+        """
+        if n < 0:
+            raise RuNigmaError("cannot advance by a negative number of keys")
+
+        positions, steps = Schedule([r.pos for r in self.rotors],
+                                    [r.notch_table for r in self.rotors]).after(n)
+        for rotor, pos, count in zip(self.rotors, positions, steps):
+            rotor.set_position(pos, rotor.rotations + count)
+
+    def seek(self, n):
+        """Put the rotors in the state they reach after n key presses from
+        the display last set with set_display.
+
+        This allows processing a slice of a long message, starting at
+        character n, without processing the characters before it. The rotor
+        rotation counts are set to the counts after n key presses.
+
+        """
+        if n < 0:
+            raise RuNigmaError("cannot seek to a negative position")
+
+        if self._schedule is None:
+            self._schedule = Schedule(self._origin, [r.notch_table for r in self.rotors])
+
+        positions, steps = self._schedule.after(n)
+        for rotor, pos, count in zip(self.rotors, positions, steps):
+            rotor.set_position(pos, count)
+
     def key_press(self, key):
         """Simulate a front panel key press. 
 
@@ -141,16 +298,16 @@ class RuNigmaMachine:
         The lamp that is lit by this key press is returned as a string.
 
         """
-        if key not in KEYBOARD_SET:
+        signal_num = self.alphabet.index.get(key)
+        if signal_num is None:
             raise RuNigmaError('illegal key press %s' % key)
 
         # simulate the mechanical action of the machine
         self._step_rotors()
 
         # simulate the electrical operations:
-        signal_num = KEYBOARD_CHARS.index(key)
         lamp_num = self._electric_signal(signal_num)
-        return KEYBOARD_CHARS[lamp_num]
+        return self.alphabet.chars[lamp_num]
 
     def _step_rotors(self):
         """Simulate the mechanical action of pressing a key."""
@@ -158,42 +315,31 @@ class RuNigmaMachine:
         # The right-most rotor's right-side ratchet is always over a pawl, and
         # it has no neighbor to the right, so it always rotates.
         #
-        # The middle rotors will rotate if either:
-        #   1) The right rotor's left side notch is over the 2nd pawl
+        # The other rotors will rotate if either:
+        #   1) The rotor to the right has a left-side notch over the pawl
         #       or
-        #   2) It has a left-side notch over the 3rd pawl
+        #   2) It has a left-side notch over its own pawl
         #
-        # The fifth rotor (from the right) will rotate only if the fourth rotor
-        # has a left-side notch over the 3rd pawl.
-
-        rotor1 = self.rotors[-1]
-        rotor2 = self.rotors[-2]
-        rotor3 = self.rotors[-3]
-        rotor4 = self.rotors[-4]
-        rotor5 = self.rotors[-5]
-
-        # decide which rotors can move
-        rotate2 = rotor1.notch_over_pawl() or rotor2.notch_over_pawl()
-        rotate3 = rotor2.notch_over_pawl() or rotor3.notch_over_pawl()
-        rotate4 = rotor3.notch_over_pawl() or rotor4.notch_over_pawl()
-        rotate5 = rotor4.notch_over_pawl() or rotor5.notch_over_pawl()
-
-        # move rotors
-        rotor1.rotate()
-        if rotate2:
-            rotor2.rotate()
-        if rotate3:
-            rotor3.rotate()
-        if rotate4:
-            rotor4.rotate()
-        if rotate5:
-            rotor5.rotate()
+        # so the left-most rotor only rotates if the rotor to its right has a
+        # left-side notch over the pawl, or on its own notch.
+
+        # Going from right to left, a rotor's notch is looked at before it
+        # moves, and its right neighbor's before that one moved.
+        rotors = self.rotors
+        right = rotors[-1].notch_over_pawl()
+        rotors[-1].rotate()
+        for rotor in rotors[-2::-1]:
+            notch = rotor.notch_over_pawl()
+            if right or notch:
+                rotor.rotate()
+            right = notch
 
     def _electric_signal(self, signal_num):
         """Simulate running an electric signal through the machine in order to
         perform an encrypt or decrypt operation
 
-        signal_num - the wire (0-69) that the simulated current occurs on
+        signal_num - the wire (0-69 on the RuNigma keyboard) that the
+        simulated current occurs on
 
         Returns a lamp number to light (an integer 0-69).
 
@@ -224,19 +370,198 @@ class RuNigmaMachine:
         it with replace_char; if replace_char is None the character is dropped
         from the message
 
+        Unless it is very short, the text is processed by an engine compiled
+        from the machine; the result is the same as calling key_press for each
+        letter.
+
+        """
+        if len(text) < KEY_PRESS_THRESHOLD:
+            from .engine import clean_text
+            return ''.join(map(self.key_press, clean_text(text, replace_char, self.alphabet)))
+
+        engine = self.compile(vectorize=len(text) >= VECTORIZE_THRESHOLD)
+        try:
+            return engine.process_text(text, replace_char)
+        finally:
+            engine.store()
+
+    def process_many(self, messages, replace_char='_', executor=None):
+        """Process many messages under the key settings of this machine, each
+        starting at its own display value.
+
+        messages - an iterable of (start, text) pairs
+
+        The machine is compiled once for all of the messages and its rotors
+        are not moved. Returns the list of results in order. See
+        batch.process_many for running on a thread or process pool.
+
+        """
+        from .batch import process_many
+        return process_many(self, messages, replace_char, executor)
+
+    def iter_permutations(self, n):
+        """Yield the substitution made by each of the next n key presses.
+
+        Each substitution is a bytes object with a byte per key of the
+        keyboard: byte k is the wire number of the lamp lit by pressing key
+        k, through the plugboard, the rotors and the reflector, or k itself
+        for a plaintext pin of the reflector.
+
+        The rotors are stepped as if the keys were pressed; they are moved
+        when the iteration ends or is stopped early.
+
+        """
+        engine = self.compile()
+        try:
+            yield from engine.permutations(n)
+        finally:
+            engine.store()
+
+    def fill_permutations(self, buffer, positions=None):
+        """Fill a buffer with the substitutions of the next key presses, as
+        yielded by iter_permutations, and return the number of key presses.
+
+        buffer - a writable buffer of unsigned bytes with a row of a byte per
+        key for each key press, such as an array('B') or, for the 70 keys of
+        the RuNigma keyboard, a NumPy uint8 array of shape (n, 70)
+
+        positions - an optional buffer of the same kind with a row of one
+        byte per rotor for each key press, such as a NumPy uint8 array of
+        shape (n, 5), to fill with the internal rotor positions from left to
+        right at each key press
+
+        The rows are copied into the buffer without making a Python object
+        per entry; the rotors are stepped as if the keys were pressed.
+
+        """
+        engine = self.compile()
+        try:
+            return engine.fill_permutations(buffer, positions)
+        finally:
+            engine.store()
+
+    def encrypt_bytes(self, data, stats=None):
+        """Encrypt arbitrary binary data.
+
+        data - a bytes-like object. It is encoded with 4 keyboard symbols for
+        every 3 bytes (see the codec module) and the symbols are run through
+        the machine.
+
+        stats - an optional codec.CodecStats that is updated with the amount
+        of data processed and the time spent
+
+        Returns the encrypted text. The original data is recovered by calling
+        decrypt_bytes on a machine set to the same display.
+
+        """
+        from . import codec
+
+        if self.alphabet.size != codec.BASE:
+            raise RuNigmaError("binary data needs a keyboard of %d letters" % codec.BASE)
+
+        start = time.perf_counter()
+        digits = codec.encode(data)
+
+        engine = self.compile(vectorize=len(digits) >= VECTORIZE_THRESHOLD)
+        try:
+            text = engine.decode(engine.process_keys(digits))
+        finally:
+            engine.store()
+
+        if stats is not None:
+            stats.raw += memoryview(data).nbytes
+            stats.encoded += len(digits)
+            stats.seconds += time.perf_counter() - start
+
+        return text
+
+    def decrypt_bytes(self, text, stats=None):
+        """Decrypt text produced by encrypt_bytes and return the binary data
+        as bytes.
+
+        stats - an optional codec.CodecStats, as for encrypt_bytes
+
         """
-        result = []
-        for key in text:
-            if key not in KEYBOARD_SET: 
-                if replace_char:
-                    key = replace_char
-                else:
-                    continue    # ignore it
+        from . import codec
+
+        if self.alphabet.size != codec.BASE:
+            raise RuNigmaError("binary data needs a keyboard of %d letters" % codec.BASE)
+
+        start = time.perf_counter()
+
+        engine = self.compile(vectorize=len(text) >= VECTORIZE_THRESHOLD)
+        try:
+            keys = engine.encode(text, replace_char=None)
+            if len(keys) != len(text):
+                raise RuNigmaError("text contains characters not on the keyboard")
+            digits = engine.process_keys(keys)
+        finally:
+            engine.store()
+
+        data = codec.decode(digits)
 
-            result.append(self.key_press(key))
+        if stats is not None:
+            stats.raw += len(data)
+            stats.encoded += len(digits)
+            stats.seconds += time.perf_counter() - start
 
-        return ''.join(result)
+        return data
+
+    def compile(self, vectorize=False):
+        """Return a compiled engine for this machine, starting from the
+        current rotor positions.
+
+        vectorize - if True and NumPy is installed, return a
+        vectorized.VectorEngine, which is faster for very long texts; otherwise
+        return an engine.FastEngine
+
+        The engine keeps its own copy of the rotor positions; call its store
+        method to copy them back to the machine. FastEngines are compiled once
+        per key setting and copied after that; see engine.compile_machine.
+
+        """
+        if vectorize:
+            from .vectorized import VectorEngine, HAVE_NUMPY
+            if HAVE_NUMPY:
+                return VectorEngine(self)
+
+        from .engine import compile_machine
+        return compile_machine(self)
 
     def get_rotor_counts(self):
         """Return the rotor rotation counts as a list of integers."""
         return [r.rotations for r in self.rotors]
+
+    def instrument(self, sample_rate=100, trace=None):
+        """Switch the machine to an instrumented code path and return the
+        instrument.MachineStats it updates.
+
+        Until uninstrument is called, key_press and process_text count key
+        presses, rotor steps per position and double steps, time the stages of
+        one key press in sample_rate (0 turns this off) and call trace, if
+        given, with the signal path of every key press; see
+        instrument.instrument. The output is unchanged, but process_text
+        presses one key at a time and is much slower.
+
+        """
+        from .instrument import InstrumentedMachine, MachineStats, instrument
+        stats = MachineStats(len(self.rotors), self.alphabet.size)
+        key_press, process_text = instrument(self, stats, sample_rate, trace)
+        self._instrument = (key_press, process_text, self._plain_class())
+        self.__class__ = InstrumentedMachine
+        return stats
+
+    def uninstrument(self):
+        """Switch the machine back to the normal code path."""
+        if self._instrument is not None:
+            self.__class__ = self._instrument[2]
+            self._instrument = None
+
+
+def _unpickle_machine(cls, settings, positions, rotations, origin):
+    """Rebuild a machine pickled by RuNigmaMachine.__reduce__."""
+    machine = cls.from_key_sheet(**settings)
+    for rotor, pos, count in zip(machine.rotors, positions, rotations):
+        rotor.set_position(pos, count)
+    machine._origin = tuple(origin)
+    return machine
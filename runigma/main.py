@@ -10,9 +10,11 @@ process text.
 
 import argparse
 import sys
+import time
 
 from .keyfile import KeyFileError
 from .machine import RuNigmaMachine, RuNigmaError
+from . import stream
 from .rotors import RotorError
 
 PROG_DESC = 'Encrypt/decrypt text according to RuNigma machine key settings'
@@ -28,10 +30,16 @@ Text to process can be supplied 3 ways:
    if --file=FILE is present the contents of FILE are processed
    otherwise the text is read from standard input
 
+With --stream the file or standard input is processed in blocks and the
+output is written as it is produced, so memory use does not depend on the
+size of the input. The output goes to standard output unless --output=FILE is
+given.
+
 Examples:
 
     $ %(prog)s --key-file=enigma.keys -s ФСИАР -t HELLOXWORLDX
     $ %(prog)s -r A Б В Г Д -i 1 2 3 4 5 -p AB CD EF GH IJ KL MN -u Ф -s АУГСД
+    $ cat big.txt | %(prog)s --key-file=enigma.keys -s ФСИАР --stream > big.enc
   
 """
 
@@ -82,6 +90,12 @@ def main():
     parser.add_argument('-s', '--start', help='starting position')
     parser.add_argument('-t', '--text', help='text to process')
     parser.add_argument('-f', '--file', help='input file to process')
+    parser.add_argument('-o', '--output', help='write the output to this file')
+    parser.add_argument('--stream', action='store_true', default=False,
+                        help='process the file or standard input in blocks')
+    parser.add_argument('-b', '--block-size', type=int, default=stream.BLOCK_SIZE,
+                        help=('number of characters read at a time with --stream'
+                              ' [default: %(default)s]'))
     parser.add_argument('-x', '--replace-char', default='_',
                         help=('if the input text contains chars not found on the enigma'
                               ' keyboard, replace with this char [default: %(default)s]'))
@@ -89,8 +103,15 @@ def main():
                         action='store_true',
                         help=('if the input text contains chars not found on the enigma'
                               ' keyboard, delete them from the input'))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('split the text into chunks and process them with JOBS'
+                              ' worker processes; 0 means one per CPU [default: %(default)s]'))
     parser.add_argument('-v', '--verbose', action='store_true', default=False,
-                        help='provide verbose output; include final rotor positions')
+                        help=('provide verbose output; include final rotor positions'
+                              ' and throughput'))
+    parser.add_argument('--stats', action='store_true', default=False,
+                        help=('with --verbose, also count rotor steps and time the stages'
+                              ' of the machine; this is much slower'))
 
     args = parser.parse_args()
 
@@ -102,11 +123,35 @@ def main():
     if args.start is None:
         parser.error("Please specify a start position")
 
+    if args.jobs < 0:
+        parser.error("Please specify a non-negative number of jobs")
+
+    if args.stream and args.text:
+        parser.error("--stream works on --file or standard input, not --text")
+
+    if args.stream and args.jobs != 1:
+        parser.error("Please specify --stream or --jobs, but not both")
+
+    if args.block_size < 1:
+        parser.error("Please specify a positive block size")
+
+    if args.stats and (args.jobs != 1 or args.stream):
+        parser.error("--stats works without --jobs and --stream")
+
     if args.key_file:
         machine = create_from_key_file(args.key_file, args.day)
     else:
         machine = create_from_args(parser, args)
 
+    replace_char = args.replace_char if not args.delete_chars else None
+
+    machine.set_display(args.start)
+    stats = machine.instrument() if args.stats else None
+
+    if args.stream:
+        process_stream(machine, args, replace_char)
+        return
+
     if args.text:
         text = args.text
     elif args.file:
@@ -115,18 +160,60 @@ def main():
     else:
         text = input('--> ')
 
-    replace_char = args.replace_char if not args.delete_chars else None
-
-    machine.set_display(args.start)
-
-    s = machine.process_text(text, replace_char=replace_char)
+    start = time.perf_counter()
+    if args.jobs == 1:
+        s = machine.process_text(text, replace_char=replace_char)
+    else:
+        from . import parallel
+        s = parallel.process_text(machine, text, replace_char=replace_char,
+                                  jobs=args.jobs or None)
+    elapsed = time.perf_counter() - start
 
     if args.verbose:
         print('Final rotor positions:', machine.get_display())
         print('Rotor rotation counts:', machine.get_rotor_counts())
+        print(summary(len(s), elapsed, stats), end='')
         print('Output:')
 
-    print(s)
+    if args.output:
+        with open(args.output, 'w') as f:
+            print(s, file=f)
+    else:
+        print(s)
+
+
+def summary(count, elapsed, stats=None):
+    """Return the throughput summary printed with --verbose."""
+
+    lines = 'Characters processed: %d\nThroughput: %.0f chars/s\n' % (
+        count, count / elapsed if elapsed else 0.0)
+    if stats is not None:
+        lines += '%s\n' % stats
+    return lines
+
+
+def process_stream(machine, args, replace_char):
+    """Process the input file or standard input in blocks."""
+
+    infile = open(args.file, 'r') if args.file else sys.stdin
+    outfile = open(args.output, 'w') if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        count = stream.process_stream(machine, infile, outfile, replace_char=replace_char,
+                                      block_size=args.block_size)
+        outfile.write('\n')
+        outfile.flush()
+    finally:
+        if args.file:
+            infile.close()
+        if args.output:
+            outfile.close()
+    elapsed = time.perf_counter() - start
+
+    if args.verbose:
+        sys.stderr.write('Final rotor positions: %s\n' % machine.get_display())
+        sys.stderr.write('Rotor rotation counts: %s\n' % machine.get_rotor_counts())
+        sys.stderr.write(summary(count, elapsed))
 
 
 def console_main():
@@ -0,0 +1,124 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains functions to process large texts on several CPU cores.
+
+The text is split into chunks and each chunk is given to a worker process,
+a few chunks per worker at a time.
+The workers only receive the key settings and the start display of the
+machine; each one builds its own machine and seeks it to the offset of its
+chunk (see RuNigmaMachine.seek). The results are concatenated in order and
+are identical to processing the text with a single machine.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import os
+
+from .engine import clean_text
+from .machine import RuNigmaMachine, RuNigmaError
+
+# the default number of characters given to a worker at a time
+CHUNK_SIZE = 1 << 20
+
+# the number of chunks in flight per worker process
+CHUNKS_PER_WORKER = 2
+
+# the machine of a worker process, see _init_worker
+_worker_machine = None
+
+
+def _init_worker(settings, start):
+    """Build the machine of a worker process."""
+    global _worker_machine
+    _worker_machine = RuNigmaMachine.from_key_sheet(**settings)
+    _worker_machine.set_display(start)
+
+
+def _process_chunk(offset, text):
+    """Process a chunk of text that starts offset key presses into the
+    message.
+
+    """
+    _worker_machine.seek(offset)
+    return _worker_machine.process_text(text)
+
+
+def _chunks(text, replace_char, alphabet, chunk_size):
+    """Yield (offset, chunk) pairs of the cleaned text, one chunk at a time;
+    offset is the number of key presses before the chunk.
+
+    """
+    offset = 0
+    for start in range(0, len(text), chunk_size):
+        chunk = clean_text(text[start:start + chunk_size], replace_char, alphabet)
+        if chunk:
+            yield offset, chunk
+            offset += len(chunk)
+
+
+def process_text(machine, text, replace_char='_', jobs=None, chunk_size=CHUNK_SIZE,
+                 outfile=None):
+    """Run the text through the machine using a pool of worker processes.
+
+    machine - an RuNigmaMachine built from the rotors in rotors.data; see
+    RuNigmaMachine.get_settings. Its rotors are advanced as if the text had
+    been processed by it.
+
+    text, replace_char - as for RuNigmaMachine.process_text
+
+    jobs - the number of worker processes; None means one per CPU
+
+    chunk_size - the number of characters given to a worker at a time
+
+    outfile - if given, a file-like object the result is written to, a chunk
+    at a time, instead of being returned; the number of characters written is
+    returned instead
+
+    The text is cleaned and handed out a chunk at a time, and only a few
+    chunks per worker are in flight, so that memory use beyond the text and
+    the result is bounded.
+
+    """
+    if chunk_size < 1:
+        raise RuNigmaError("invalid chunk size")
+
+    if len(text) <= chunk_size or jobs == 1:
+        result = machine.process_text(text, replace_char)
+        if outfile is None:
+            return result
+        outfile.write(result)
+        return len(result)
+
+    results = []
+    count = 0
+    limit = CHUNKS_PER_WORKER * (jobs or os.cpu_count() or 1)
+    pending = collections.deque()
+
+    def take():
+        nonlocal count
+        result = pending.popleft().result()
+        count += len(result)
+        if outfile is None:
+            results.append(result)
+        else:
+            outfile.write(result)
+
+    settings = machine.get_settings()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(settings, machine.get_display())) as pool:
+        try:
+            for offset, chunk in _chunks(text, replace_char, machine.alphabet, chunk_size):
+                if len(pending) >= limit:
+                    take()
+                pending.append(pool.submit(_process_chunk, offset, chunk))
+            while pending:
+                take()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    machine.advance(count)
+    return ''.join(results) if outfile is None else count
@@ -9,14 +9,15 @@ component of the RuNigma Machine.
 """
 
 import collections
-import copy
 from itertools import chain
-import string
 
+from .alphabet import RUNIGMA
 
-# On Heer & Luftwaffe (?) models, the plugs are labeled with upper case letters
-HEER_LABELS = 'abcdefghijklmnopqrstuvwxyzАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ0123456789_'
-HEER_LABELS_LEN = len(HEER_LABELS)
+
+# On Heer & Luftwaffe (?) models, the plugs are labeled with the letters of
+# the keyboard
+HEER_LABELS = RUNIGMA.chars
+HEER_LABELS_LEN = RUNIGMA.size
 
 # The number of plugboard cables supplied with a machine:
 MAX_PAIRS = 20
@@ -37,8 +38,16 @@ class Plugboard:
     to B, A crosses to B in the keyboard to entry wheel direction and also in
     the reverse entry wheel to lamp direction.
 
+    The plugboard has a plug for each letter of its alphabet.
+
+    Copies of a plugboard share its wiring map until one of them is rewired;
+    _shared tells that the map must be copied before it is changed.
+
     """
-    def __init__(self, wiring_pairs=None):
+
+    __slots__ = ('alphabet', 'wiring_map', '_backup_maps', '_shared')
+
+    def __init__(self, wiring_pairs=None, alphabet=RUNIGMA):
         """Configure the plugboard according to a list or tuple of integer
         pairs, or None.
 
@@ -56,12 +65,13 @@ class Plugboard:
 
         """
         # construct wiring mapping table with default 1-1 mappings
-        self.wiring_map = list(range(HEER_LABELS_LEN))
+        self.alphabet = alphabet
+        self.wiring_map = list(range(alphabet.size))
+        self._shared = False
 
-        # construct backup storage for the wiring map; this is useful when
-        # hill-climbing and is used when the Plugboard is used as a context
-        # manager
-        self._backup_map = list(range(HEER_LABELS_LEN))
+        # the wiring maps saved when the Plugboard is used as a context
+        # manager, one per open with block; this is useful when hill-climbing
+        self._backup_maps = []
 
         # use settings if provided
         if not wiring_pairs:
@@ -80,14 +90,29 @@ class Plugboard:
         for pair in wiring_pairs:
             m = pair[0]
             n = pair[1]
-            if not (0 <= m < HEER_LABELS_LEN) or not (0 <= n < HEER_LABELS_LEN):
+            if not (0 <= m < alphabet.size) or not (0 <= n < alphabet.size):
                 raise PlugboardError('invalid connection: %s' % str(pair))
 
             self.wiring_map[m] = n
             self.wiring_map[n] = m
 
+    def copy(self):
+        """Return a plugboard with the same connections as this one."""
+        plugboard = self.__class__.__new__(self.__class__)
+        plugboard.alphabet = self.alphabet
+        plugboard.wiring_map = self.wiring_map
+        plugboard._backup_maps = []
+        plugboard._shared = self._shared = True
+        return plugboard
+
+    def _unshare(self):
+        """Give the plugboard its own wiring map before changing it."""
+        if self._shared:
+            self.wiring_map = self.wiring_map[:]
+            self._shared = False
+
     @classmethod
-    def from_key_sheet(cls, settings=None):
+    def from_key_sheet(cls, settings=None, alphabet=RUNIGMA):
         """Configure the plugboard according to a settings string as you may
         find on a key sheet.
 
@@ -97,7 +122,7 @@ class Plugboard:
         alphabetic pairs. For example: 'PO ML IU KJ NH YT GB VF RE DC'
 
         To specify no plugboard connections, settings can be None or an empty
-        string.
+        string. The pairs are letters of alphabet.
 
         A PlugboardError will be raised if the settings string is invalid, or if
         it contains more than MAX_PAIRS pairs. Each plug should be present at
@@ -105,7 +130,9 @@ class Plugboard:
 
         """
         if not settings:
-            return cls(None)
+            return cls(None, alphabet)
+
+        index = alphabet.index
 
         wiring_pairs = []
 
@@ -117,17 +144,17 @@ class Plugboard:
 
             m = p[0]
             n = p[1]
-            if m not in HEER_LABELS or n not in HEER_LABELS:
+            if m not in index or n not in index:
                 raise PlugboardError('invalid pair: %s' % p)
 
-            wiring_pairs.append((HEER_LABELS.index(m), HEER_LABELS.index(n)))
+            wiring_pairs.append((index[m], index[n]))
 
-        return cls(wiring_pairs)
+        return cls(wiring_pairs, alphabet)
 
     def get_pairs(self):
         """Return the connections as a set of tuple pairs."""
         pairs = set()
-        for x in range(0, HEER_LABELS_LEN):
+        for x in range(0, self.alphabet.size):
             y = self.wiring_map[x]
             if x != y and (y, x) not in pairs:
                 pairs.add((x, y))
@@ -138,8 +165,9 @@ class Plugboard:
         """Return settings as a string as found on an army key sheet."""
         pairs = list(self.get_pairs())
         pairs.sort()
-        return ' '.join('{}{}'.format(chr(t[0] + ord('A')), 
-                                      chr(t[1] + ord('A'))) for t in pairs)
+        labels = self.alphabet.chars
+        return ' '.join('{}{}'.format(labels[t[0]], labels[t[1]])
+                        for t in pairs)
 
     def __str__(self):
         """Returns a string representation of the settings in army format."""
@@ -162,8 +190,8 @@ class Plugboard:
     # Support for hill-climbing algorithms:
 
     def get_wiring(self):
-        """Returns a deep copy of the internal wiring map."""
-        return copy.deepcopy(self.wiring_map)
+        """Returns a copy of the internal wiring map."""
+        return self.wiring_map[:]
 
     def is_wired(self, n):
         """Returns True if connection n has a cable attached; 0 <= n < 70."""
@@ -175,14 +203,15 @@ class Plugboard:
 
     def __enter__(self):
         """Saves the current state of the wiring map."""
-        for n in range(HEER_LABELS_LEN):
-            self._backup_map[n] = self.wiring_map[n]
+        # the saved map is shared until the plugboard is rewired
+        self._backup_maps.append(self.wiring_map)
+        self._shared = True
         return self
 
     def __exit__(self, *exc_info):
         """Restores the saved state of the wiring map."""
-        for n in range(HEER_LABELS_LEN):
-            self.wiring_map[n] = self._backup_map[n]
+        self.wiring_map = self._backup_maps.pop()
+        self._shared = True
 
     def connection(self, n):
         """Returns plug number [0-25] for what is connected to plug n [0-25]."""
@@ -190,6 +219,7 @@ class Plugboard:
 
     def disconnect(self, n):
         """Removes cable from plug number n [0-25]."""
+        self._unshare()
         x = self.wiring_map[n]
         self.wiring_map[x] = x
         self.wiring_map[n] = n
@@ -201,6 +231,7 @@ class Plugboard:
 
         """
         # disconnect any existing connections
+        self._unshare()
         m = self.wiring_map[x]
         n = self.wiring_map[y]
         self.wiring_map[m] = m
@@ -216,4 +247,3 @@ class Plugboard:
 
         """
         return self.wiring_map[x] == y and self.wiring_map[y] == x
-
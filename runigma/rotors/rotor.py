@@ -5,29 +5,185 @@
 
 """rotor.py - this module contains the Rotor class for the RuNigma simulation."""
 
-import string
-import collections
-
 from . import RotorError
+from ..alphabet import RUNIGMA
+
+
+# The labels of the rotor rings of the RuNigma Machine; rotors built with
+# another alphabet are labeled with its characters
+ALPHA_LABELS = RUNIGMA.chars
+ALPHA_LABELS_LEN = RUNIGMA.size
+
+
+# The immutable tables of the rotors are shared by all rotors built with the
+# same wiring or the same ring setting and notches, however many machines use
+# them; see wiring_tables and ring_tables. Wirings are validated when their
+# tables are first built.
+_WIRINGS = {}
+_RINGS = {}
+
+
+class WiringTables:
+    """The tables of a rotor wiring, independent of the ring setting.
+
+    alphabet - the Alphabet of the wiring
+
+    entry_map, exit_map - the wiring from the right and from the left
+
+    forward_table, backward_table - the signal paths for every rotor
+    position, flat lists indexed by pos * alphabet.size + n
+
+    plaintext_pins - the list of plaintext pins of a reflector
+
+    reflector_table - for stationary rotors, (contact, plaintext) pairs
+    indexed like forward_table; otherwise None
+
+    """
+
+    __slots__ = ('alphabet', 'entry_map', 'exit_map', 'forward_table', 'backward_table',
+                 'plaintext_pins', 'reflector_table')
+
+    def __init__(self, wiring, plaintext=None, stationary=False, alphabet=RUNIGMA):
+        self.alphabet = alphabet
+        index = alphabet.index
+        size = alphabet.size
+
+        # check plaintext letters and initialize plaintext_pins
+        self.plaintext_pins = list()
+        if plaintext:
+            for l in plaintext:
+                if l not in index:
+                    raise RotorError("invalid plaintext letter")
+                self.plaintext_pins.append(index[l])
+
+        # check wiring length
+        if len(wiring) != size:
+            raise RotorError("invalid wiring length")
+
+        # check wiring format; must contain the letters of the alphabet
+        for c in wiring:
+            if c not in index:
+                raise RotorError("invalid wiring: %s" % wiring)
+
+        # check wiring format; ensure every letter appears exactly once
+        if len(set(wiring)) != size:
+            raise RotorError("invalid wiring frequency")
+
+        # Create two lists to describe the internal wiring. Two lists are used
+        # to do fast lookup from both entry (from the right) and exit (from the
+        # left). 
+        self.entry_map = [index[pin] for pin in wiring]
+        
+        self.exit_map = [0] * size
+        for i, v in enumerate(self.entry_map):
+            self.exit_map[v] = i
+
+        # Precompute the signal path for every rotor position. The tables are
+        # flat lists indexed by pos * size + n, so passing a signal through
+        # the rotor is a single lookup with no modular arithmetic.
+        self.forward_table = []
+        self.backward_table = []
+        for pos in range(size):
+            for n in range(size):
+                pin = (n + pos) % size
+                self.forward_table.append((self.entry_map[pin] - pos) % size)
+                self.backward_table.append((self.exit_map[pin] - pos) % size)
+
+        # Stationary rotors (reflectors) also get a table of (contact,
+        # plaintext) pairs so signal_in_reflector doesn't allocate a tuple
+        # per call.
+        self.reflector_table = None
+        if stationary:
+            plaintext_set = set(self.plaintext_pins)
+            self.reflector_table = [(contact, i % size in plaintext_set)
+                                    for i, contact in enumerate(self.forward_table)]
 
 
-ALPHA_LABELS = 'abcdefghijklmnopqrstuvwxyzАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ0123456789_'
-ALPHA_LABELS_LEN = len(ALPHA_LABELS)
+class RingTables:
+    """The tables of a ring setting and its notches.
 
-# In specifying a wiring for a rotor, every letter must be included exactly
-# once. This variable helps us enforce that:
-WIRING_FREQ_SET = set((letter, 1) for letter in ALPHA_LABELS)
+    display_map - maps display values to positions
+
+    pos_map - maps positions to display values
+
+    step_set - the display values at which a notch is over the pawl
+
+    notch_table - the same indexed by internal position
+
+    next_pos - maps positions to the position one step further
+
+    """
+
+    __slots__ = ('display_map', 'pos_map', 'step_set', 'notch_table', 'next_pos')
+
+    def __init__(self, ring_setting=0, stepping=None, alphabet=RUNIGMA):
+        size = alphabet.size
+        if not isinstance(ring_setting, int) or not (0 <= ring_setting < size):
+            raise RotorError("invalid ring_setting")
+
+        # build a map of display values to positions
+        self.display_map = {}
+        for n in range(size):
+            self.display_map[alphabet.chars[n]] = (n - ring_setting) % size
+
+        # build a reverse map of position mapped to display values
+        self.pos_map = {v : k for k, v in self.display_map.items()}
+
+        # build step set; this is a set of positions where our notches are in
+        # place to allow the pawls to move
+        self.step_set = set()
+        if stepping is not None:
+            for pos in stepping:
+                if pos in self.display_map:
+                    self.step_set.add(pos)
+                else:
+                    raise RotorError("stepping: %s" % pos)
+
+        # the same information indexed by internal position, for engines that
+        # track rotor positions as plain integers
+        self.notch_table = [self.pos_map[pos] in self.step_set
+                            for pos in range(size)]
+
+        self.next_pos = list(range(1, size)) + [0]
+
+
+def wiring_tables(wiring, plaintext=None, stationary=False, alphabet=RUNIGMA):
+    """Return the shared WiringTables of a wiring."""
+    key = (wiring, None if plaintext is None else tuple(plaintext), stationary, alphabet)
+    tables = _WIRINGS.get(key)
+    if tables is None:
+        tables = _WIRINGS[key] = WiringTables(wiring, plaintext, stationary, alphabet)
+    return tables
+
+
+def ring_tables(ring_setting=0, stepping=None, alphabet=RUNIGMA):
+    """Return the shared RingTables of a ring setting and notches."""
+    key = (ring_setting, None if stepping is None else tuple(stepping), alphabet)
+    tables = _RINGS.get(key)
+    if tables is None:
+        tables = _RINGS[key] = RingTables(ring_setting, stepping, alphabet)
+    return tables
+
+
+def clear_tables():
+    """Drop the shared wiring and ring tables; rotors built after this build
+    and validate their tables again. Rotors already built keep theirs.
+
+    """
+    _WIRINGS.clear()
+    _RINGS.clear()
 
 
 class Rotor:
     """The Rotor class represents the RuNigma Machine rotors.
     
     A rotor has 70 circularly arranged pins on the right (entry) side and 70
-    contacts on the left side. Each pin is connected to a single contact by
-    internal wiring, thus establishing a substitution cipher. We represent this
-    wiring by establishing a mapping from a pin to a contact (and vice versa for
-    the return path). Internally we number the pins and contacts from 0-25 in a
-    clockwise manner with 0 being the "top".
+    contacts on the left side, one for each letter of its alphabet. Each pin
+    is connected to a single contact by internal wiring, thus establishing a
+    substitution cipher. We represent this wiring by establishing a mapping
+    from a pin to a contact (and vice versa for the return path). Internally
+    we number the pins and contacts from 0-25 in a clockwise manner with 0
+    being the "top".
 
     An alphabetic ring is fastened to the rotor by the operator. The labels of
     this ring are displayed to the operator through a small window on the top
@@ -53,7 +209,14 @@ class Rotor:
     
     """
 
-    def __init__(self, model_name, wiring, ring_setting=0, stepping=None, plaintext=None):
+    # only the name, the ring setting and the position are per rotor; the
+    # hot tables are also referenced directly to save a lookup per signal
+    __slots__ = ('name', 'wiring_str', 'ring_setting', 'alphabet', 'wiring', 'ring',
+                 'forward_table', 'backward_table', 'reflector_table', 'pos_map',
+                 'step_set', 'pos', 'rotations', '_offset', 'display_val')
+
+    def __init__(self, model_name, wiring, ring_setting=0, stepping=None, plaintext=None,
+                 alphabet=RUNIGMA):
         """Establish rotor characteristics:
 
         wiring - this should be a string of 70 alphabetic characters that
@@ -75,67 +238,63 @@ class Rotor:
         will allow the pawl to push up on the rotor *and* the rotor to the left
         when the next key is depressed.
 
+        alphabet - the Alphabet of the letters used by the other parameters;
+        the rotor has a pin and a contact for each of them
+
+        The tables built from wiring, plaintext, ring_setting and stepping are
+        shared with every other rotor built from the same values.
+
         """
         self.name = model_name
         self.wiring_str = wiring
         self.ring_setting = ring_setting
+        self.alphabet = alphabet
         self.pos = 0
         self.rotations = 0
-        
-        # check plaintext letters and initialize plaintext_pins
-        self.plaintext_pins = list()
-        if plaintext:
-            for l in plaintext:
-                if l not in ALPHA_LABELS:
-                    raise RotorError("invalid plaintext letter")
-                self.plaintext_pins.append(ALPHA_LABELS.index(l))
 
-        # check wiring length
-        if len(self.wiring_str) != ALPHA_LABELS_LEN:
-            raise RotorError("invalid wiring length")
+        self.wiring = wiring_tables(wiring, plaintext, stepping is None, alphabet)
+        self.ring = ring_tables(ring_setting, stepping, alphabet)
 
-        # check wiring format; must contain ALPHA_LABELS
-        for c in self.wiring_str:
-            if c not in ALPHA_LABELS:
-                raise RotorError("invalid wiring: %s" % wiring)
+        self.forward_table = self.wiring.forward_table
+        self.backward_table = self.wiring.backward_table
+        self.reflector_table = self.wiring.reflector_table
+        self.pos_map = self.ring.pos_map
+        self.step_set = self.ring.step_set
 
-        # check wiring format; ensure every letter appears exactly once
-        input_set = set(collections.Counter(self.wiring_str).items())
-        if input_set != WIRING_FREQ_SET:
-            raise RotorError("invalid wiring frequency")
+        # initialize our position and display value:
+        self.set_display(alphabet.chars[0])
 
-        if not isinstance(ring_setting, int) or not (0 <= ring_setting < ALPHA_LABELS_LEN):
-            raise RotorError("invalid ring_setting")
+    @property
+    def entry_map(self):
+        return self.wiring.entry_map
 
-        # Create two lists to describe the internal wiring. Two lists are used
-        # to do fast lookup from both entry (from the right) and exit (from the
-        # left). 
-        self.entry_map = [ALPHA_LABELS.index(pin) for pin in self.wiring_str]
-        
-        self.exit_map = [0] * ALPHA_LABELS_LEN
-        for i, v in enumerate(self.entry_map):
-            self.exit_map[v] = i
+    @property
+    def exit_map(self):
+        return self.wiring.exit_map
 
-        # build a map of display values to positions
-        self.display_map = {}
-        for n in range(ALPHA_LABELS_LEN):
-            self.display_map[ALPHA_LABELS[n]] = (n - self.ring_setting) % ALPHA_LABELS_LEN
+    @property
+    def plaintext_pins(self):
+        return self.wiring.plaintext_pins
 
-        # build a reverse map of position mapped to display values
-        self.pos_map = {v : k for k, v in self.display_map.items()}
+    @property
+    def display_map(self):
+        return self.ring.display_map
 
-        # build step set; this is a set of positions where our notches are in
-        # place to allow the pawls to move
-        self.step_set = set()
-        if stepping is not None:
-            for pos in stepping:
-                if pos in self.display_map:
-                    self.step_set.add(pos)
-                else:
-                    raise RotorError("stepping: %s" % pos)
+    @property
+    def notch_table(self):
+        return self.ring.notch_table
 
-        # initialize our position and display value:
-        self.set_display(ALPHA_LABELS[0])
+    def copy(self):
+        """Return a rotor in the same state as this one.
+
+        The wiring tables are immutable and shared with this rotor; only the
+        position and rotation counter are independent.
+
+        """
+        rotor = Rotor.__new__(Rotor)
+        for name in Rotor.__slots__:
+            setattr(rotor, name, getattr(self, name))
+        return rotor
 
     def set_display(self, val):
         """Spin the rotor such that the string val appears in the operator
@@ -147,20 +306,38 @@ class Rotor:
         A value of 'a' for example puts the rotor in position 0, assuming an
         internal ring setting of 0.
 
-        The parameter val must be a string in ALPHA_LABELS.
+        The parameter val must be a letter of the rotor's alphabet.
 
         Setting the display resets the internal rotation counter to 0.
 
         """
         s = val
 
-        if s not in self.display_map:
+        display_map = self.ring.display_map
+        if s not in display_map:
             raise RotorError("bad display value %s" % val)
 
-        self.pos = self.display_map[s]
+        self.pos = display_map[s]
+        self._offset = self.pos * self.alphabet.size
         self.display_val = s
         self.rotations = 0
 
+    def set_position(self, pos, rotations=0):
+        """Put the rotor in internal position pos (0-69) on the axle and set
+        the rotation counter to rotations.
+
+        This is the integer counterpart of set_display and is used to copy
+        state back from engines that track rotor positions as plain integers.
+
+        """
+        if not isinstance(pos, int) or not (0 <= pos < self.alphabet.size):
+            raise RotorError("bad position %s" % pos)
+
+        self.pos = pos
+        self._offset = pos * self.alphabet.size
+        self.display_val = self.pos_map[pos]
+        self.rotations = rotations
+
     def get_display(self):
         """Returns what is currently being displayed in the operator window."""
         return self.display_val
@@ -174,14 +351,7 @@ class Rotor:
         Returns the contact number of the output signal (0-69).
 
         """
-        # determine what pin we have at that position due to rotation
-        pin = (n + self.pos) % ALPHA_LABELS_LEN
-
-        # run it through the internal wiring
-        contact = self.entry_map[pin]
-
-        # turn back into a position due to rotation
-        return (contact - self.pos) % ALPHA_LABELS_LEN
+        return self.forward_table[self._offset + n]
    
     def signal_in_reflector(self, n):
         """Simulate a signal entering the rotor from the right at a given pin
@@ -192,6 +362,9 @@ class Rotor:
         Returns the contact number of the output signal (0-69) and plaintext signal.
 
         """
+        if self.reflector_table is not None:
+            return self.reflector_table[self._offset + n]
+
         return self.signal_in(n), (n in self.plaintext_pins)
 
     def signal_out(self, n):
@@ -203,14 +376,7 @@ class Rotor:
         Returns the pin number of the output signal (0-69).
 
         """
-        # determine what contact we have at that position due to rotation
-        contact = (n + self.pos) % ALPHA_LABELS_LEN
-
-        # run it through the internal wiring
-        pin = self.exit_map[contact]
-
-        # turn back into a position due to rotation
-        return (pin - self.pos) % ALPHA_LABELS_LEN
+        return self.backward_table[self._offset + n]
 
     def notch_over_pawl(self):
         """Return True if this rotor has a notch in the stepping position and
@@ -222,6 +388,7 @@ class Rotor:
     def rotate(self):
         """Rotate the rotor forward due to mechanical stepping action."""
 
-        self.pos = (self.pos + 1) % ALPHA_LABELS_LEN
+        self.pos = self.ring.next_pos[self.pos]
+        self._offset = self.pos * self.alphabet.size
         self.display_val = self.pos_map[self.pos]
         self.rotations += 1
@@ -0,0 +1,580 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains an asyncio encryption server.
+
+The server listens on a TCP or Unix socket and speaks a line protocol: every
+request and every response is one JSON object on one line. A request is
+
+    {"id": 1, "settings": {...}, "start": "ФСИАР", "text": "..."}
+
+where settings are keyword arguments for RuNigmaMachine.from_key_sheet, or
+
+    {"id": 2, "day": 12, "start": "ФСИАР", "text": "..."}
+
+for the settings of a day of the key file the server was started with. An
+optional "replace_char" is used as for RuNigmaMachine.process_text. The
+response is {"id": 1, "text": "..."} or {"id": 1, "error": "..."}. Requests
+on one connection may be answered out of order; the id, which can be any
+JSON value, tells them apart.
+
+Internally, small requests are queued and processed in batches by a single
+worker thread: all requests waiting when the thread becomes free form the
+next batch, so batches grow with the load. A compiled engine is cached per
+key setting (see cache.MachineCache), and the requests of a batch that share
+a key are run through one copy of it. Requests of at least large characters
+are sent to a process pool instead, so the event loop never runs the machine
+itself.
+
+The request queue and the number of requests a connection may have in flight
+are bounded; when either is full the server stops reading from the
+connection, and the client is pushed back by the socket buffers.
+
+Metrics are served as Prometheus text on a separate HTTP port; see
+ServerMetrics.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import time
+
+from .alphabet import AlphabetError
+from .batch import display_positions, process_batch, process_settings_batch, settings_key
+from .cache import MachineCache
+from .keyfile import KeyFileError, KeySheet
+from .machine import RuNigmaMachine, RuNigmaError
+from .plugboard import PlugboardError
+from .rotors import RotorError
+
+HOST = '127.0.0.1'
+PORT = 7070
+METRICS_PORT = 7071
+
+# the default number of key settings whose compiled engines are kept
+CACHE_SIZE = 64
+
+# the default maximum number of requests processed in one batch
+MAX_BATCH = 256
+
+# the default number of requests that may wait in the queue
+MAX_PENDING = 1024
+
+# the default number of requests a connection may have in flight
+MAX_IN_FLIGHT = 64
+
+# by default requests of this many characters or more go to the process pool
+LARGE_REQUEST = 1 << 16
+
+# the longest request line accepted
+MAX_LINE = 1 << 24
+
+# the errors caused by a bad request, which are sent back to the client
+REQUEST_ERRORS = (ValueError, TypeError, KeyError, RuNigmaError, RotorError, PlugboardError,
+                  AlphabetError, KeyFileError)
+
+# the upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+# the upper bounds of the batch size histogram buckets
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class Histogram:
+    """A Prometheus style histogram with fixed buckets."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name):
+        """Return the lines of the histogram in the Prometheus text
+        format.
+
+        """
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append('%s_bucket{le="%s"} %d' % (name, bound, total))
+        lines.append('%s_sum %r' % (name, self.sum))
+        lines.append('%s_count %d' % (name, self.count))
+        return lines
+
+
+class ServerMetrics:
+    """Counters of a server.
+
+    requests - a Counter of the answered requests by status, 'ok' or 'error'
+
+    characters - the number of characters processed
+
+    offloaded - the number of requests sent to the process pool
+
+    latency - a Histogram of the seconds from reading a request to queueing
+    its response
+
+    batch_sizes - a Histogram of the number of requests per batch
+
+    connections - the number of open connections
+
+    """
+
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.characters = 0
+        self.offloaded = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.batch_sizes = Histogram(BATCH_BUCKETS)
+        self.connections = 0
+
+    def render(self, cache, pending):
+        """Return the metrics in the Prometheus text format.
+
+        cache - the info() of the engine cache
+
+        pending - the number of requests waiting in the queue
+
+        """
+        lines = [
+            '# HELP runigma_requests_total Requests answered.',
+            '# TYPE runigma_requests_total counter',
+        ]
+        for status in ('ok', 'error'):
+            lines.append('runigma_requests_total{status="%s"} %d' % (status, self.requests[status]))
+        lines += [
+            '# HELP runigma_characters_total Characters processed.',
+            '# TYPE runigma_characters_total counter',
+            'runigma_characters_total %d' % self.characters,
+            '# HELP runigma_offloaded_requests_total Requests sent to the process pool.',
+            '# TYPE runigma_offloaded_requests_total counter',
+            'runigma_offloaded_requests_total %d' % self.offloaded,
+            '# HELP runigma_request_seconds Request latency.',
+            '# TYPE runigma_request_seconds histogram',
+        ]
+        lines += self.latency.lines('runigma_request_seconds')
+        lines += [
+            '# HELP runigma_batch_size Requests per batch.',
+            '# TYPE runigma_batch_size histogram',
+        ]
+        lines += self.batch_sizes.lines('runigma_batch_size')
+        for name in ('hits', 'misses', 'evictions'):
+            lines += [
+                '# HELP runigma_cache_%s_total Engine cache %s.' % (name, name),
+                '# TYPE runigma_cache_%s_total counter' % name,
+                'runigma_cache_%s_total %d' % (name, cache[name]),
+            ]
+        lines += [
+            '# HELP runigma_cache_size Key settings in the engine cache.',
+            '# TYPE runigma_cache_size gauge',
+            'runigma_cache_size %d' % cache['size'],
+            '# HELP runigma_pending_requests Requests waiting in the queue.',
+            '# TYPE runigma_pending_requests gauge',
+            'runigma_pending_requests %d' % pending,
+            '# HELP runigma_connections Open connections.',
+            '# TYPE runigma_connections gauge',
+            'runigma_connections %d' % self.connections,
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+class RuNigmaServer:
+    """An asyncio encryption server."""
+
+    def __init__(self, sheet=None, jobs=None, cache_size=CACHE_SIZE, max_batch=MAX_BATCH,
+                 max_pending=MAX_PENDING, max_in_flight=MAX_IN_FLIGHT, large=LARGE_REQUEST):
+        """sheet - an optional keyfile.KeySheet for requests by day
+
+        jobs - the number of worker processes for large requests; None means
+        one per CPU
+
+        cache_size - the number of key settings whose engines are cached
+
+        max_batch - the maximum number of requests in a batch
+
+        max_pending - the number of requests that may wait in the queue
+
+        max_in_flight - the number of requests a connection may have in
+        flight
+
+        large - requests of this many characters or more go to the process
+        pool; None keeps all requests in the server process
+
+        """
+        self.sheet = sheet
+        self.jobs = jobs
+        self.max_batch = max_batch
+        self.max_in_flight = max_in_flight
+        self.large = large
+        self.metrics = ServerMetrics()
+        self.engines = MachineCache(cache_size)
+        self.servers = []
+
+        self._max_pending = max_pending
+        self._queue = None
+        self._batcher = None
+        self._thread = ThreadPoolExecutor(1)
+        self._pool = None
+        self._handlers = set()
+
+    async def start(self, host=HOST, port=PORT, path=None, metrics_port=METRICS_PORT):
+        """Start listening on host and port, or on the Unix socket path if
+        given, and serve metrics on metrics_port unless it is None. Port 0
+        picks a free port; see the servers attribute for the sockets.
+
+        """
+        self._queue = asyncio.Queue(self._max_pending)
+        self._batcher = asyncio.ensure_future(self._run_batches())
+
+        if path is not None:
+            server = await asyncio.start_unix_server(self._serve, path, limit=MAX_LINE)
+        else:
+            server = await asyncio.start_server(self._serve, host, port, limit=MAX_LINE)
+        self.servers.append(server)
+
+        if metrics_port is not None:
+            self.servers.append(await asyncio.start_server(self._serve_metrics, host,
+                                                           metrics_port))
+
+    async def serve_forever(self):
+        """Serve until cancelled."""
+        await asyncio.gather(*(server.serve_forever() for server in self.servers))
+
+    async def close(self):
+        """Stop listening, drop the open connections and release the
+        workers.
+
+        """
+        for server in self.servers:
+            server.close()
+
+        handlers = list(self._handlers)
+        for handler in handlers:
+            handler.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+
+        self._thread.shutdown()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def render_metrics(self):
+        """Return the metrics in the Prometheus text format."""
+        return self.metrics.render(self.engines.info(), self._queue.qsize() if self._queue else 0)
+
+    def parse_request(self, request):
+        """Return the settings, start, text and replace character of a
+        decoded request.
+
+        """
+        if not isinstance(request, dict):
+            raise RuNigmaError("a request must be a JSON object")
+
+        text = request.get('text')
+        start = request.get('start')
+        if not isinstance(text, str) or not isinstance(start, str):
+            raise RuNigmaError("a request needs a text and a start display")
+
+        if 'day' in request:
+            if self.sheet is None:
+                raise RuNigmaError("the server has no key file")
+            settings = self.sheet.settings(request['day'])
+        else:
+            settings = request.get('settings')
+            if not isinstance(settings, dict):
+                raise RuNigmaError("a request needs settings or a day")
+
+        return settings, start, text, request.get('replace_char', '_')
+
+    async def _serve(self, reader, writer):
+        """Serve one connection."""
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        self.metrics.connections += 1
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        try:
+            while True:
+                # stop reading while the connection has too much in flight
+                await in_flight.acquire()
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._respond(writer, {'id': None, 'error': 'request too long'},
+                                        time.perf_counter())
+                    break
+                if not line:
+                    break
+
+                task = asyncio.ensure_future(self._handle(line, writer, time.perf_counter()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: in_flight.release())
+
+            if tasks:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.metrics.connections -= 1
+            self._handlers.discard(handler)
+            writer.close()
+
+    async def _handle(self, line, writer, received):
+        """Answer one request line."""
+        request_id = None
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                request_id = request.get('id')
+            settings, start, text, replace_char = self.parse_request(request)
+            key = settings_key(settings)
+
+            if self.large is not None and len(text) >= self.large:
+                result = await self._offload(settings, start, text, replace_char)
+            else:
+                future = asyncio.get_running_loop().create_future()
+                await self._queue.put((key, settings, start, text, replace_char, future))
+                result = await future
+
+            self.metrics.characters += len(result)
+            response = {'id': request_id, 'text': result}
+        except REQUEST_ERRORS as ex:
+            response = {'id': request_id, 'error': str(ex) or ex.__class__.__name__}
+        except Exception as ex:
+            # every request is answered, whatever went wrong
+            response = {'id': request_id, 'error': 'internal error: %s' % (
+                str(ex) or ex.__class__.__name__)}
+
+        await self._respond(writer, response, received)
+
+    async def _respond(self, writer, response, received):
+        self.metrics.requests['error' if 'error' in response else 'ok'] += 1
+        writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.metrics.latency.observe(time.perf_counter() - received)
+        await writer.drain()
+
+    async def _offload(self, settings, start, text, replace_char):
+        """Process a large request in the process pool."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.jobs)
+        self.metrics.offloaded += 1
+        result = await asyncio.get_running_loop().run_in_executor(
+            self._pool, process_settings_batch, settings, [(start, text)], replace_char)
+        return result[0]
+
+    async def _run_batches(self):
+        """Take batches of requests from the queue and process them in the
+        worker thread.
+
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            self.metrics.batch_sizes.observe(len(batch))
+            try:
+                results = await loop.run_in_executor(self._thread, self._process_batch, batch)
+            except Exception as ex:
+                # fail the batch, not the server
+                results = [(None, ex)] * len(batch)
+
+            for (*_, future), (result, error) in zip(batch, results):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _engine(self, key, settings):
+        """Return a copy of the cached engine for settings and a function
+        converting a display to its rotor positions.
+
+        """
+        engine = self.engines.get(key,
+                                  lambda: RuNigmaMachine.from_key_sheet(**settings).compile())
+        return engine, display_positions(engine.machine.rotors)
+
+    def _process_batch(self, batch):
+        """Process a batch in the worker thread; return a (result, error)
+        pair per request.
+
+        """
+        groups = collections.defaultdict(list)
+        for k, (key, _, _, _, replace_char, _) in enumerate(batch):
+            groups[key, replace_char].append(k)
+
+        results = [None] * len(batch)
+        for (key, replace_char), members in groups.items():
+            settings = batch[members[0]][1]
+            try:
+                engine, positions = self._engine(key, settings)
+                texts = process_batch(engine, positions,
+                                      [batch[k][2:4] for k in members], replace_char)
+                results_group = [(text, None) for text in texts]
+            except Exception:
+                # run the requests one by one, so that one bad start or text
+                # does not fail the others
+                results_group = [self._process_one(batch[k]) for k in members]
+
+            for k, result in zip(members, results_group):
+                results[k] = result
+
+        return results
+
+    def _process_one(self, request):
+        key, settings, start, text, replace_char, _ = request
+        try:
+            engine, positions = self._engine(key, settings)
+            return process_batch(engine, positions, [(start, text)], replace_char)[0], None
+        except Exception as ex:
+            # any error fails this request only; _handle tells request
+            # errors from internal ones
+            return None, ex
+
+    async def _serve_metrics(self, reader, writer):
+        """Answer an HTTP request with the metrics."""
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            if request.split()[:2] == [b'GET', b'/metrics']:
+                body = self.render_metrics().encode('utf-8')
+                status = b'200 OK'
+            else:
+                body = b'not found\n'
+                status = b'404 Not Found'
+
+            writer.write(b'HTTP/1.0 ' + status + b'\r\n'
+                         b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._handlers.discard(handler)
+            writer.close()
+
+
+PROG_DESC = 'Serve RuNigma machine encryption over a socket'
+
+HELP_EPILOG = """\
+Requests and responses are JSON objects, one per line:
+
+    {"id": 1, "settings": {"rotors": "Ь Ч Ю Г Ъ", "reflector": "Ш"},
+     "start": "vhЯkК", "text": "ПРИВЕТ"}
+    {"id": 2, "day": 12, "start": "vhЯkК", "text": "ПРИВЕТ"}
+
+Day requests use the key file given with --key-file. Metrics are served at
+http://HOST:METRICS_PORT/metrics in the Prometheus text format.
+
+Examples:
+
+    $ %(prog)s --key-file=enigma.keys
+    $ %(prog)s --unix=/tmp/runigma.sock --metrics-port=9100 -j 4
+
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='runigma-server', description=PROG_DESC,
+                                     epilog=HELP_EPILOG,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=HOST,
+                        help='address to listen on [default: %(default)s]')
+    parser.add_argument('--port', type=int, default=PORT,
+                        help='TCP port to listen on [default: %(default)s]')
+    parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='HTTP port for metrics; -1 turns them off [default: %(default)s]')
+    parser.add_argument('-k', '--key-file',
+                        help='path to key file for requests by day')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help=('number of worker processes for large requests; 0 means one'
+                              ' per CPU [default: %(default)s]'))
+    parser.add_argument('--large', type=int, default=LARGE_REQUEST,
+                        help=('send requests of this many characters or more to the worker'
+                              ' processes; 0 never does [default: %(default)s]'))
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help='number of key settings to cache [default: %(default)s]')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH,
+                        help='maximum number of requests per batch [default: %(default)s]')
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help='number of requests that may wait [default: %(default)s]')
+
+    args = parser.parse_args()
+
+    if args.jobs < 0 or args.large < 0 or args.max_batch < 1 or args.max_pending < 1:
+        parser.error("Please specify non-negative jobs and large, and positive batch "
+                     "and queue sizes")
+
+    sheet = None
+    if args.key_file:
+        with open(args.key_file, 'r') as f:
+            sheet = KeySheet.from_file(f)
+
+    server = RuNigmaServer(sheet, jobs=args.jobs or None, cache_size=args.cache_size,
+                           max_batch=args.max_batch, max_pending=args.max_pending,
+                           large=args.large or None)
+
+    async def serve():
+        await server.start(args.host, args.port, args.unix,
+                           None if args.metrics_port < 0 else args.metrics_port)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def console_main():
+    try:
+        main()
+    except (IOError, RuNigmaError, RotorError, KeyFileError) as ex:
+        sys.stderr.write("%s\n" % ex)
+
+
+if __name__ == '__main__':
+    console_main()
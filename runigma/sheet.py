@@ -4,17 +4,37 @@
 
 """Provide RuNigma key sheet generator.
 
+Sheets are generated in blocks of BLOCK_DAYS days. Each block gets its own
+random number generator: either a random.Random seeded from the sheet seed,
+the sheet number and the block number, which makes sheets reproducible, or a
+secrets.SystemRandom for real sheets. Blocks can therefore be generated by
+several worker processes and still give the same output as a single one.
+
 """
 import argparse
-from random import choice
+from concurrent.futures import ProcessPoolExecutor
+import random
+import secrets
+import sys
 
 from runigma.machine import KEYBOARD_CHARS
+from runigma.plugboard import MAX_PAIRS
 from runigma.rotors.data import ROTORS, REFLECTORS
 
 SHEET_HEADER = "#   Day     Rotors      Rings       Plugboard" \
                "                                                       Reflector"
 SHEET_STR = "    %3d    %s  %s  %s     %s"
 
+# the number of days generated with one random number generator
+BLOCK_DAYS = 366
+
+# the most days on a sheet; key files number the days 1 to 366
+MAX_DAYS = 366
+
+ROTOR_NAMES = sorted(ROTORS)
+REFLECTOR_NAMES = sorted(REFLECTORS)
+KEYBOARD_LIST = list(KEYBOARD_CHARS)
+
 PROG_DESC = 'Generates key sheets for RuNigma.'
 
 HELP_EPILOG = """\
@@ -24,44 +44,173 @@ Usage:
 
     $ %(prog)s > keysheet.txt
 
+Reproducible sheets, e.g. for load tests, are generated from a seed:
+
+    $ %(prog)s --seed=42 > keysheet.txt
+
+Many sheets can be written at once; {n} in the output name is replaced with
+the sheet number:
+
+    $ %(prog)s --sheets=100 --jobs=4 --output=keysheet-{n}.txt
+
 """
 
 
+def block_rng(seed, sheet, block):
+    """Return the random number generator for a block of a sheet. If seed is
+    None, a cryptographically secure generator is returned.
+
+    """
+    if seed is None:
+        return secrets.SystemRandom()
+    return random.Random('%s/%d/%d' % (seed, sheet, block))
+
+
+def permutations(n, k):
+    """Return the number of ordered selections of k out of n items."""
+    count = 1
+    for i in range(n - k + 1, n + 1):
+        count *= i
+    return count
+
+
+# the number of possible settings for a day; a day is drawn with a single
+# randrange over this range instead of one call per choice
+DAY_SETTINGS = (permutations(len(ROTOR_NAMES), 5) *
+                len(KEYBOARD_CHARS) ** 5 *
+                permutations(len(KEYBOARD_CHARS), 2 * MAX_PAIRS) *
+                len(REFLECTOR_NAMES))
+
+
+def select(value, items, k):
+    """Decode value into an ordered selection of k distinct items.
+
+    Returns the remaining value and the selection.
+
+    """
+    items = list(items)
+    selection = []
+    for n in range(len(items), len(items) - k, -1):
+        value, i = divmod(value, n)
+        selection.append(items.pop(i))
+    return value, selection
+
+
+def generate_day(rng, day):
+    """Return the key sheet line for day, drawing the settings from rng."""
+
+    value = rng.randrange(DAY_SETTINGS)
+
+    value, rotors = select(value, ROTOR_NAMES, 5)
+
+    rings = []
+    for _ in range(5):
+        value, i = divmod(value, len(KEYBOARD_CHARS))
+        rings.append(KEYBOARD_CHARS[i])
+
+    value, plugs = select(value, KEYBOARD_LIST, 2 * MAX_PAIRS)
+    reflector = REFLECTOR_NAMES[value]
+
+    return SHEET_STR % (day,
+                        ''.join(' %s' % r for r in rotors),
+                        ''.join(' %s' % r for r in rings),
+                        ''.join(' %s%s' % p for p in zip(plugs[::2], plugs[1::2])),
+                        reflector)
+
+
+def generate_block(job):
+    """Return the lines of a block of days as a single string.
+
+    job - a tuple (seed, sheet, block, days); days is the number of days in
+    the sheet
+
+    """
+    seed, sheet, block, days = job
+    rng = block_rng(seed, sheet, block)
+    first = block * BLOCK_DAYS + 1
+    last = min(first + BLOCK_DAYS, days + 1)
+    return ''.join(generate_day(rng, day) + '\n' for day in range(first, last))
+
+
+def sheet_jobs(seed, sheet, days):
+    """Return the block jobs for a sheet."""
+    return [(seed, sheet, block, days) for block in range((days + BLOCK_DAYS - 1) // BLOCK_DAYS)]
+
+
+def write_sheet(f, blocks):
+    """Write a sheet header and an iterable of blocks to the file f."""
+    f.write(SHEET_HEADER + '\n')
+    for block in blocks:
+        f.write(block)
+
+
+def write_sheets(outputs, days=366, seed=None, jobs=1):
+    """Generate one key sheet per entry in outputs.
+
+    outputs - a list of file-like objects or of callables that return one
+    when called; the latter are called, written to and closed in turn
+
+    days - the number of days per sheet; sheets of more than MAX_DAYS days
+    have day numbers that key files do not accept
+
+    seed - a seed for reproducible sheets, or None for sheets drawn from a
+    cryptographically secure source
+
+    jobs - the number of worker processes
+
+    """
+    def write(n, blocks):
+        output = outputs[n]
+        if callable(output):
+            with output() as f:
+                write_sheet(f, blocks)
+        else:
+            write_sheet(output, blocks)
+
+    if jobs == 1:
+        for n in range(len(outputs)):
+            write(n, map(generate_block, sheet_jobs(seed, n + 1, days)))
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for n in range(len(outputs)):
+            write(n, pool.map(generate_block, sheet_jobs(seed, n + 1, days)))
+
+
 def main():
-    parser = argparse.ArgumentParser(prog='runigma', description=PROG_DESC, epilog=HELP_EPILOG,
+    parser = argparse.ArgumentParser(prog='runigma-sheet', description=PROG_DESC, epilog=HELP_EPILOG,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('-d', '--days', type=int, default=366,
-                        help='number of days to generate')
+                        help='number of days per sheet, at most %d [default: %%(default)s]'
+                        % MAX_DAYS)
+    parser.add_argument('-n', '--sheets', type=int, default=1,
+                        help='number of sheets to generate [default: %(default)s]')
+    parser.add_argument('-o', '--output',
+                        help=('output file; {n} is replaced with the sheet number'
+                              ' [default: standard output]'))
+    parser.add_argument('-s', '--seed',
+                        help='generate reproducible sheets from this seed')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes; 0 means one per CPU [default: %(default)s]')
 
     args = parser.parse_args()
-    print(SHEET_HEADER)
-    for day in range(args.days):
-        rotors = ''
-        rings = ''
-        reflector = choice(list(REFLECTORS.keys()))
-        plugboard = ''
-
-        # generate rotors:
-        rtrs = list(ROTORS.keys())
-        for i in range(5):
-            r = choice(rtrs)
-            rtrs.remove(r)
-            rotors += ' %s' % r
-
-        # generate rings:
-        for i in range(5):
-            rings += ' %s' % choice(KEYBOARD_CHARS)
-
-        # generate plugboard:
-        chrs = list(KEYBOARD_CHARS)
-        for i in range(20):
-            la = choice(chrs)
-            chrs.remove(la)
-            lb = choice(chrs)
-            chrs.remove(lb)
-            plugboard += ' %s%s' % (la, lb)
-
-        print(SHEET_STR % (day + 1, rotors, rings, plugboard, reflector))
+
+    if args.days < 0 or args.sheets < 1 or args.jobs < 0:
+        parser.error("Please specify non-negative counts")
+    if args.days > MAX_DAYS:
+        parser.error("A sheet has at most %d days" % MAX_DAYS)
+
+    if args.sheets > 1 and (args.output is None or '{n}' not in args.output):
+        parser.error("Please give an output name with {n} to write several sheets")
+
+    if args.output is None:
+        outputs = [sys.stdout]
+    else:
+        outputs = [(lambda name=args.output.replace('{n}', str(n + 1)):
+                    open(name, 'w', encoding='utf-8', buffering=1 << 20))
+                   for n in range(args.sheets)]
+
+    write_sheets(outputs, days=args.days, seed=args.seed, jobs=args.jobs or None)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,219 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains functions to compute the stepping schedule of the
+RuNigma rotors without pressing every key.
+
+See RuNigmaMachine._step_rotors for the mechanical rules. The right-most
+rotor moves on every key press. Every other rotor moves on a key press when
+either its right neighbour or the rotor itself has a notch over the pawl. A
+rotor therefore only needs to be looked at on the key presses where its right
+neighbour has a notch over the pawl (a "drive" event), and for as long as it
+is sitting on its own notches.
+
+Positions are the internal rotor positions (Rotor.pos) and notches are
+Rotor.notch_table lists indexed by position, so a rotor has as many positions
+as its notch table has entries.
+
+"""
+
+
+def drive_times(pos, notches, length):
+    """Return the key presses in range(length) at which the right-most rotor,
+    starting in position pos, has a notch over the pawl.
+
+    """
+    size = len(notches)
+    first = [(p - pos) % size for p in range(size) if notches[p]]
+    first.sort()
+
+    times = []
+    for base in range(0, length, size):
+        for t in first:
+            if base + t >= length:
+                break
+            times.append(base + t)
+
+    return times
+
+
+def step_times(pos, notches, drives, length):
+    """Run a rotor through length key presses.
+
+    pos - the position of the rotor before the first key press
+    notches - the notch table of the rotor
+    drives - a sorted sequence of the key presses at which the right
+    neighbour has a notch over the pawl; presses past length are ignored
+
+    Returns a tuple (pos, steps, notched): the position after the last key
+    press, the sorted list of key presses at which the rotor stepped, and the
+    sorted list of key presses at which it had a notch over the pawl itself.
+    The latter are the drive events for the rotor to the left.
+
+    """
+    size = len(notches)
+    steps = []
+    notched = []
+    n = len(drives)
+    i = 0
+    t = 0
+
+    while t < length:
+        if notches[pos]:
+            # the rotor pushes itself along
+            notched.append(t)
+        else:
+            # skip to the next time the neighbour pushes it
+            while i < n and drives[i] < t:
+                i += 1
+            if i == n or drives[i] >= length:
+                break
+            t = drives[i]
+
+        steps.append(t)
+        pos = (pos + 1) % size
+        t += 1
+
+    return pos, steps, notched
+
+
+class _Level:
+    """The stepping behaviour of one rotor that is driven by the rotors to
+    its right. See Schedule.
+
+    """
+
+    def __init__(self, pos, notches, pre_drives, start, period, cycle_drives):
+        self.notches = notches
+        self.start = start
+        self.period = period
+        self.cycle_drives = cycle_drives
+
+        # run the rotor up to the start of the periodic part of its driver
+        self.pre_drives = pre_drives
+        self.first_pos = pos
+        pos, steps, notched = step_times(pos, notches, pre_drives, start)
+        self.pre_steps = len(steps)
+
+        # then one driver period (a "window") at a time until the rotor
+        # position at the start of a window repeats
+        windows = {}
+        seq = []
+        seen = {}
+        while pos not in seen:
+            seen[pos] = len(seq)
+            seq.append(pos)
+            if pos not in windows:
+                windows[pos] = step_times(pos, notches, cycle_drives, period)
+            pos = windows[pos][0]
+
+        self.seq = seq
+        self.loop = seen[pos]
+
+        # cumulative step counts at the start of each window
+        self.window_steps = [0]
+        for p in seq:
+            self.window_steps.append(self.window_steps[-1] + len(windows[p][1]))
+
+        # the rotors up to and including this one become periodic from the
+        # first window of the loop on; collect the drive events for the rotor
+        # to the left
+        self.next_start = start + self.loop * period
+        self.next_period = (len(seq) - self.loop) * period
+        self.next_pre_drives = list(notched)
+        self.next_cycle_drives = []
+        for w, p in enumerate(seq):
+            if w < self.loop:
+                drives, base = self.next_pre_drives, start + w * period
+            else:
+                drives, base = self.next_cycle_drives, (w - self.loop) * period
+            drives.extend(base + t for t in windows[p][2])
+
+    def window(self, m):
+        """Return the index into seq of the m-th window."""
+        if m < len(self.seq):
+            return m
+        return self.loop + (m - self.loop) % (len(self.seq) - self.loop)
+
+    def after(self, n):
+        """Return (position, steps) of the rotor after n key presses."""
+
+        if n <= self.start:
+            pos, steps, _ = step_times(self.first_pos, self.notches,
+                                       self.pre_drives, n)
+            return pos, len(steps)
+
+        m, r = divmod(n - self.start, self.period)
+        w = self.window(m)
+
+        # steps in the first m windows
+        loop = self.loop
+        if m < len(self.seq):
+            steps = self.window_steps[m]
+        else:
+            cycles, rest = divmod(m - loop, len(self.seq) - loop)
+            per_cycle = self.window_steps[-1] - self.window_steps[loop]
+            steps = (self.window_steps[loop] + cycles * per_cycle +
+                     self.window_steps[loop + rest] - self.window_steps[loop])
+
+        pos, rest_steps, _ = step_times(self.seq[w], self.notches,
+                                        self.cycle_drives, r)
+        return pos, self.pre_steps + steps + len(rest_steps)
+
+
+class Schedule:
+    """The stepping schedule of a stack of rotors from a given start state.
+
+    positions - the positions of the rotors from left to right
+    notches - the notch tables of the rotors from left to right
+
+    The rotors to the right of any rotor move independently of it, and so
+    eventually repeat their positions with some period. Over one such period
+    the driven rotor moves from position p to g(p), which takes at most as
+    many values as the rotor has positions, 70 on the RuNigma Machine. Each
+    rotor is therefore computed from the rotors to its right one period at a
+    time, and the state after any number of key presses is found without
+    pressing every key.
+
+    """
+
+    def __init__(self, positions, notches):
+        self.positions = list(positions)
+        self.notches = list(notches)
+
+        # the right-most rotor
+        pos, notch = self.positions[-1], self.notches[-1]
+        start, period = 0, len(notch)
+        pre_drives, cycle_drives = [], drive_times(pos, notch, period)
+
+        # the others, from right to left
+        self.levels = []
+        for pos, notch in zip(reversed(self.positions[:-1]), reversed(self.notches[:-1])):
+            level = _Level(pos, notch, pre_drives, start, period, cycle_drives)
+            self.levels.append(level)
+            start, period = level.next_start, level.next_period
+            pre_drives, cycle_drives = level.next_pre_drives, level.next_cycle_drives
+
+        self.start = start
+        self.period = period
+
+    def after(self, n):
+        """Return a tuple (positions, steps) of lists, from left to right,
+        with the rotor positions and the number of times each rotor stepped
+        after n key presses.
+
+        """
+        if n < 0:
+            raise ValueError("negative number of key presses")
+
+        positions = [(self.positions[-1] + n) % len(self.notches[-1])]
+        steps = [n]
+        for level in self.levels:
+            pos, count = level.after(n)
+            positions.append(pos)
+            steps.append(count)
+
+        positions.reverse()
+        steps.reverse()
+        return positions, steps
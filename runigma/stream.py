@@ -0,0 +1,124 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains a function to process a text stream in constant
+memory.
+
+The input is read in fixed size blocks by a reader thread, processed by a
+compiled engine that carries the rotor positions from block to block, and
+written out by a writer thread. The threads are connected by bounded queues,
+so reading, processing and writing overlap while at most a few blocks are held
+in memory at a time.
+
+"""
+
+import queue
+import threading
+
+from .machine import VECTORIZE_THRESHOLD
+
+# the default number of characters read at a time
+BLOCK_SIZE = 1 << 16
+
+# the default number of blocks that may wait between two stages
+QUEUE_SIZE = 4
+
+# marks the end of the stream in a queue
+_END = None
+
+
+def _reader(infile, block_size, blocks, errors, stop):
+    """Read blocks from infile into the blocks queue until the end of the
+    file, or until stop is set.
+
+    """
+    try:
+        while not stop.is_set():
+            block = infile.read(block_size)
+            if not block:
+                break
+            blocks.put(block)
+    except Exception as ex:
+        errors.append(ex)
+    finally:
+        if not stop.is_set():
+            blocks.put(_END)
+
+
+def _writer(outfile, results, errors):
+    """Write blocks from the results queue to outfile."""
+    try:
+        while True:
+            block = results.get()
+            if block is _END:
+                break
+            outfile.write(block)
+    except Exception as ex:
+        errors.append(ex)
+        # keep draining so the producer never blocks
+        while results.get() is not _END:
+            pass
+
+
+def process_stream(machine, infile, outfile, replace_char='_',
+                   block_size=BLOCK_SIZE, queue_size=QUEUE_SIZE):
+    """Run the text read from the file-like object infile through the machine
+    and write the result to the file-like object outfile.
+
+    replace_char - as for RuNigmaMachine.process_text
+
+    block_size - the number of characters read at a time
+
+    queue_size - the number of blocks that may wait to be processed or
+    written
+
+    Returns the number of characters written. The rotors of the machine are
+    left in their final positions.
+
+    """
+    engine = machine.compile(vectorize=block_size >= VECTORIZE_THRESHOLD)
+
+    blocks = queue.Queue(queue_size)
+    results = queue.Queue(queue_size)
+    errors = []
+    stop = threading.Event()
+
+    reader = threading.Thread(target=_reader, args=(infile, block_size, blocks, errors, stop),
+                              daemon=True)
+    writer = threading.Thread(target=_writer, args=(outfile, results, errors),
+                              daemon=True)
+    reader.start()
+    writer.start()
+
+    count = 0
+    block = None
+    try:
+        while not errors:
+            block = blocks.get()
+            if block is _END:
+                break
+            result = engine.process_text(block, replace_char)
+            count += len(result)
+            results.put(result)
+    finally:
+        if block is _END:
+            reader.join()
+        else:
+            # stopped early: tell the reader to stop and make room for the
+            # block it may be putting. It is not waited for, as it may be
+            # blocked reading an endless input.
+            stop.set()
+            try:
+                while True:
+                    blocks.get_nowait()
+            except queue.Empty:
+                pass
+        results.put(_END)
+        writer.join()
+        engine.store()
+
+    if errors:
+        raise errors[0]
+
+    return count
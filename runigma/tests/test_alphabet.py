@@ -0,0 +1,113 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the Alphabet class and machines with other alphabets and rotor
+counts.
+
+"""
+
+import random
+import unittest
+
+from ..alphabet import Alphabet, AlphabetError, RUNIGMA, CLASSIC
+from ..machine import RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS
+from ..plugboard import Plugboard
+from ..rotors.rotor import Rotor
+from ..vectorized import VectorEngine, HAVE_NUMPY
+
+# the rotors I, II, III and reflector B of the Enigma I
+ENIGMA_ROTORS = [('I', 'EKMFLGDQVZNTOWYHXUSPAIBRCJ', 'Q'),
+                 ('II', 'AJDKSIRUXBLHWTMCQGZNPYFVOE', 'E'),
+                 ('III', 'BDFHJLCPRTXVZNYEIWGAKMUSQO', 'V')]
+ENIGMA_REFLECTOR = 'YRUHQSLDPXNGOKMIEBFZCWVJAT'
+
+
+def classic_machine(plugboard_settings=None):
+    """Return an Enigma I with the rotors I, II and III and reflector B."""
+    rotors = [Rotor(name, wiring, stepping=stepping, alphabet=CLASSIC)
+              for name, wiring, stepping in ENIGMA_ROTORS]
+    return RuNigmaMachine(rotors, Rotor('B', ENIGMA_REFLECTOR, alphabet=CLASSIC),
+                          Plugboard.from_key_sheet(plugboard_settings, CLASSIC))
+
+
+class AlphabetTestCase(unittest.TestCase):
+
+    def test_alphabet(self):
+        self.assertEqual(RUNIGMA.chars, KEYBOARD_CHARS)
+        self.assertEqual(len(CLASSIC), 26)
+        self.assertEqual(CLASSIC.index['C'], 2)
+        self.assertIn('Z', CLASSIC)
+        self.assertNotIn('z', CLASSIC)
+        self.assertEqual(Alphabet(CLASSIC.chars), CLASSIC)
+
+        self.assertEqual(CLASSIC.encode('CAB'), bytes([2, 0, 1]))
+        self.assertEqual(CLASSIC.decode(bytes([25, 0])), 'ZA')
+        self.assertEqual(RUNIGMA.decode(RUNIGMA.encode(KEYBOARD_CHARS)), KEYBOARD_CHARS)
+        self.assertRaises(AlphabetError, CLASSIC.encode, 'Ab')
+
+        for chars in ('A', 'ABCA', 'x' * 300):
+            self.assertRaises(AlphabetError, Alphabet, chars)
+
+        # a larger alphabet that is not all below code point 256
+        big = Alphabet(''.join(map(chr, range(0x400, 0x400 + 200))))
+        text = ''.join(reversed(big.chars))
+        self.assertEqual(big.decode(big.encode(text)), text)
+
+    def test_classic_machine(self):
+        machine = classic_machine()
+        machine.set_display('AAA')
+        self.assertEqual(machine.process_text('AAAAA'), 'BDZGO')
+        self.assertEqual(machine.get_display(), 'AAF')
+
+        # characters not in the alphabet are replaced as usual
+        machine.set_display('AAA')
+        self.assertEqual(machine.process_text('AAaAA', replace_char='A'), 'BDZGO')
+        self.assertRaises(RuNigmaError, machine.key_press, 'a')
+
+        # the double step of the middle rotor
+        machine.set_display('ADU')
+        machine.process_text('AAA')
+        self.assertEqual(machine.get_display(), 'BFX')
+
+    def test_engines_match_key_press(self):
+        rnd = random.Random(5)
+        text = ''.join(rnd.choice(CLASSIC.chars) for _ in range(5000))
+        slow = classic_machine('AB CD EF')
+        slow.set_display('QDV')
+        expected = ''.join(slow.key_press(c) for c in text)
+
+        machine = classic_machine('AB CD EF')
+        machine.set_display('QDV')
+        self.assertEqual(machine.process_text(text), expected)
+        self.assertEqual(machine.get_display(), slow.get_display())
+        self.assertEqual(machine.get_rotor_counts(), slow.get_rotor_counts())
+
+        machine.seek(0)
+        if HAVE_NUMPY:
+            self.assertEqual(VectorEngine(machine).process_text(text), expected)
+        machine.seek(len(text))
+        self.assertEqual(machine.get_display(), slow.get_display())
+
+    def test_rotor_counts(self):
+        rnd = random.Random(6)
+        text = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(3000))
+        for rotors in ('Ь Ч', 'Ь Ч Ю', 'Ь Ч Ю Г Ъ Ш А'):
+            settings = dict(rotors=rotors, reflector='Ш', plugboard_settings='zy Ю0')
+            slow = RuNigmaMachine.from_key_sheet(**settings)
+            expected = ''.join(slow.key_press(c) for c in text)
+
+            machine = RuNigmaMachine.from_key_sheet(**settings)
+            self.assertEqual(machine.process_text(text), expected)
+            self.assertEqual(machine.get_rotor_counts(), slow.get_rotor_counts())
+            if HAVE_NUMPY:
+                machine.seek(0)
+                self.assertEqual(VectorEngine(machine).process_text(text), expected)
+
+        self.assertRaises(RuNigmaError, RuNigmaMachine.from_key_sheet, 'Ь')
+
+    def test_mixed_alphabets(self):
+        machine = classic_machine()
+        self.assertRaises(RuNigmaError, RuNigmaMachine, machine.rotors, machine.reflector,
+                          Plugboard())
+        self.assertRaises(RuNigmaError, machine.encrypt_bytes, b'data')
@@ -0,0 +1,288 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the analysis package."""
+
+import collections
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from ..analysis import ngrams
+from ..analysis.bombe import Bombe, Menu, search, step_patterns
+from ..analysis.main import main
+from ..analysis.ngrams import NgramTables, normalize
+from ..analysis.period import analyze_machine, is_weak, StackAnalysis
+from ..analysis.plugboard import PlugboardSolver, solve
+from ..keyfile import random_settings
+from ..machine import RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS
+from ..plugboard import Plugboard
+from ..stepping import Schedule
+from ..vectorized import numpy, HAVE_NUMPY
+
+
+class PeriodTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(5)
+        self.machine = RuNigmaMachine.from_key_sheet(**random_settings(rnd))
+        self.machine.set_display(''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5)))
+
+    def test_period(self):
+        analysis = analyze_machine(self.machine)
+        schedule = Schedule([r.pos for r in self.machine.rotors],
+                            [r.notch_table for r in self.machine.rotors])
+
+        start, steps = schedule.after(analysis.transient)
+        end, end_steps = schedule.after(analysis.transient + analysis.period)
+        self.assertEqual(start, end)
+        self.assertEqual([b - a for a, b in zip(steps, end_steps)], analysis.cycle_steps)
+        self.assertEqual(analysis.cycle_steps[-1], analysis.period)
+        self.assertEqual(analysis.step_rates[-1], 1.0)
+
+    def test_next_step(self):
+        analysis = analyze_machine(self.machine)
+        first = [None] * 5
+        for n in range(1, 20000):
+            self.machine.key_press('a')
+            for i, count in enumerate(self.machine.get_rotor_counts()):
+                if count and first[i] is None:
+                    first[i] = n
+
+        for i in range(5):
+            if first[i] is not None:
+                self.assertEqual(analysis.next_step[i], first[i])
+            else:
+                self.assertGreaterEqual(analysis.next_step[i], 20000)
+
+    def test_weak(self):
+        # without notches only the right-most rotor steps
+        notches = [[False] * len(KEYBOARD_CHARS)] * 5
+        analysis = StackAnalysis([0] * 5, notches)
+        self.assertEqual(analysis.period, len(KEYBOARD_CHARS))
+        self.assertEqual(analysis.next_step, [None, None, None, None, 1])
+        self.assertTrue(is_weak(analysis, 1, 1e-7))
+        self.assertFalse(is_weak(analyze_machine(self.machine), 70 ** 4, 1e-7))
+
+
+@unittest.skipUnless(HAVE_NUMPY, "NumPy is not installed")
+class BombeTestCase(unittest.TestCase):
+
+    crib = 'ПРИВЕТ_ШТАБУ_ДИВИЗИИ_'
+
+    def setUp(self):
+        self.rnd = random.Random(10)
+        self.settings = random_settings(self.rnd)
+
+    def encipher(self, counts):
+        """Return the ciphertext and the internal positions of a start at
+        which the rotors step counts times during the crib, and the crib
+        indices at which the fourth rotor steps, or None.
+
+        """
+        while True:
+            machine = RuNigmaMachine.from_key_sheet(**self.settings)
+            machine.set_display(''.join(self.rnd.choice(KEYBOARD_CHARS) for _ in range(5)))
+            positions = tuple(r.pos for r in machine.rotors)
+
+            ciphertext = ''
+            turnover = []
+            for i, c in enumerate(self.crib):
+                steps = machine.get_rotor_counts()[3]
+                ciphertext += machine.key_press(c)
+                if machine.get_rotor_counts()[3] > steps:
+                    turnover.append(i)
+            if machine.get_rotor_counts()[:4] == counts:
+                return (ciphertext + machine.process_text('НА_РАССВЕТЕ'), positions,
+                        tuple(turnover) or None)
+
+    def assertStop(self, stops, positions, turnover=None):
+        plugboard = Plugboard.from_key_sheet(self.settings['plugboard_settings'])
+        found = [stop for stop in stops if stop.positions == positions and
+                 stop.turnover == turnover and
+                 all(plugboard.signal(a) == b for a, b in stop.steckers.items())]
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].rotors, self.settings['rotors'])
+
+    def test_menu(self):
+        menu = Menu('abca', 'bcax')
+        self.assertEqual(menu.centre, KEYBOARD_CHARS.index('a'))
+        self.assertEqual(menu.loops, 1)
+        self.assertEqual(len(menu.links), 4)
+        self.assertEqual(len(menu.all_links), 4)
+        self.assertRaises(RuNigmaError, Menu, 'abc', 'ab')
+        self.assertRaises(RuNigmaError, Menu, 'ab', 'a\n')
+
+    def test_run(self):
+        # the fourth rotor does not step, so it need not be tried stepping
+        ciphertext, positions, _ = self.encipher([0, 0, 0, 0])
+        bombe = Bombe(self.crib, ciphertext, turnover=False)
+        stops = bombe.run(self.settings['rotors'], self.settings['reflector'],
+                          [positions[:3], ((positions[0] + 1) % 70,) + positions[1:3]])
+        self.assertStop(stops, positions)
+
+    def test_turnover(self):
+        # the fourth rotor steps twice during the crib
+        ciphertext, positions, turnover = self.encipher([0, 0, 0, 2])
+        stops = Bombe(self.crib, ciphertext, turnover=False).run(
+            self.settings['rotors'], self.settings['reflector'], [positions[:3]])
+        self.assertNotIn(positions, [stop.positions for stop in stops])
+
+        stops = Bombe(self.crib, ciphertext).run(self.settings['rotors'],
+                                                  self.settings['reflector'], [positions[:3]])
+        self.assertStop(stops, positions, turnover)
+
+    def test_step_patterns(self):
+        name = self.settings['rotors'][4]
+        patterns = step_patterns(name, len(self.crib))
+        self.assertEqual(patterns[0], ())
+        self.assertEqual(len(patterns), len(set(patterns)))
+
+        # the patterns of the right-most rotor at every display and ring
+        # setting are the ones of a machine
+        machine = RuNigmaMachine.from_key_sheet(**self.settings)
+        for display in KEYBOARD_CHARS[::7]:
+            machine.set_display('aaaa' + display)
+            counts = []
+            for _ in self.crib:
+                machine.key_press('a')
+                counts.append(machine.get_rotor_counts()[3])
+            steps = tuple(i for i, count in enumerate(counts)
+                          if count > (counts[i - 1] if i else 0))
+            self.assertIn(steps, patterns)
+
+    def test_search(self):
+        ciphertext, positions, _ = self.encipher([0, 0, 0, 0])
+        stops = search(self.crib, ciphertext, orders=[self.settings['rotors']],
+                       reflectors=[self.settings['reflector']], left=[positions[:3]],
+                       turnover=False, jobs=1)
+        self.assertStop(stops, positions)
+
+
+@unittest.skipUnless(HAVE_NUMPY, "NumPy is not installed")
+class PlugboardSolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(7)
+        words = ['ПРИВЕТ_', 'МИР_', 'ВОЙНА_', 'И_', 'АТАКА_', 'НА_', 'РАССВЕТЕ_',
+                 'ШТАБ_', 'КОМАНДИР_', 'ДИВИЗИЯ_', 'ПОЛК_']
+        self.plaintext = ''.join(rnd.choice(words) for _ in range(80))
+
+        self.settings = random_settings(rnd)
+        self.start = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5))
+        machine = RuNigmaMachine.from_key_sheet(**self.settings)
+        machine.set_display(self.start)
+        self.ciphertext = machine.process_text(self.plaintext)
+
+        self.machine = RuNigmaMachine.from_key_sheet(**dict(self.settings, plugboard_settings=None))
+        self.machine.set_display(self.start)
+
+    def test_scores(self):
+        solver = PlugboardSolver(self.machine, self.ciphertext, ngrams=numpy.arange(70 ** 2))
+        plugboard = Plugboard.from_key_sheet('ab cd Жz 09')
+        a, b, wirings = solver.candidates(plugboard)
+
+        for i in range(0, len(wirings), 97):
+            with plugboard:
+                if plugboard.is_connected(a[i], b[i]):
+                    plugboard.disconnect(a[i])
+                else:
+                    plugboard.connect(a[i], b[i])
+                self.assertEqual(wirings[i].tolist(), plugboard.wiring_map)
+
+                machine = RuNigmaMachine(self.machine.rotors, self.machine.reflector, plugboard)
+                machine.set_display(self.start)
+                plaintext = [KEYBOARD_CHARS.index(c) for c in machine.process_text(self.ciphertext)]
+                self.assertEqual(solver.decrypt(wirings[i:i + 1])[0].tolist(), plaintext)
+
+                ioc = sum(f * (f - 1) for f in collections.Counter(plaintext).values())
+                self.assertEqual(solver.ioc_score(plugboard.wiring_map), ioc)
+                self.assertEqual(solver.ngram_scores(wirings[i:i + 1])[0],
+                                 sum(x * 70 + y for x, y in zip(plaintext, plaintext[1:])))
+
+        scores = solver.ioc_scores(plugboard.wiring_map, a, b, wirings)
+        self.assertEqual(scores.tolist(), [solver.ioc_score(w) for w in wirings])
+
+    def test_solve(self):
+        result = solve(self.machine, self.ciphertext, restarts=2, seed=1)
+        self.assertEqual(result.plaintext, self.plaintext)
+        self.assertEqual(result.plugboard.army_str(),
+                         Plugboard.from_key_sheet(self.settings['plugboard_settings']).army_str())
+
+
+@unittest.skipUnless(HAVE_NUMPY, "NumPy is not installed")
+class NgramTablesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(8)
+        words = ['Привет,', 'мир', 'война', 'и', 'атака!', 'на', 'рассвете', 'the', 'quick', '1941']
+        self.corpus = ' '.join(rnd.choice(words) for _ in range(5000))
+        self.tables = NgramTables.train([self.corpus])
+
+    def test_normalize(self):
+        self.assertEqual(normalize('Привет, world!  OK'), 'ПРИВЕТ_world_ok')
+
+    def test_train(self):
+        keys = ngrams.encode(normalize(self.corpus))
+        for order in range(1, 4):
+            table = self.tables.table(order)
+            self.assertEqual(len(table), 70 ** order)
+            self.assertAlmostEqual(float(numpy.exp(table.astype(numpy.float64)).sum()), 1.0, places=4)
+
+            # the most frequent n-gram is the one with the highest score
+            index = ngrams.window_index(keys, order)
+            self.assertEqual(numpy.bincount(index).argmax(), table.argmax())
+
+        # counting in blocks gives the same tables
+        block_size = ngrams.BLOCK_SIZE
+        ngrams.BLOCK_SIZE = 101
+        try:
+            tables = NgramTables.train([self.corpus])
+        finally:
+            ngrams.BLOCK_SIZE = block_size
+        for a, b in zip(tables.tables, self.tables.tables):
+            self.assertTrue((a == b).all())
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.ngr')
+            self.tables.save(path)
+            with NgramTables.load(path) as tables:
+                for a, b in zip(tables.tables, self.tables.tables):
+                    self.assertTrue((a == b).all())
+
+            with open(path, 'r+b') as f:
+                f.write(b'X')
+            self.assertRaises(RuNigmaError, NgramTables.load, path)
+
+    def test_update(self):
+        rnd = random.Random(9)
+        keys = ngrams.encode(normalize(self.corpus))[:1000].copy()
+        for order in range(1, 4):
+            score = self.tables.score(keys, order)
+            for _ in range(20):
+                positions = rnd.sample(range(len(keys)), rnd.randint(1, 4))
+                values = [rnd.randrange(70) for _ in positions]
+                score = self.tables.update(keys, score, positions, values, order)
+                self.assertAlmostEqual(score, self.tables.score(keys, order), places=2)
+
+        rows = numpy.stack([keys, keys[::-1]])
+        self.assertEqual(self.tables.score(rows).tolist(),
+                         [self.tables.score(keys), self.tables.score(keys[::-1])])
+
+
+class MainTestCase(unittest.TestCase):
+
+    def test_stray_arguments(self):
+        # only train takes positional arguments after the command
+        for command in ('period', 'sheet', 'plugboard', 'bombe'):
+            stderr = io.StringIO()
+            with mock.patch('sys.argv', ['runigma-analyze', command, 'stray.txt']), \
+                    contextlib.redirect_stderr(stderr):
+                self.assertRaises(SystemExit, main)
+            self.assertIn('train', stderr.getvalue())
@@ -0,0 +1,48 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for RuNigmaMachine.process_many."""
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import random
+import unittest
+
+from ..machine import RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS
+from ..batch import process_many
+
+
+class ProcessManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(9)
+        self.machine = RuNigmaMachine.from_key_sheet(rotors='Ь Ч Ю Г Ъ', reflector='Ш',
+                                                     ring_settings='r _ s Ч n',
+                                                     plugboard_settings='zy Ю0 ЪЭ 6Ф')
+        self.messages = [(''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5)),
+                          ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(rnd.randrange(50, 250))))
+                         for _ in range(40)]
+
+        self.expected = []
+        for start, text in self.messages:
+            self.machine.set_display(start)
+            self.expected.append(self.machine.process_text(text))
+        self.machine.set_display('aaaaa')
+
+    def test_process_many(self):
+        self.assertEqual(self.machine.process_many(self.messages), self.expected)
+        self.assertEqual(self.machine.get_display(), 'aaaaa')
+
+    def test_thread_pool(self):
+        with ThreadPoolExecutor(2) as executor:
+            result = process_many(self.machine, self.messages, executor=executor, batch_size=7)
+        self.assertEqual(result, self.expected)
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(2) as executor:
+            result = process_many(self.machine, self.messages, executor=executor, batch_size=7)
+        self.assertEqual(result, self.expected)
+
+    def test_bad_start(self):
+        self.assertRaises(RuNigmaError, self.machine.process_many, [('aaaa', 'abc')])
+        self.assertRaises(RuNigmaError, self.machine.process_many, [('aaaa!', 'abc')])
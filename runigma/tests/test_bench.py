@@ -0,0 +1,34 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the benchmark suite."""
+
+import json
+import unittest
+
+from ..bench import run_benchmarks, compare_results
+
+
+class BenchTestCase(unittest.TestCase):
+
+    def test_run(self):
+        results = run_benchmarks(['process_text', 'Plugboard'], sizes=[10], repeat=1,
+                                 min_time=0.001)
+        self.assertEqual(sorted(results['results']),
+                         ['Plugboard.from_key_sheet', 'process_text[10]'])
+
+        result = results['results']['process_text[10]']
+        self.assertEqual(result['unit'], 'chars')
+        self.assertGreater(result['throughput'], 0)
+        self.assertGreater(result['peak_memory'], 0)
+        self.assertEqual(result['memory_per_unit'], result['peak_memory'] / 10)
+        self.assertEqual(json.loads(json.dumps(results)), results)
+
+    def test_compare(self):
+        baseline = dict(results={'a': dict(throughput=100.0), 'b': dict(throughput=100.0),
+                                 'c': dict(throughput=100.0)})
+        current = dict(results={'a': dict(throughput=95.0), 'b': dict(throughput=80.0),
+                                'd': dict(throughput=1.0)})
+        self.assertEqual(compare_results(baseline, current, 0.1),
+                         [('a', 0.95, False), ('b', 0.8, True)])
@@ -0,0 +1,77 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the MachineCache class."""
+
+import unittest
+
+from ..cache import MachineCache, MACHINE_CACHE
+from ..machine import RuNigmaMachine
+
+
+class MachineCacheTestCase(unittest.TestCase):
+
+    SETTINGS = dict(rotors='Ь Ч Ю Г Ъ', reflector='Ш', ring_settings='r _ s Ч n',
+                    plugboard_settings='zy Ю0 ЪЭ')
+
+    def test_counters(self):
+        cache = MachineCache(maxsize=2)
+        for key in ('a', 'b', 'a', 'c', 'b'):
+            cache.get(key, lambda: RuNigmaMachine.from_key_sheet(**self.SETTINGS))
+
+        self.assertEqual(cache.info(), dict(hits=1, misses=4, evictions=2, size=2, maxsize=2))
+        cache.resize(1)
+        self.assertEqual(cache.evictions, 3)
+        self.assertEqual(len(cache), 1)
+
+        # clearing drops the machines, not the counters
+        cache.clear()
+        self.assertEqual(cache.info(), dict(hits=1, misses=4, evictions=3, size=0, maxsize=1))
+
+    def test_independent_machines(self):
+        MACHINE_CACHE.clear()
+        hits = MACHINE_CACHE.hits
+        first = RuNigmaMachine.from_key_sheet(**self.SETTINGS)
+        settings = dict(self.SETTINGS, plugboard_settings='ЭЪ yz Ю0')
+        second = RuNigmaMachine.from_key_sheet(**settings)
+        self.assertEqual(MACHINE_CACHE.hits, hits + 1)
+        self.assertIs(first.rotors[0].forward_table, second.rotors[0].forward_table)
+
+        first.set_display('vhЯkК')
+        first.plugboard.connect(0, 1)
+        cipher_text = first.process_text('hello_world')
+
+        self.assertEqual(second.get_display(), 'aaaaa')
+        self.assertFalse(second.plugboard.is_connected(0, 1))
+
+        third = RuNigmaMachine.from_key_sheet(**self.SETTINGS)
+        third.set_display('vhЯkК')
+        third.plugboard.connect(0, 1)
+        self.assertEqual(third.process_text(cipher_text), 'hello_world')
+
+    def test_shared_tables(self):
+        MACHINE_CACHE.clear()
+        hits = MACHINE_CACHE.hits
+        first = RuNigmaMachine.from_key_sheet(**self.SETTINGS)
+        MACHINE_CACHE.clear()
+        settings = dict(self.SETTINGS, ring_settings='a _ s Ч n')
+        second = RuNigmaMachine.from_key_sheet(**settings)
+
+        # built twice, but the wiring tables are shared, and so are the ring
+        # tables of the rotors with the same ring setting
+        self.assertEqual(MACHINE_CACHE.hits, hits)
+        self.assertIs(first.rotors[0].wiring, second.rotors[0].wiring)
+        self.assertIsNot(first.rotors[0].ring, second.rotors[0].ring)
+        self.assertIs(first.rotors[1].ring, second.rotors[1].ring)
+        self.assertFalse(hasattr(first.rotors[0], '__dict__'))
+        self.assertFalse(hasattr(first, '__dict__'))
+
+        # copies share the plugboard wiring until one is rewired
+        copy = first.copy()
+        self.assertIs(copy.plugboard.wiring_map, first.plugboard.wiring_map)
+        copy.plugboard.connect(0, 1)
+        self.assertFalse(first.plugboard.is_connected(0, 1))
+        with first.plugboard:
+            first.plugboard.connect(2, 3)
+        self.assertFalse(first.plugboard.is_connected(2, 3))
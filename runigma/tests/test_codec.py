@@ -0,0 +1,61 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the codec module and the bytes API of RuNigmaMachine."""
+
+import random
+import unittest
+
+from .. import codec
+from ..machine import RuNigmaMachine, RuNigmaError
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        rnd = random.Random(7)
+        for n in list(range(20)) + [1000, 1001, 1002]:
+            data = bytes(rnd.randrange(256) for _ in range(n))
+            digits = codec.encode(memoryview(data))
+            self.assertEqual(len(digits), codec.encoded_length(n))
+            self.assertTrue(all(d < 70 for d in digits))
+            self.assertEqual(codec.decode(digits), data)
+
+    def test_incremental(self):
+        rnd = random.Random(8)
+        data = bytes(rnd.randrange(256) for _ in range(5000))
+
+        encoder = codec.Encoder()
+        digits = b''.join(encoder.update(data[i:i + 101]) for i in range(0, len(data), 101))
+        digits += encoder.final()
+        self.assertEqual(digits, codec.encode(data))
+        self.assertEqual(encoder.stats.raw, len(data))
+        self.assertAlmostEqual(encoder.stats.expansion, 4 / 3, places=3)
+
+        decoder = codec.Decoder()
+        result = b''.join(decoder.update(digits[i:i + 77]) for i in range(0, len(digits), 77))
+        self.assertEqual(result + decoder.final(), data)
+
+    def test_invalid(self):
+        self.assertRaises(codec.CodecError, codec.decode, b'\x01')
+        self.assertRaises(codec.CodecError, codec.decode, b'\x45\x45\x45\x45')
+        self.assertRaises(codec.CodecError, codec.decode, b'\x46\x00')
+
+
+class BytesTestCase(unittest.TestCase):
+
+    def test_encrypt_decrypt(self):
+        data = bytes(range(256)) * 10
+        machine = RuNigmaMachine.from_key_sheet(rotors='Ь Ч Ю Г Ъ', reflector='Ш')
+        machine.set_display('vhЯkК')
+        stats = codec.CodecStats()
+        text = machine.encrypt_bytes(bytearray(data), stats)
+        self.assertEqual(stats.raw, len(data))
+        self.assertEqual(stats.encoded, len(text))
+
+        machine.set_display('vhЯkК')
+        self.assertEqual(machine.decrypt_bytes(text), data)
+
+        machine.set_display('vhЯkК')
+        self.assertRaises(RuNigmaError, machine.decrypt_bytes, text + '!')
@@ -0,0 +1,264 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the FastEngine class."""
+
+import array
+import random
+import unittest
+
+from ..engine import ENGINE_CACHE
+from ..keyfile import random_settings
+from ..machine import RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS
+from ..plugboard import Plugboard
+from ..rotors.data import ROTORS
+from ..rotors.factory import create_reflector
+from ..rotors.rotor import Rotor
+from ..stepping import Schedule
+from ..vectorized import VectorEngine, HAVE_NUMPY, numpy
+
+
+def key_press_text(machine, text):
+    """Process text one key press at a time."""
+    return ''.join(machine.key_press(c) for c in text)
+
+
+class FastEngineTestCase(unittest.TestCase):
+
+    def test_matches_key_press(self):
+        rnd = random.Random(1)
+        for _ in range(20):
+            settings = random_settings(rnd)
+            start = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5))
+            text = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(2000))
+
+            slow = RuNigmaMachine.from_key_sheet(**settings)
+            slow.set_display(start)
+            fast = RuNigmaMachine.from_key_sheet(**settings)
+            fast.set_display(start)
+
+            self.assertEqual(fast.process_text(text), key_press_text(slow, text))
+            self.assertEqual(fast.get_display(), slow.get_display())
+            self.assertEqual(fast.get_rotor_counts(), slow.get_rotor_counts())
+
+    def test_state_carries_across_calls(self):
+        machine = RuNigmaMachine.from_key_sheet()
+        machine.set_display('aaaaa')
+        engine = machine.compile()
+        text = KEYBOARD_CHARS * 10
+        result = engine.process_text(text[:333]) + engine.process_text(text[333:])
+
+        machine.set_display('aaaaa')
+        self.assertEqual(result, machine.process_text(text))
+        engine.store()
+        self.assertEqual(engine.positions, [r.pos for r in machine.rotors])
+
+    def test_composite_cache(self):
+        machine = RuNigmaMachine.from_key_sheet(**random_settings(random.Random(5)))
+        engine = machine.compile()
+        text = KEYBOARD_CHARS * 100
+        result = engine.copy().process_text(text)
+
+        # copies share the composites of the slow rotors
+        misses = engine._composite.cache_info().misses
+        self.assertEqual(engine.copy().process_text(text), result)
+        self.assertEqual(engine._composite.cache_info().misses, misses)
+
+    def test_engine_cache(self):
+        machine = RuNigmaMachine.from_key_sheet(**random_settings(random.Random(6)))
+        text = KEYBOARD_CHARS * 3
+        machine.compile()
+        hits = ENGINE_CACHE.hits
+        slow = machine.copy()
+        self.assertEqual(machine.copy().process_text(text), key_press_text(slow.copy(), text))
+        self.assertEqual(ENGINE_CACHE.hits, hits + 1)
+
+        # rewiring the plugboard compiles a new engine
+        x, _ = min(machine.plugboard.get_pairs())
+        machine.plugboard.disconnect(x)
+        slow.plugboard.disconnect(x)
+        self.assertEqual(machine.process_text(text), key_press_text(slow, text))
+
+    def test_short_text(self):
+        # short texts are run through key_press instead of an engine
+        machine = RuNigmaMachine.from_key_sheet(**random_settings(random.Random(7)))
+        for text in ('', 'a', 'a!Я', 'ЖЖЖЖЖ', 'abcdef', 'a!b!c!d'):
+            slow = machine.copy()
+            self.assertEqual(machine.process_text(text), key_press_text(slow, text.replace('!', '_')))
+            self.assertEqual(machine.get_rotor_counts(), slow.get_rotor_counts())
+        self.assertEqual(len(machine.process_text('a!b', replace_char=None)), 2)
+        self.assertRaises(RuNigmaError, machine.process_text, 'a!b', replace_char='!')
+
+    def test_no_notches(self):
+        # the right-most rotor turns all the way round without moving the
+        # others
+        rotors = [Rotor(name, ROTORS[name]['wiring'], 3, '' if name == 'Ю' else 'a')
+                  for name in 'АБВГЮ']
+        machine = RuNigmaMachine(rotors, create_reflector('Ш'), Plugboard.from_key_sheet('ab'))
+        text = KEYBOARD_CHARS * 5
+        fast = machine.copy()
+        self.assertEqual(fast.process_text(text), key_press_text(machine, text))
+        self.assertEqual(fast.get_rotor_counts(), machine.get_rotor_counts())
+
+    def test_replace_char(self):
+        machine = RuNigmaMachine.from_key_sheet()
+        machine.set_display('aaaaa')
+        replaced = machine.process_text('ab!c', replace_char='_')
+        machine.set_display('aaaaa')
+        dropped = machine.process_text('ab!c', replace_char=None)
+        machine.set_display('aaaaa')
+        self.assertEqual(replaced, machine.process_text('ab_c'))
+        self.assertEqual(len(dropped), 3)
+
+
+class PermutationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = RuNigmaMachine.from_key_sheet(**random_settings(random.Random(7)))
+        self.machine.set_display('aЯ_Юz')
+
+    def test_iter_permutations(self):
+        slow = self.machine.copy()
+        permutations = list(self.machine.iter_permutations(300))
+        self.assertEqual(len(permutations), 300)
+
+        for permutation in permutations:
+            # every key of the same key press lights the lamp given
+            lamps = [slow.copy().key_press(c) for c in KEYBOARD_CHARS]
+            self.assertEqual(permutation, bytes(KEYBOARD_CHARS.index(c) for c in lamps))
+            slow.key_press('a')
+
+        self.assertEqual(self.machine.get_display(), slow.get_display())
+        self.assertEqual(self.machine.get_rotor_counts(), slow.get_rotor_counts())
+
+    def test_stop_early(self):
+        expected = self.machine.copy()
+        key_press_text(expected, 'a' * 1000)
+
+        permutations = self.machine.iter_permutations(2000)
+        for _ in range(1000):
+            next(permutations)
+        permutations.close()
+        self.assertEqual(self.machine.get_display(), expected.get_display())
+        self.assertEqual(self.machine.get_rotor_counts(), expected.get_rotor_counts())
+
+    def test_fill_permutations(self):
+        rnd = random.Random(8)
+        n = 5000
+        keys = bytes(rnd.randrange(len(KEYBOARD_CHARS)) for _ in range(n))
+        slow = self.machine.copy()
+        lamps = slow.compile().process_keys(keys)
+
+        buffer = array.array('B', bytes(n * len(KEYBOARD_CHARS)))
+        positions = bytearray(n * 5)
+        self.assertEqual(self.machine.fill_permutations(buffer, positions), n)
+        self.assertEqual(bytes(buffer[t * len(KEYBOARD_CHARS) + k] for t, k in enumerate(keys)),
+                         lamps)
+
+        slow = self.machine.copy()
+        slow.seek(0)
+        for t in range(n):
+            slow.key_press('a')
+            self.assertEqual(list(positions[t * 5:t * 5 + 5]), [r.pos for r in slow.rotors])
+        self.assertEqual(self.machine.get_display(), slow.get_display())
+
+        # the buffers must be writable bytes of whole rows
+        self.assertRaises(RuNigmaError, self.machine.fill_permutations, bytes(70))
+        self.assertRaises(RuNigmaError, self.machine.fill_permutations, bytearray(71))
+        self.assertRaises(RuNigmaError, self.machine.fill_permutations, bytearray(140),
+                          bytearray(5))
+
+    @unittest.skipUnless(HAVE_NUMPY, 'NumPy is not installed')
+    def test_numpy_buffers(self):
+        other = self.machine.copy()
+        buffer = numpy.zeros((100, len(KEYBOARD_CHARS)), dtype=numpy.uint8)
+        positions = numpy.zeros((100, 5), dtype=numpy.uint8)
+        self.machine.fill_permutations(buffer, positions)
+
+        self.assertEqual([bytes(row) for row in buffer], list(other.iter_permutations(100)))
+        self.assertEqual(positions[-1].tolist(), [r.pos for r in self.machine.rotors])
+
+
+@unittest.skipUnless(HAVE_NUMPY, 'NumPy is not installed')
+class VectorEngineTestCase(unittest.TestCase):
+
+    def test_matches_fast_engine(self):
+        rnd = random.Random(2)
+        for _ in range(10):
+            settings = random_settings(rnd)
+            start = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5))
+            text = ''.join(rnd.choice(KEYBOARD_CHARS + '!') for _ in range(20000))
+
+            fast = RuNigmaMachine.from_key_sheet(**settings)
+            fast.set_display(start)
+            vector = RuNigmaMachine.from_key_sheet(**settings)
+            vector.set_display(start)
+
+            engine = vector.compile(vectorize=True)
+            self.assertIsInstance(engine, VectorEngine)
+            result = engine.process_text(text[:12345]) + engine.process_text(text[12345:])
+            engine.store()
+
+            engine = fast.compile()
+            self.assertEqual(result, engine.process_text(text))
+            engine.store()
+            self.assertEqual(vector.get_display(), fast.get_display())
+            self.assertEqual(vector.get_rotor_counts(), fast.get_rotor_counts())
+
+    def test_surrogates(self):
+        # lone surrogates are replaced or dropped like any other character not
+        # on the keyboard
+        machine = RuNigmaMachine.from_key_sheet(**random_settings(random.Random(9)))
+        text = 'abc\udc80def\ud800' * 10
+        for replace_char in ('_', None):
+            self.assertEqual(VectorEngine(machine).process_text(text, replace_char),
+                             machine.compile().process_text(text, replace_char))
+
+
+class SeekTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(3)
+        self.settings = random_settings(rnd)
+        self.start = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5))
+        self.text = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(30000))
+        self.machine = RuNigmaMachine.from_key_sheet(**self.settings)
+        self.machine.set_display(self.start)
+
+    def test_seek_decrypts_slice(self):
+        cipher_text = self.machine.process_text(self.text)
+        final_display = self.machine.get_display()
+        final_counts = self.machine.get_rotor_counts()
+
+        self.machine.set_display(self.start)
+        for n in (0, 1, 69, 70, 4899, 12345, 29999):
+            self.machine.seek(n)
+            self.assertEqual(self.machine.process_text(cipher_text[n:n + 100]),
+                             self.text[n:n + 100])
+
+        self.machine.seek(len(self.text))
+        self.assertEqual(self.machine.get_display(), final_display)
+        self.assertEqual(self.machine.get_rotor_counts(), final_counts)
+
+    def test_advance(self):
+        other = RuNigmaMachine.from_key_sheet(**self.settings)
+        other.set_display(self.start)
+        other.process_text(self.text)
+
+        self.machine.advance(10000)
+        self.machine.advance(len(self.text) - 10000)
+        self.assertEqual(self.machine.get_display(), other.get_display())
+        self.assertEqual(self.machine.get_rotor_counts(), other.get_rotor_counts())
+
+    def test_schedule_far_ahead(self):
+        rnd = random.Random(4)
+        notches = [r.notch_table for r in self.machine.rotors]
+        schedule = Schedule([r.pos for r in self.machine.rotors], notches)
+        for _ in range(50):
+            a = rnd.randrange(10 ** 12)
+            b = rnd.randrange(10 ** 9)
+            positions, steps_a = schedule.after(a)
+            positions, steps_b = Schedule(positions, notches).after(b)
+            self.assertEqual((positions, [x + y for x, y in zip(steps_a, steps_b)]),
+                             schedule.after(a + b))
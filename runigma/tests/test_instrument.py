@@ -0,0 +1,75 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the instrumented code path."""
+
+import random
+import unittest
+
+from ..keyfile import random_settings
+from ..machine import RuNigmaMachine, KEYBOARD_CHARS
+from ..plugboard import Plugboard
+
+
+class InstrumentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(6)
+        self.settings = random_settings(rnd)
+        self.text = ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(20000))
+
+    def machine(self):
+        machine = RuNigmaMachine.from_key_sheet(**self.settings)
+        machine.set_display('aaaaa')
+        return machine
+
+    def test_same_output(self):
+        plain = self.machine()
+        instrumented = self.machine()
+        stats = instrumented.instrument(sample_rate=7)
+
+        self.assertEqual(instrumented.process_text(self.text), plain.process_text(self.text))
+        self.assertEqual(instrumented.key_press('a'), plain.key_press('a'))
+        self.assertEqual(instrumented.get_rotor_counts(), plain.get_rotor_counts())
+
+        self.assertEqual(stats.key_presses, len(self.text) + 1)
+        self.assertEqual([sum(s) for s in stats.steps], plain.get_rotor_counts())
+        self.assertEqual(stats.samples, (len(self.text) + 1) // 7)
+        self.assertGreater(stats.throughput, 0)
+        self.assertAlmostEqual(sum(stats.stage_breakdown().values()), 1.0)
+
+    def test_swap_plugboard(self):
+        plain = self.machine()
+        instrumented = self.machine()
+        instrumented.instrument()
+        plain.plugboard = Plugboard.from_key_sheet('ab cd ef')
+        instrumented.plugboard = Plugboard.from_key_sheet('ab cd ef')
+
+        self.assertEqual(instrumented.process_text(self.text), plain.process_text(self.text))
+        self.assertEqual(instrumented.key_press('a'), plain.key_press('a'))
+
+    def test_uninstrument(self):
+        machine = self.machine()
+        machine.instrument()
+        self.assertIs(machine.copy().__class__, RuNigmaMachine)
+        machine.uninstrument()
+        self.assertIs(machine.__class__, RuNigmaMachine)
+        self.assertEqual(machine.process_text(self.text), self.machine().process_text(self.text))
+
+    def test_trace(self):
+        paths = []
+        machine = self.machine()
+        stats = machine.instrument(sample_rate=0,
+                                   trace=lambda key, positions, path: paths.append((key, path)))
+        result = machine.process_text(self.text[:500])
+
+        self.assertEqual(stats.samples, 0)
+        self.assertEqual(len(paths), 500)
+        for (key, path), lamp in zip(paths, result):
+            if len(path) == 7:
+                # a plaintext pin of the reflector
+                self.assertEqual(lamp, key)
+            else:
+                self.assertEqual(len(path), 13)
+                self.assertEqual(KEYBOARD_CHARS[path[-1]], lamp)
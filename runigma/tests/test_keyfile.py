@@ -0,0 +1,75 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the KeySheet class."""
+
+import io
+import os
+import tempfile
+import unittest
+
+from ..keyfile import KeySheet, KeyFileError, get_daily_settings
+
+SHEET = """\
+#   Day     Rotors      Rings       Plugboard    Reflector
+      1     Ь Ч Ю Г Ъ   r _ s Ч n   zy Ю0 ЪЭ     Ш
+      2     О Н З Ё Д   2 Ф u Щ n   ЭЧ ЖЪ А2     Э
+
+      3     А Б В Г Д   a a a a a                А
+"""
+
+BAD_SHEET = """\
+      1     Ь Ч Ю Г Ъ   r _ s Ч n   zy Ю0 ЪЭ     Ш
+      x     О Н З Ё Д   2 Ф u Щ n   ЭЧ ЖЪ А2     Э
+      3     А Б В Г !   a a a a a                А
+      1     А Б В Г Д   a a a a a                А
+      4     А Б В Г Д   a a a a a   ab bc        А
+"""
+
+
+class KeySheetTestCase(unittest.TestCase):
+
+    def test_lookup(self):
+        sheet = KeySheet.from_file(io.StringIO(SHEET))
+        self.assertEqual(sheet.days(), [1, 2, 3])
+        for day in sheet.days():
+            self.assertEqual(sheet.settings(day), get_daily_settings(io.StringIO(SHEET), day))
+        self.assertRaises(KeyFileError, sheet.settings, 4)
+
+    def test_machine_cached(self):
+        sheet = KeySheet.from_file(io.StringIO(SHEET))
+        first = sheet.machine(2)
+        first.set_display('Э03Нj')
+        second = sheet.machine(2)
+        self.assertEqual(second.get_display(), 'aaaaa')
+        self.assertIs(first.rotors[0].forward_table, second.rotors[0].forward_table)
+
+    def test_all_errors_reported(self):
+        with self.assertRaises(KeyFileError) as cm:
+            KeySheet.from_file(io.StringIO(BAD_SHEET))
+        self.assertEqual([n for n, _ in cm.exception.errors], [2, 3, 4, 5])
+
+    def test_mmap(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(SHEET)
+            with KeySheet.open_mmap(path) as sheet:
+                sheet.validate()
+                self.assertEqual(sheet.days(), [1, 2, 3])
+                self.assertEqual(sheet.settings(2), get_daily_settings(io.StringIO(SHEET), 2))
+        finally:
+            os.remove(path)
+
+    def test_mmap_errors(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(BAD_SHEET)
+            # only the day columns are checked when the file is opened
+            with self.assertRaises(KeyFileError) as cm:
+                KeySheet.open_mmap(path)
+            self.assertEqual(cm.exception.errors, [(2, 'invalid day'), (4, 'duplicate day 1')])
+        finally:
+            os.remove(path)
@@ -0,0 +1,56 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the parallel module."""
+
+import io
+import random
+import unittest
+
+from ..machine import RuNigmaMachine, KEYBOARD_CHARS
+from .. import parallel
+
+
+class ParallelTestCase(unittest.TestCase):
+
+    SETTINGS = dict(rotors='О Н З Ё Д',
+                    reflector='Э',
+                    ring_settings='2 Ф u Щ n',
+                    plugboard_settings='ЭЧ ЖЪ А2 ЁВ tЮ j5 k8 rb Оv en yЫ pТ 1З Бl 9Й Хc Пh gЬ da iЩ')
+
+    def test_matches_sequential(self):
+        rnd = random.Random(5)
+        text = ''.join(rnd.choice(KEYBOARD_CHARS + ' .') for _ in range(20000))
+
+        machine = RuNigmaMachine.from_key_sheet(**self.SETTINGS)
+        machine.set_display('Э03Нj')
+        expected = machine.process_text(text, replace_char=None)
+
+        other = RuNigmaMachine.from_key_sheet(**self.SETTINGS)
+        other.set_display('Э03Нj')
+        result = parallel.process_text(other, text, replace_char=None,
+                                       jobs=2, chunk_size=3000)
+
+        self.assertEqual(result, expected)
+        self.assertEqual(other.get_display(), machine.get_display())
+        self.assertEqual(other.get_rotor_counts(), machine.get_rotor_counts())
+
+        # written out a chunk at a time
+        other.set_display('Э03Нj')
+        out = io.StringIO()
+        count = parallel.process_text(other, text, replace_char=None, jobs=2,
+                                      chunk_size=1000, outfile=out)
+        self.assertEqual(out.getvalue(), expected)
+        self.assertEqual(count, len(expected))
+        self.assertEqual(other.get_display(), machine.get_display())
+
+    def test_settings_round_trip(self):
+        machine = RuNigmaMachine.from_key_sheet(**self.SETTINGS)
+        settings = machine.get_settings()
+        self.assertEqual(settings['rotors'], self.SETTINGS['rotors'])
+        self.assertEqual(settings['ring_settings'], self.SETTINGS['ring_settings'])
+        self.assertEqual(sorted(settings['plugboard_settings'].split()),
+                         sorted(str(machine.plugboard).split()))
+        self.assertEqual(RuNigmaMachine.from_key_sheet(**settings).plugboard.wiring_map,
+                         machine.plugboard.wiring_map)
@@ -0,0 +1,47 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the Plugboard class."""
+
+import random
+import unittest
+
+from ..plugboard import Plugboard, HEER_LABELS_LEN
+
+SETTINGS = 'zy Ю0 ЪЭ 6Ф ЯЫ ЙА wt lk ДР 3К'
+
+
+def random_change(rnd, plugboard):
+    """Connect or disconnect random plugs."""
+    x = rnd.randrange(HEER_LABELS_LEN)
+    if rnd.random() < 0.3:
+        plugboard.disconnect(x)
+    else:
+        plugboard.connect(x, rnd.randrange(HEER_LABELS_LEN))
+
+
+class PlugboardTestCase(unittest.TestCase):
+
+    def test_nested_context_manager(self):
+        rnd = random.Random(2)
+        plugboard = Plugboard.from_key_sheet(SETTINGS)
+        other = plugboard.copy()
+        expected = plugboard.get_wiring()
+
+        with plugboard:
+            random_change(rnd, plugboard)
+            inner = plugboard.get_wiring()
+            with plugboard:
+                random_change(rnd, plugboard)
+                with plugboard:
+                    random_change(rnd, plugboard)
+            self.assertEqual(plugboard.wiring_map, inner)
+            self.assertEqual(plugboard.get_pairs(), Plugboard(sorted(
+                (x, y) for x, y in enumerate(inner) if x < y)).get_pairs())
+            random_change(rnd, plugboard)
+        self.assertEqual(plugboard.wiring_map, expected)
+        self.assertEqual(plugboard.signal(0), expected[0])
+
+        # the copy sharing the map is left alone
+        self.assertEqual(other.wiring_map, expected)
@@ -0,0 +1,160 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the server and client modules."""
+
+import asyncio
+import io
+import random
+import unittest
+
+from ..client import Client, generate_load
+from ..keyfile import KeySheet
+from ..machine import RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS
+from ..server import RuNigmaServer, Histogram
+
+SETTINGS = dict(rotors='Ь Ч Ю Г Ъ', reflector='Ш', ring_settings='r _ s Ч n',
+                plugboard_settings='zy Ю0 ЪЭ 6Ф')
+
+SHEET = """\
+      1     О Н З Ё Д   2 Ф u Щ n   ЭЧ ЖЪ А2     Э
+"""
+
+
+def expected(settings, start, text):
+    machine = RuNigmaMachine.from_key_sheet(**settings)
+    machine.set_display(start)
+    return machine.process_text(text)
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def run_server(self, test, **kwargs):
+        """Run the coroutine function test with a started server and a
+        connected client.
+
+        """
+        async def run():
+            server = RuNigmaServer(KeySheet.from_file(io.StringIO(SHEET)), **kwargs)
+            await server.start(port=0, metrics_port=None)
+            port = server.servers[0].sockets[0].getsockname()[1]
+            client = await Client.connect(port=port)
+            try:
+                await test(server, client)
+            finally:
+                await client.close()
+                await server.close()
+
+        asyncio.run(run())
+
+    def test_process_text(self):
+        rnd = random.Random(3)
+        messages = [(''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(5)),
+                     ''.join(rnd.choice(KEYBOARD_CHARS) for _ in range(rnd.randrange(1, 300))))
+                    for _ in range(100)]
+
+        async def test(server, client):
+            results = await asyncio.gather(*(client.process_text(text, start, SETTINGS)
+                                             for start, text in messages))
+            self.assertEqual(results, [expected(SETTINGS, start, text)
+                                       for start, text in messages])
+
+            day = KeySheet.from_file(io.StringIO(SHEET)).settings(1)
+            self.assertEqual(await client.process_text('ПРИВЕТ', 'aaaaa', day=1),
+                             expected(day, 'aaaaa', 'ПРИВЕТ'))
+
+            # requests are batched and the engine is built once
+            self.assertLess(server.metrics.batch_sizes.count, len(messages))
+            self.assertEqual(server.engines.misses, 2)
+            self.assertEqual(server.metrics.requests['ok'], len(messages) + 1)
+
+            metrics = server.render_metrics()
+            self.assertIn('runigma_requests_total{status="ok"} %d' % (len(messages) + 1),
+                          metrics)
+            self.assertIn('runigma_request_seconds_count %d' % (len(messages) + 1), metrics)
+
+        self.run_server(test, large=None)
+
+    def test_errors(self):
+        async def test(server, client):
+            bad = dict(SETTINGS, rotors='Ь Ч Ю Г')
+            requests = [client.process_text('abc', 'aaaaa', bad),
+                        client.process_text('abc', '!!!!!', SETTINGS),
+                        client.process_text('abc', 'aaaaa', day=2),
+                        client.process_text('abc', 'aaaaa', SETTINGS)]
+            results = await asyncio.gather(*requests, return_exceptions=True)
+
+            for result in results[:3]:
+                self.assertIsInstance(result, RuNigmaError)
+            self.assertEqual(results[3], expected(SETTINGS, 'aaaaa', 'abc'))
+            self.assertEqual(server.metrics.requests['error'], 3)
+
+        self.run_server(test, large=None)
+
+    def test_bad_plugboard(self):
+        async def test(server, client):
+            bad = dict(SETTINGS, plugboard_settings='ab ac')
+            with self.assertRaises(RuNigmaError):
+                await asyncio.wait_for(client.process_text('abc', 'aaaaa', bad), 5)
+
+            # the server keeps answering
+            result = await asyncio.wait_for(client.process_text('abc', 'aaaaa', SETTINGS), 5)
+            self.assertEqual(result, expected(SETTINGS, 'aaaaa', 'abc'))
+            self.assertFalse(server._batcher.done())
+
+        self.run_server(test, large=None)
+
+    def test_offload(self):
+        text = 'НА_РАССВЕТЕ_АТАКА' * 10
+
+        async def test(server, client):
+            self.assertEqual(await client.process_text(text, 'vhЯkК', SETTINGS),
+                             expected(SETTINGS, 'vhЯkК', text))
+            self.assertEqual(server.metrics.offloaded, 1)
+
+        self.run_server(test, large=100, jobs=1)
+
+    def test_offload_day(self):
+        # key sheets and JSON requests give the rotors as a list
+        text = 'НА_РАССВЕТЕ_АТАКА' * 10
+        day = KeySheet.from_file(io.StringIO(SHEET)).settings(1)
+        settings = dict(SETTINGS, rotors=SETTINGS['rotors'].split())
+
+        async def test(server, client):
+            self.assertEqual(await client.process_text(text, 'vhЯkК', day=1),
+                             expected(day, 'vhЯkК', text))
+            self.assertEqual(await client.process_text(text, 'vhЯkК', settings),
+                             expected(SETTINGS, 'vhЯkК', text))
+            self.assertEqual(server.metrics.offloaded, 2)
+
+        self.run_server(test, large=100, jobs=1)
+
+    def test_close_drops_connections(self):
+        async def test(server, client):
+            self.assertEqual(await client.process_text('abc', 'aaaaa', SETTINGS),
+                             expected(SETTINGS, 'aaaaa', 'abc'))
+            await asyncio.wait_for(server.close(), 5)
+            self.assertEqual(server.metrics.connections, 0)
+            with self.assertRaises(RuNigmaError):
+                await asyncio.wait_for(client.process_text('abc', 'aaaaa', SETTINGS), 5)
+
+        self.run_server(test, large=None)
+
+    def test_generate_load(self):
+        async def test(server, client):
+            result = await generate_load([client], 50, 8, 20, keys=3, seed=1)
+            self.assertEqual(len(result['latencies']), 50)
+            self.assertEqual(result['characters'], 50 * 20)
+            self.assertEqual(result['errors'], 0)
+            self.assertEqual(server.engines.misses, 3)
+
+        self.run_server(test, large=None)
+
+    def test_histogram(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.lines('h'), ['h_bucket{le="1"} 2', 'h_bucket{le="10"} 3',
+                                                'h_bucket{le="+Inf"} 4', 'h_sum 56.5',
+                                                'h_count 4'])
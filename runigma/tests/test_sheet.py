@@ -0,0 +1,48 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the key sheet generator."""
+
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from ..keyfile import KeySheet, get_daily_settings
+from ..machine import RuNigmaMachine
+from ..sheet import write_sheets, main
+
+
+def generate(**kwargs):
+    outputs = [io.StringIO() for _ in range(kwargs.pop('sheets', 1))]
+    write_sheets(outputs, **kwargs)
+    return [f.getvalue() for f in outputs]
+
+
+class SheetTestCase(unittest.TestCase):
+
+    def test_parseable(self):
+        text, = generate()
+        sheet = KeySheet.from_file(io.StringIO(text))
+        self.assertEqual(sheet.days(), list(range(1, 367)))
+        settings = get_daily_settings(io.StringIO(text), 200)
+        self.assertEqual(settings, sheet.settings(200))
+        RuNigmaMachine.from_key_sheet(**settings)
+
+    def test_seed(self):
+        first = generate(days=1000, seed='load', sheets=2)
+        self.assertEqual(first, generate(days=1000, seed='load', sheets=2, jobs=2))
+        self.assertNotEqual(first[0], first[1])
+        self.assertNotEqual(first, generate(days=1000, seed='other', sheets=2))
+
+    def test_secure(self):
+        self.assertNotEqual(generate(days=5), generate(days=5))
+
+    def test_main_errors(self):
+        for argv in (['--sheets=2'], ['--sheets=2', '-o', 'keysheet.txt'], ['--days=367']):
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with mock.patch('sys.argv', ['runigma-sheet'] + argv), \
+                    contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                self.assertRaises(SystemExit, main)
+            self.assertEqual(stdout.getvalue(), '')
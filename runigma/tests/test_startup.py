@@ -0,0 +1,66 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the import time of the package and the command-line app."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+# the most the cumulative import of runigma.main may take, in microseconds;
+# it takes about 30 ms, most of it for argparse
+IMPORT_BUDGET = 150000
+
+# the directory the package is imported from
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# modules the command-line app only needs for some of its options
+LAZY_MODULES = ('concurrent.futures', 'multiprocessing', 'datetime', 'numpy',
+                'runigma.parallel', 'runigma.codec', 'runigma.engine')
+
+
+def import_times(statement):
+    """Run statement in a new interpreter with -X importtime and return a
+    dictionary of the cumulative import time of each module in microseconds.
+
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                            cwd=ROOT)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def test_import_main(self):
+        times = import_times('import runigma.main')
+        self.assertIn('runigma.machine', times)
+        for name in LAZY_MODULES:
+            self.assertNotIn(name, times)
+        self.assertLess(times['runigma.main'], IMPORT_BUDGET)
+
+    def test_import_package(self):
+        times = import_times('import runigma')
+        self.assertNotIn('runigma.machine', times)
+
+        times = import_times('from runigma import RuNigmaMachine')
+        self.assertIn('runigma.machine', times)
+
+    def test_named_rotors(self):
+        # only the rotors and the reflector of the machine are built
+        statement = ("from runigma import RuNigmaMachine\n"
+                     "from runigma.rotors import rotor\n"
+                     "RuNigmaMachine.from_key_sheet('Ь Ч Ю Г Ъ', reflector='Ш')\n"
+                     "RuNigmaMachine.from_key_sheet('Ь Ч Ю Г Ъ', 'a b c d e', 'Ш')\n"
+                     "print(len(rotor._WIRINGS))\n")
+        result = subprocess.run([sys.executable, '-c', statement], stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True, cwd=ROOT)
+        self.assertEqual(result.stdout.strip(), '6')
@@ -0,0 +1,54 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for RuNigmaMachine.snapshot, restore and pickling."""
+
+import pickle
+import unittest
+
+from ..machine import RuNigmaMachine
+
+SETTINGS = dict(rotors='Ь Ч Ю Г Ъ', reflector='Ш', ring_settings='r _ s Ч n',
+                plugboard_settings='zy Ю0 ЪЭ 6Ф')
+
+TEXT = 'ПРИВЕТ_ШТАБУ_ДИВИЗИИ_НА_РАССВЕТЕ_АТАКА' * 20
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = RuNigmaMachine.from_key_sheet(**SETTINGS)
+        self.machine.set_display('vhЯkК')
+        self.machine.process_text(TEXT[:100])
+
+    def test_restore(self):
+        state = self.machine.snapshot()
+        display = self.machine.get_display()
+        counts = self.machine.get_rotor_counts()
+        expected = self.machine.process_text(TEXT)
+
+        self.machine.restore(state)
+        self.assertEqual(self.machine.get_display(), display)
+        self.assertEqual(self.machine.get_rotor_counts(), counts)
+        self.assertEqual(self.machine.process_text(TEXT), expected)
+
+        # a state can be restored on a copy too
+        other = RuNigmaMachine.from_key_sheet(**SETTINGS)
+        other.restore(state)
+        self.assertEqual(other.process_text(TEXT), expected)
+        self.assertIs(other.plugboard, self.machine.plugboard)
+
+    def test_pickle(self):
+        self.machine.seek(10)
+        data = pickle.dumps(self.machine)
+        self.assertLess(len(data), 1000)
+
+        machine = pickle.loads(data)
+        self.assertEqual(machine.get_settings(), self.machine.get_settings())
+        self.assertEqual(machine.get_rotor_counts(), self.machine.get_rotor_counts())
+        self.assertEqual(machine.process_text(TEXT), self.machine.process_text(TEXT))
+
+        # seek still counts from the display last set
+        machine.seek(0)
+        self.assertEqual(machine.get_display(), 'vhЯkК')
@@ -0,0 +1,75 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""Tests for the stream module."""
+
+import io
+import random
+import unittest
+
+from ..machine import RuNigmaMachine, RuNigmaError, KEYBOARD_CHARS
+from ..stream import process_stream
+
+
+class EndlessFile:
+    """A file of endless text, that gives up after a number of reads."""
+
+    def __init__(self, text, max_reads=10000):
+        self.text = text
+        self.reads = 0
+        self.max_reads = max_reads
+
+    def read(self, size):
+        self.reads += 1
+        if self.reads > self.max_reads:
+            raise OSError("read too far")
+        return (self.text * (size // len(self.text) + 1))[:size]
+
+
+class BrokenPipe:
+
+    def write(self, text):
+        raise BrokenPipeError("broken pipe")
+
+
+class StreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = RuNigmaMachine.from_key_sheet(rotors='Ь Ч Ю Г Ъ', reflector='Ш',
+                                                     ring_settings='r _ s Ч n')
+        self.machine.set_display('vhЯkК')
+
+    def test_matches_process_text(self):
+        rnd = random.Random(6)
+        text = ''.join(rnd.choice(KEYBOARD_CHARS + '\n') for _ in range(10000))
+
+        out = io.StringIO()
+        count = process_stream(self.machine, io.StringIO(text), out, block_size=777,
+                               queue_size=2)
+        display = self.machine.get_display()
+
+        self.machine.set_display('vhЯkК')
+        expected = self.machine.process_text(text)
+        self.assertEqual(out.getvalue(), expected)
+        self.assertEqual(count, len(expected))
+        self.assertEqual(display, self.machine.get_display())
+
+    def test_error_stops_pipeline(self):
+        out = io.StringIO()
+        with self.assertRaises(RuNigmaError):
+            process_stream(self.machine, io.StringIO('abc!' * 1000), out,
+                           replace_char='!', block_size=10, queue_size=1)
+
+    def test_error_stops_reading(self):
+        # the error is raised without reading the rest of the input
+        infile = EndlessFile('abc!')
+        with self.assertRaises(RuNigmaError):
+            process_stream(self.machine, infile, io.StringIO(), replace_char='!',
+                           block_size=10, queue_size=1)
+        self.assertLess(infile.reads, 10)
+
+        infile = EndlessFile('abc')
+        with self.assertRaises(BrokenPipeError):
+            process_stream(self.machine, infile, BrokenPipe(), block_size=10, queue_size=1)
+        self.assertLess(infile.reads, 100)
@@ -0,0 +1,210 @@
+# Copyright (C) 2016-2019 by Vd.
+# This file is part of RuNigma, the RuNigma Machine.
+# RuNigma is released under the MIT License (see LICENSE).
+
+"""This module contains the VectorEngine class, a NumPy backed compiled form
+of an RuNigmaMachine for bulk processing of very long messages.
+
+Instead of pressing one key at a time, the engine computes the positions of
+all the rotors for a whole block of the message as arrays (see the stepping
+module) and then pushes every character of the block through the plugboard,
+the rotors and the reflector with array lookups.
+
+NumPy is optional. HAVE_NUMPY tells whether it is available;
+RuNigmaMachine.compile falls back to the pure Python FastEngine without it.
+
+"""
+
+try:
+    import numpy
+except ImportError:     # pragma: no cover
+    numpy = None
+
+from .machine import RuNigmaError
+from .stepping import drive_times, step_times
+
+HAVE_NUMPY = numpy is not None
+
+# number of characters processed per block; bounds the size of the
+# temporary arrays
+BLOCK_SIZE = 1 << 20
+
+
+class VectorEngine:
+    """A compiled RuNigma Machine using NumPy arrays.
+
+    The interface is the same as that of engine.FastEngine.
+
+    """
+
+    def __init__(self, machine):
+        """Compile the machine. The rotors, reflector and plugboard of the
+        machine must not be rewired while the engine is in use.
+
+        """
+        if not HAVE_NUMPY:
+            raise RuNigmaError("NumPy is not installed")
+
+        self.machine = machine
+        self.alphabet = machine.alphabet
+        rotors = machine.rotors
+        n = self.alphabet.size
+
+        self._forward = [numpy.array(r.forward_table, dtype=numpy.int16) for r in rotors]
+        self._backward = [numpy.array(r.backward_table, dtype=numpy.int16) for r in rotors]
+        self._notches = [r.notch_table for r in rotors]
+        self._plugboard = numpy.array(machine.plugboard.wiring_map, dtype=numpy.int16)
+
+        reflector = [machine.reflector.signal_in_reflector(k) for k in range(n)]
+        self._reflector = numpy.array([c for c, _ in reflector], dtype=numpy.int16)
+        self._plaintext = numpy.array([p for _, p in reflector], dtype=bool)
+
+        # maps a code point to its wire number, or -1 if not on the keyboard
+        codes = [ord(c) for c in self.alphabet.chars]
+        self._codes = numpy.array(codes, dtype=numpy.uint32)
+        self._lookup = numpy.full(max(codes) + 1, -1, dtype=numpy.int16)
+        self._lookup[codes] = numpy.arange(n, dtype=numpy.int16)
+
+        self.positions = [r.pos for r in rotors]
+        self.rotations = [r.rotations for r in rotors]
+
+    def set_positions(self, positions):
+        """Set the internal rotor positions from left to right and reset the
+        rotation counters.
+
+        """
+        if len(positions) != len(self.positions):
+            raise RuNigmaError("Incorrect number of positions")
+
+        self.positions = list(positions)
+        self.rotations = [0] * len(positions)
+
+    def store(self):
+        """Copy the rotor positions and rotation counts back to the machine."""
+
+        for rotor, pos, rotations in zip(self.machine.rotors, self.positions,
+                                         self.rotations):
+            rotor.set_position(pos, rotations)
+
+    def encode(self, text, replace_char='_'):
+        """Return the wire numbers of the characters in text as an array,
+        replacing or dropping characters not on the keyboard.
+
+        """
+        # lone surrogates are code points like any other, not on the keyboard
+        points = numpy.frombuffer(text.encode('utf-32-le', 'surrogatepass'),
+                                  dtype=numpy.uint32)
+        keys = numpy.full(len(points), -1, dtype=numpy.int16)
+        known = points < len(self._lookup)
+        keys[known] = self._lookup[points[known]]
+
+        unknown = keys < 0
+        if unknown.any():
+            if not replace_char:
+                return keys[~unknown]
+            index = self.alphabet.index
+            if replace_char not in index:
+                raise RuNigmaError('illegal key press %s' % replace_char)
+            keys[unknown] = index[replace_char]
+
+        return keys
+
+    def decode(self, keys):
+        """Return the characters for an array of wire numbers as a string."""
+
+        return self._codes[keys].tobytes().decode('utf-32-le')
+
+    def schedule(self, length):
+        """Return the positions of the rotors, from left to right, after each
+        of the next length key presses as a list of arrays, and advance the
+        engine by length key presses.
+
+        """
+        n = self.alphabet.size
+        schedule = [None] * len(self.positions)
+
+        # the right-most rotor is an arithmetic progression
+        pos = self.positions[-1]
+        schedule[-1] = (pos + 1 + numpy.arange(length)) % n
+        drives = drive_times(pos, self._notches[-1], length)
+        self.positions[-1] = (pos + length) % n
+        self.rotations[-1] += length
+
+        # the others only move on notch events
+        for i in range(len(schedule) - 2, -1, -1):
+            pos = self.positions[i]
+            self.positions[i], steps, drives = step_times(pos, self._notches[i],
+                                                          drives, length)
+            self.rotations[i] += len(steps)
+
+            if steps:
+                moves = numpy.zeros(length, dtype=numpy.int32)
+                moves[steps] = 1
+                schedule[i] = (pos + numpy.cumsum(moves)) % n
+            else:
+                schedule[i] = numpy.full(length, pos)
+
+        return schedule
+
+    def scrambler(self, length):
+        """Return the permutations applied by the rotors and the reflector,
+        without the plugboard, for each of the next length key presses, and
+        advance the engine by length key presses.
+
+        The result is a (length, n) array, for an alphabet of n letters; row
+        i maps the wire entering the right-most rotor at key press i to the
+        wire leaving it on the way back, or to -1 for a plaintext pin of the
+        reflector.
+
+        """
+        n = self.alphabet.size
+        schedule = self.schedule(length)
+
+        x = numpy.broadcast_to(numpy.arange(n, dtype=numpy.int16), (length, n))
+        for table, pos in zip(reversed(self._forward), reversed(schedule)):
+            x = table[pos[:, None] * n + x]
+
+        plaintext = self._plaintext[x]
+        x = self._reflector[x]
+
+        for table, pos in zip(self._backward, schedule):
+            x = table[pos[:, None] * n + x]
+
+        x[plaintext] = -1
+        return x
+
+    def process_keys(self, keys):
+        """Run an array or bytes-like object of wire numbers through the
+        engine and return an array of lamp numbers.
+
+        """
+        if not isinstance(keys, numpy.ndarray):
+            keys = numpy.frombuffer(keys, dtype=numpy.uint8)
+
+        n = self.alphabet.size
+        schedule = self.schedule(len(keys))
+
+        x = self._plugboard[keys]
+        for table, pos in zip(reversed(self._forward), reversed(schedule)):
+            x = table[pos * n + x]
+
+        plaintext = self._plaintext[x]
+        x = self._reflector[x]
+
+        for table, pos in zip(self._backward, schedule):
+            x = table[pos * n + x]
+
+        x = self._plugboard[x]
+        return numpy.where(plaintext, keys, x).astype(numpy.uint8)
+
+    def process_text(self, text, replace_char='_'):
+        """Run the text through the engine. The arguments and result are the
+        same as for RuNigmaMachine.process_text.
+
+        """
+        result = []
+        for start in range(0, len(text), BLOCK_SIZE):
+            keys = self.encode(text[start:start + BLOCK_SIZE], replace_char)
+            result.append(self.decode(self.process_keys(keys)))
+
+        return ''.join(result)
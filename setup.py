@@ -17,8 +17,9 @@ setuptools.setup(
     license='MIT',
     description='RuNigma is a fictional cypher machine inspired by World War 2''s Enigma Machines.',
     long_description=open(join(dirname(__file__), 'README.md')).read(),
-    packages=['runigma', 'runigma.rotors', 'runigma.tests'],
-    scripts=['runigma/bin/runigma', 'runigma/bin/runigma-sheet'],
+    packages=['runigma', 'runigma.analysis', 'runigma.rotors', 'runigma.tests'],
+    scripts=['runigma/bin/runigma', 'runigma/bin/runigma-analyze', 'runigma/bin/runigma-bench',
+             'runigma/bin/runigma-load', 'runigma/bin/runigma-server', 'runigma/bin/runigma-sheet'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Console',